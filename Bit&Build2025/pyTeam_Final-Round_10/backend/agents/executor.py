@@ -0,0 +1,156 @@
+"""
+Asset DAG Executor - Dependency-aware concurrent execution of manifest tool calls
+Each asset's generation -> moderation -> compute_embedding chain is treated as a small DAG,
+and independent assets run concurrently under a global limit plus per-tool-type limits.
+"""
+
+import asyncio
+import os
+import time
+from contextlib import AsyncExitStack
+from typing import Dict, Any, List, Callable, Awaitable, Optional
+
+from tools.telemetry import slot_wait_scope
+
+# Tools that produce an asset's content; every other tool call on the asset depends on them
+GENERATION_TOOLS = {"llm_text", "image_generate"}
+
+# Tools whose calls are coalesced into batched provider requests; they wait in the
+# batcher rather than on the provider, so they don't take a global slot
+BATCHED_TOOLS = {"compute_embedding"}
+
+# Default per-tool concurrency caps (override with TOOL_LIMIT_<TOOL> env vars)
+DEFAULT_TOOL_LIMITS = {
+    "llm_text": 8,
+    "image_generate": 2,
+    "web_search": 4,
+    "moderation": 8,
+    "compute_embedding": 100,
+    "store_asset": 4,
+}
+
+ToolCallRunner = Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[Any]]
+AssetCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+ToolCallCallback = Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[None]]
+
+
+class AssetDAGExecutor:
+    """
+    Runs the tool calls of an asset_plan as a dependency graph:
+    - Generation calls (llm_text / image_generate) of an asset run first
+    - Moderation, embedding and other calls of that asset wait for its generation calls,
+      and are skipped with a dependency_failed error when one of them fails
+    - Different assets never depend on each other and run concurrently
+    """
+
+    def __init__(
+        self,
+        run_tool_call: ToolCallRunner,
+        max_concurrency: Optional[int] = None,
+        tool_limits: Optional[Dict[str, int]] = None
+    ):
+        self.run_tool_call = run_tool_call
+        self.max_concurrency = max_concurrency or int(os.getenv("MAX_CONCURRENT_TOOL_CALLS", "8"))
+
+        self.tool_limits = dict(DEFAULT_TOOL_LIMITS)
+        for tool in self.tool_limits:
+            env_value = os.getenv(f"TOOL_LIMIT_{tool.upper()}")
+            if env_value:
+                self.tool_limits[tool] = int(env_value)
+        if tool_limits:
+            self.tool_limits.update(tool_limits)
+
+        self._global_semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._tool_semaphores = {
+            tool: asyncio.Semaphore(limit) for tool, limit in self.tool_limits.items()
+        }
+
+    def build_graph(self, asset: Dict[str, Any]) -> Dict[int, List[int]]:
+        """Map each tool_call index of an asset to the indices it depends on"""
+        tool_calls = asset.get("tool_calls", [])
+        generation_indices = [
+            i for i, call in enumerate(tool_calls) if call.get("tool") in GENERATION_TOOLS
+        ]
+
+        graph = {}
+        for i, call in enumerate(tool_calls):
+            if call.get("tool") in GENERATION_TOOLS:
+                graph[i] = []
+            else:
+                graph[i] = list(generation_indices)
+        return graph
+
+    async def run(
+        self,
+        asset_plan: List[Dict[str, Any]],
+        on_asset_done: Optional[AssetCallback] = None,
+        on_tool_call_done: Optional[ToolCallCallback] = None
+    ) -> None:
+        """
+        Execute every asset's DAG, running independent assets concurrently
+        on_tool_call_done(asset, tool_call) is awaited after each tool call, on_asset_done(asset) after each asset
+        """
+        async def run_and_report(asset: Dict[str, Any]) -> None:
+            await self.run_asset(asset, on_tool_call_done)
+            if on_asset_done is not None:
+                await on_asset_done(asset)
+        
+        await asyncio.gather(*(run_and_report(asset) for asset in asset_plan))
+
+    async def run_asset(self, asset: Dict[str, Any], on_tool_call_done: Optional[ToolCallCallback] = None) -> None:
+        """Execute a single asset's tool calls in dependency order"""
+        tool_calls = asset.get("tool_calls", [])
+        graph = self.build_graph(asset)
+
+        # Generation calls have no dependencies, so creating tasks in this
+        # order guarantees every dependency task exists before its dependents
+        order = sorted(graph, key=lambda i: len(graph[i]))
+        tasks: Dict[int, asyncio.Task] = {}
+        for i in order:
+            dependencies = [tasks[d] for d in graph[i]]
+            dependency_calls = [tool_calls[d] for d in graph[i]]
+            tasks[i] = asyncio.create_task(
+                self._run_node(asset, tool_calls[i], dependencies, dependency_calls, on_tool_call_done)
+            )
+
+        if tasks:
+            await asyncio.gather(*tasks.values())
+
+    async def _run_node(
+        self,
+        asset: Dict[str, Any],
+        tool_call_data: Dict[str, Any],
+        dependencies: List[asyncio.Task],
+        dependency_calls: List[Dict[str, Any]],
+        on_tool_call_done: Optional[ToolCallCallback] = None
+    ) -> None:
+        if dependencies:
+            await asyncio.gather(*dependencies)
+        
+        # Moderation and embedding of content that was never generated would only check an empty asset
+        failed = [call.get("tool") for call in dependency_calls if not (call.get("result") or {}).get("success")]
+        if failed:
+            message = f"Skipped because {', '.join(failed)} failed"
+            tool_call_data["result"] = {"success": False, "error": message}
+            tool_call_data["error"] = {"code": "dependency_failed", "message": message}
+            if on_tool_call_done is not None:
+                await on_tool_call_done(asset, tool_call_data)
+            return
+
+        waiting_since = time.perf_counter()
+        async with AsyncExitStack() as stack:
+            # Take the per-tool slot first so a call waiting on its tool cap
+            # never holds one of the global slots
+            tool_semaphore = self._tool_semaphores.get(tool_call_data.get("tool"))
+            if tool_semaphore is not None:
+                await stack.enter_async_context(tool_semaphore)
+            if tool_call_data.get("tool") not in BATCHED_TOOLS:
+                await stack.enter_async_context(self._global_semaphore)
+
+            # Time spent waiting for the slots is reported as the call's queue wait
+            with slot_wait_scope(time.perf_counter() - waiting_since):
+                await self.run_tool_call(asset, tool_call_data)
+        
+        # Outside the concurrency slots - a slow callback shouldn't hold up other calls
+        if on_tool_call_done is not None:
+            await on_tool_call_done(asset, tool_call_data)
@@ -0,0 +1,253 @@
+"""
+Manifest Pipeline - builds a campaign manifest from several small Gemini calls
+1. A compact strategy call - every other section is written to fit it
+2. The asset_plan sections (captions, images, reel script, blog + flyer) and the
+   influencer shortlist, requested in parallel with small response schemas
+3. Tool calls, retry policies, safety checks and the posting calendar are built
+   locally instead of being typed out by the model
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+import pytz
+
+from models.schema import CampaignManifest, CampaignStrategy, Asset, ToolCall, PostingCalendarItem, Influencer
+from models.response_schemas import AssetSection, InfluencerSection
+
+TEXT_MODEL = "gemini-2.0-flash-exp"
+TIMEZONE = "Asia/Kolkata"
+
+# Parallel asset_plan sections: asset type -> what to ask for
+ASSET_SECTIONS = {
+    "captions": {"caption": "3-5 social media captions (each caption 140 characters or less)"},
+    "images": {"image": "2-3 hero images/visuals"},
+    "scripts": {"video_script": "1 Instagram Reel script (300 tokens or less)"},
+    "long_form": {
+        "blog": "1 blog post/product description (800 tokens or less)",
+        "flyer": "1 promotional flyer design",
+    },
+}
+
+# Assets produced by image_generate; the rest are written by llm_text
+IMAGE_ASSET_TYPES = {"image", "flyer"}
+
+# Output budget for each text asset's generation call
+TEXT_MAX_TOKENS = {"caption": 150, "video_script": 400, "blog": 1000, "text": 500}
+
+
+class ManifestPipeline:
+    def __init__(self, llm_tool):
+        self.llm_tool = llm_tool
+    
+    async def generate(self, brief: str) -> CampaignManifest:
+        """Strategy first, then every section in parallel; raises if no asset section succeeds"""
+        started = time.perf_counter()
+        strategy = await self.generate_strategy(brief)
+        strategy_ms = (time.perf_counter() - started) * 1000
+        
+        section_names = list(ASSET_SECTIONS)
+        results = await asyncio.gather(
+            *(self.generate_section(brief, strategy, ASSET_SECTIONS[name]) for name in section_names),
+            self.generate_influencers(brief, strategy),
+            return_exceptions=True
+        )
+        section_results, influencers = results[:-1], results[-1]
+        
+        asset_briefs = []
+        failed_sections = []
+        for name, result in zip(section_names, section_results):
+            if isinstance(result, Exception):
+                print(f"⚠ Manifest section '{name}' failed: {result}")
+                failed_sections.append(name)
+            else:
+                asset_briefs.extend(result)
+        if not asset_briefs:
+            raise ValueError(f"Every asset section failed: {section_results[0]}")
+        if isinstance(influencers, Exception):
+            print(f"⚠ Manifest section 'influencers' failed: {influencers}")
+            failed_sections.append("influencers")
+            influencers = []
+        
+        asset_plan = self.build_asset_plan(asset_briefs)
+        metadata = {
+            "generation": {
+                "mode": "pipeline",
+                "strategy_ms": round(strategy_ms, 1),
+                "total_ms": round((time.perf_counter() - started) * 1000, 1),
+            }
+        }
+        if failed_sections:
+            metadata["generation"]["failed_sections"] = failed_sections
+        
+        return CampaignManifest(
+            campaign_id=str(uuid.uuid4()),
+            brief=brief,
+            created_at=datetime.now().isoformat(),
+            timezone=TIMEZONE,
+            strategy=strategy,
+            asset_plan=asset_plan,
+            posting_calendar=self.build_posting_calendar(asset_plan, strategy),
+            influencers=influencers,
+            metadata=metadata
+        )
+    
+    async def _generate(self, prompt: str, schema: str, temperature: float, max_tokens: int) -> Dict[str, Any]:
+        result = await self.llm_tool.agenerate_text({
+            "prompt": prompt,
+            "model": TEXT_MODEL,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "response_schema": schema
+        })
+        if not result.get("success"):
+            raise RuntimeError(result.get("error", "Generation failed"))
+        if "data" not in result:
+            raise ValueError(f"Response didn't match the {schema} schema: {result.get('schema_errors')}")
+        return result["data"]
+    
+    async def generate_strategy(self, brief: str) -> CampaignStrategy:
+        prompt = f"""You are a senior campaign strategist. Write the strategy for this campaign brief.
+
+Brief: {brief}
+
+Return JSON with:
+- core_concept: main campaign theme
+- tagline: catchy campaign slogan
+- target_audience: detailed audience description
+- key_messages: 3-5 key messages
+- tone: brand voice (e.g. "energetic", "professional", "playful")
+- channels: platforms to use (e.g. ["instagram", "facebook", "twitter"])"""
+        
+        data = await self._generate(prompt, "strategy", 0.2, 800)
+        return CampaignStrategy(**data)
+    
+    async def generate_section(self, brief: str, strategy: CampaignStrategy, wanted: Dict[str, str]) -> List[Dict[str, Any]]:
+        """Generation prompts for one slice of the asset_plan"""
+        asset_lines = "\n".join(f'- type "{asset_type}": {description}' for asset_type, description in wanted.items())
+        prompt = f"""You are planning assets for a marketing campaign.
+
+Brief: {brief}
+
+Campaign strategy:
+{json.dumps(strategy.model_dump(), indent=2)}
+
+Plan exactly these assets:
+{asset_lines}
+
+For each asset return its "type" and a "prompt": the complete, self-contained generation prompt that
+will be sent unchanged to the generator. Text prompts go to a copywriting model and must state the
+format, length, tone and the tagline or key message to use. Image prompts go to a text-to-image model
+and must describe subject, composition, style, colours and mood (no text rendering instructions)."""
+        
+        data = await self._generate(prompt, "asset_section", 0.6, 1500)
+        briefs = AssetSection(**data).assets
+        # Drop anything the section wasn't asked for so sections never overlap
+        return [asset.model_dump() for asset in briefs if asset.type in wanted]
+    
+    async def generate_influencers(self, brief: str, strategy: CampaignStrategy) -> List[Influencer]:
+        prompt = f"""Suggest 3-5 influencers who fit this campaign.
+
+Brief: {brief}
+Target audience: {strategy.target_audience}
+Channels: {", ".join(strategy.channels)}
+
+For each give name, handle, platform, followers (e.g. "120K") and engagement_rate (e.g. "4.2%")."""
+        
+        data = await self._generate(prompt, "influencer_section", 0.6, 800)
+        return InfluencerSection(**data).influencers
+    
+    def build_asset_plan(self, asset_briefs: List[Dict[str, Any]]) -> List[Asset]:
+        """Number the assets per type and attach their generation -> moderation -> embedding tool calls"""
+        counts: Dict[str, int] = {}
+        asset_plan = []
+        for asset_brief in asset_briefs:
+            asset_type = asset_brief["type"]
+            counts[asset_type] = counts.get(asset_type, 0) + 1
+            asset_id = f"{asset_type}_{counts[asset_type]}"
+            asset_plan.append(Asset(
+                id=asset_id,
+                type=asset_type,
+                prompt=asset_brief["prompt"],
+                tool_calls=self.build_tool_calls(asset_id, asset_type, asset_brief["prompt"])
+            ))
+        return asset_plan
+    
+    def build_tool_calls(self, asset_id: str, asset_type: str, prompt: str, seed: Optional[int] = None) -> List[ToolCall]:
+        if asset_type in IMAGE_ASSET_TYPES:
+            generation = ToolCall(
+                tool="image_generate",
+                id=f"{asset_id}_gen",
+                input={"provider": "huggingface", "prompt": prompt, "size": "1024x1024", "seed": seed, "n": 1},
+                expected_output_schema={"file_path": "string"},
+                safety_checks=["moderation_image"]
+            )
+            moderation_input = {"type": "image"}
+            # Images have no text content, so their alignment embedding is of the prompt
+            embedding_input = {"text": prompt}
+        else:
+            generation = ToolCall(
+                tool="llm_text",
+                id=f"{asset_id}_gen",
+                input={
+                    "prompt": prompt,
+                    "model": TEXT_MODEL,
+                    "temperature": 0.6,
+                    "max_tokens": TEXT_MAX_TOKENS.get(asset_type, TEXT_MAX_TOKENS["text"])
+                },
+                expected_output_schema={"text": "string"},
+                safety_checks=["moderation_text"]
+            )
+            # The generated content is filled in when these calls run
+            moderation_input = {"type": "text"}
+            embedding_input = {}
+        
+        return [
+            generation,
+            ToolCall(
+                tool="moderation",
+                id=f"{asset_id}_moderation",
+                input=moderation_input,
+                expected_output_schema={"moderation_passed": "boolean", "issues": "array"},
+                safety_checks=[]
+            ),
+            ToolCall(
+                tool="compute_embedding",
+                id=f"{asset_id}_embedding",
+                input=embedding_input,
+                expected_output_schema={"vector_id": "string", "dimensions": "integer"},
+                safety_checks=["alignment_threshold"]
+            ),
+        ]
+    
+    def build_posting_calendar(self, asset_plan: List[Asset], strategy: CampaignStrategy) -> List[PostingCalendarItem]:
+        """One post a day from tomorrow: each caption paired with an image, then the reel"""
+        channels = [channel.lower() for channel in strategy.channels] or ["instagram"]
+        captions = [asset.id for asset in asset_plan if asset.type == "caption"]
+        images = [asset.id for asset in asset_plan if asset.type == "image"]
+        scripts = [asset.id for asset in asset_plan if asset.type == "video_script"]
+        
+        start = datetime.now(pytz.timezone(TIMEZONE)).date() + timedelta(days=1)
+        calendar = []
+        for i, caption_id in enumerate(captions):
+            asset_ids = [caption_id] + ([images[i % len(images)]] if images else [])
+            calendar.append(PostingCalendarItem(
+                date=(start + timedelta(days=i)).isoformat(),
+                channel=channels[i % len(channels)],
+                asset_ids=asset_ids,
+                requires_approval=True
+            ))
+        
+        reel_channel = "instagram" if "instagram" in channels else channels[0]
+        for j, script_id in enumerate(scripts):
+            calendar.append(PostingCalendarItem(
+                date=(start + timedelta(days=len(captions) + j)).isoformat(),
+                channel=reel_channel,
+                asset_ids=[script_id],
+                requires_approval=True
+            ))
+        return calendar
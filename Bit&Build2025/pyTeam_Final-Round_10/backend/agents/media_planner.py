@@ -3,13 +3,13 @@ Media Planner Agent - Advanced Multi-Step Reasoning AI Agent
 Performs comprehensive media planning with platform optimization, scheduling, and influencer recommendations
 """
 
-import google.generativeai as genai
-import os
-import json
 from typing import Dict, Any, List
 from datetime import datetime, timedelta
 import pytz
 
+from tools import gemini_client
+from tools.json_extractor import extract_json
+
 class MediaPlannerAgent:
     """
     Autonomous Media Planner Agent that performs:
@@ -23,12 +23,8 @@ class MediaPlannerAgent:
     """
     
     def __init__(self):
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            raise ValueError("GOOGLE_API_KEY not found in environment variables")
-        
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        gemini_client.configure()
+        self.model = gemini_client.get_model()
         
         # Platform engagement data (best times to post)
         self.platform_engagement_times = {
@@ -178,7 +174,7 @@ Return a JSON object with this structure:
 Be data-driven and specific. Consider {location} market trends."""
 
         try:
-            response = self.model.generate_content(
+            response, _ = gemini_client.generate_with_fallback(
                 prompt,
                 generation_config={
                     "temperature": 0.3,
@@ -371,7 +367,7 @@ Return JSON array:
 Focus on {location}-based influencers. Be realistic with follower counts and rates."""
 
         try:
-            response = self.model.generate_content(
+            response, _ = gemini_client.generate_with_fallback(
                 prompt,
                 generation_config={
                     "temperature": 0.4,
@@ -494,18 +490,7 @@ Focus on {location}-based influencers. Be realistic with follower counts and rat
     
     def _extract_json(self, text: str) -> Any:
         """Extract JSON from response text"""
-        try:
-            # Try to find JSON in code blocks
-            if "```json" in text:
-                json_text = text.split("```json")[1].split("```")[0].strip()
-            elif "```" in text:
-                json_text = text.split("```")[1].split("```")[0].strip()
-            else:
-                json_text = text.strip()
-            
-            return json.loads(json_text)
-        except:
-            return None
+        return extract_json(text, expect=None)
     
     def _get_default_platform_analysis(self) -> Dict:
         """Fallback platform analysis"""
@@ -1,4 +1,4 @@
-import google.generativeai as genai
+import asyncio
 import os
 import json
 from typing import Dict, Any
@@ -6,27 +6,40 @@ from datetime import datetime
 import uuid
 import random
 
+from pydantic import ValidationError
+
 from models.schema import (
     CampaignManifestWrapper, CampaignManifest, ToolCall, Asset, AssetSafety
 )
+from models.response_schemas import ManifestResponse, ManifestSpec, gemini_schema
 from tools.llm_tool import LLMTool
 from tools.image_tool import ImageTool
 from tools.search_tool import SearchTool
 from tools.moderation_tool import ModerationTool
+from tools.embedding_store import EmbeddingStore
+from tools.checkpoint_store import CheckpointStore
+from tools.asset_store import AssetStore
+from tools import image_derivatives
+from tools import perceptual_hash
 from agents.media_planner import MediaPlannerAgent
+from agents.manifest_pipeline import ManifestPipeline
+from agents.executor import AssetDAGExecutor, GENERATION_TOOLS
+from tools.retry import run_with_retry
+from tools import gemini_client
+from tools.json_extractor import extract_json
+from tools.rate_limiter import priority_scope
 
 class CampaignOrchestrator:
     def __init__(self):
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            raise ValueError("GOOGLE_API_KEY not found in environment variables")
+        gemini_client.configure()
+        self.model = gemini_client.get_model()
         
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        # Content-addressed storage for generated images, with per-campaign references
+        self.asset_store = AssetStore()
         
         # Initialize tools
         self.llm_tool = LLMTool()
-        self.image_tool = ImageTool()
+        self.image_tool = ImageTool(self.asset_store)
         
         # Initialize search tool with error handling
         try:
@@ -42,8 +55,38 @@ class CampaignOrchestrator:
         
         self.assets_dir = os.getenv("ASSETS_DIR", "./storage/assets")
         
-    def generate_campaign_manifest(self, brief: str) -> Dict[str, Any]:
+        # Deduplicated vector store - manifests reference embeddings by vector_id
+        self.embedding_store = EmbeddingStore()
+        
+        # Dependency-aware executor for asset tool calls
+        self.executor = AssetDAGExecutor(self._run_asset_tool_call)
+        
+        # Per-tool-call results, so interrupted asset generation can be resumed
+        self.checkpoints = CheckpointStore()
+        
+        # Strategy first, then the manifest sections as parallel small calls
+        self.manifest_pipeline = ManifestPipeline(self.llm_tool)
+        self.manifest_pipeline_enabled = os.getenv("MANIFEST_PIPELINE_ENABLED", "true").lower() != "false"
+    
+    async def generate_campaign_manifest(self, brief: str) -> Dict[str, Any]:
         """Generate initial campaign manifest from brief"""
+        if not self.manifest_pipeline_enabled:
+            return await self.generate_manifest_single_call(brief)
+        
+        try:
+            manifest = await self.manifest_pipeline.generate(brief)
+            return {
+                "success": True,
+                "manifest": manifest.model_dump()
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    async def generate_manifest_single_call(self, brief: str) -> Dict[str, Any]:
+        """Generate the whole manifest in one 8192-token call (MANIFEST_PIPELINE_ENABLED=false)"""
         
         system_prompt = """You are an autonomous Campaign-Orchestrator LLM running on Gemini-2.0-flash-exp.
 
@@ -157,26 +200,6 @@ Example complete asset structure:
     }
   ],
   "metadata": {}
-}
-
-Example tool_call structure:
-{
-  "tool": "llm_text",
-  "id": "caption_1_gen",
-  "input": {
-    "prompt": "Write an Instagram caption for...",
-    "model": "gemini-2.0-flash-exp",
-    "temperature": 0.6,
-    "max_tokens": 150
-  },
-  "expected_output_schema": {
-    "text": "string"
-  },
-  "retry_policy": {
-    "max_attempts": 3,
-    "backoff": "exponential"
-  },
-  "safety_checks": ["moderation_text"]
 }"""
 
         task_prompt = f"""Brief: {brief}
@@ -184,20 +207,33 @@ Example tool_call structure:
 Generate a complete campaign manifest following all rules. Include strategy, asset_plan with tool_calls, posting_calendar, and influencer search plan."""
 
         try:
-            response = self.model.generate_content(
-                f"{system_prompt}\n\n{task_prompt}",
+            # The static system prompt goes in as system_instruction so it can be context-cached
+            response, _ = await gemini_client.agenerate_with_fallback(
+                task_prompt,
+                system_instruction=system_prompt,
                 generation_config={
                     "temperature": 0.3,
                     "max_output_tokens": 8192,
+                    # Structured output: field names and types are fixed by the schema
+                    "response_mime_type": "application/json",
+                    "response_schema": gemini_schema("campaign_manifest"),
                 }
             )
             
-            # Parse JSON response
-            json_text = response.text.strip()
-            # Remove markdown code blocks if present
-            json_text = json_text.replace('```json', '').replace('```', '').strip()
+            # Parse JSON response (repairs faults and salvages output cut off at max tokens)
+            manifest_data = extract_json(response.text)
+            if manifest_data is None:
+                raise ValueError("Manifest response contained no JSON object")
             
-            manifest_data = json.loads(json_text)
+            try:
+                spec = ManifestResponse.model_validate(manifest_data).campaign_manifest
+                return {
+                    "success": True,
+                    "manifest": self._manifest_from_spec(spec, brief).model_dump()
+                }
+            except ValidationError as e:
+                # Off-schema output (e.g. truncated) - fall back to normalizing whatever arrived
+                print(f"⚠ Manifest didn't match the response schema ({e.error_count()} errors), normalizing")
             
             # Normalize the manifest structure (handle different field names from Gemini)
             if "campaign_manifest" in manifest_data:
@@ -297,93 +333,236 @@ Generate a complete campaign manifest following all rules. Include strategy, ass
                 "error": str(e)
             }
     
-    def execute_tool_call(self, tool_call: ToolCall) -> Dict[str, Any]:
-        """Execute a single tool call with retry logic"""
-        max_attempts = tool_call.retry_policy.max_attempts
+    def _manifest_from_spec(self, spec: ManifestSpec, brief: str) -> CampaignManifest:
+        """Fill the fields the response schema leaves out (ids, timestamps, tool call defaults)"""
+        asset_plan = []
+        for asset in spec.asset_plan:
+            tool_calls = [
+                ToolCall(
+                    tool=call.tool,
+                    id=call.id,
+                    input=call.input.model_dump(exclude_none=True),
+                    expected_output_schema={},
+                    safety_checks=call.safety_checks,
+                    requires_approval=bool(call.requires_approval)
+                )
+                for call in asset.tool_calls
+            ]
+            asset_plan.append(Asset(
+                **asset.model_dump(exclude={"tool_calls"}),
+                tool_calls=tool_calls
+            ))
         
-        for attempt in range(max_attempts):
-            try:
-                if tool_call.tool == "llm_text":
-                    result = self.llm_tool.generate_text(tool_call.input)
-                elif tool_call.tool == "image_generate":
-                    result = self.image_tool.generate_image(tool_call.input)
-                elif tool_call.tool == "web_search":
-                    result = self.search_tool.web_search(tool_call.input)
-                elif tool_call.tool == "moderation":
-                    content_type = tool_call.input.get("type", "text")
-                    if content_type == "text":
-                        result = self.moderation_tool.moderate_text(tool_call.input)
-                    else:
-                        result = self.moderation_tool.moderate_image(tool_call.input)
-                elif tool_call.tool == "compute_embedding":
-                    result = self.llm_tool.compute_embedding(tool_call.input)
-                else:
-                    result = {"success": False, "error": f"Unknown tool: {tool_call.tool}"}
-                
-                if result.get("success"):
-                    return result
-                
-                # If failed and not last attempt, wait before retry
-                if attempt < max_attempts - 1:
-                    import time
-                    wait_time = 2 ** attempt if tool_call.retry_policy.backoff == "exponential" else 2
-                    time.sleep(wait_time)
-                    
-            except Exception as e:
-                if attempt == max_attempts - 1:
-                    return {"success": False, "error": str(e)}
+        return CampaignManifest(
+            campaign_id=str(uuid.uuid4()),
+            brief=brief,
+            created_at=datetime.now().isoformat(),
+            strategy=spec.strategy,
+            asset_plan=asset_plan,
+            posting_calendar=spec.posting_calendar,
+            influencers=spec.influencers
+        )
+    
+    async def execute_tool_call(self, tool_call: ToolCall) -> Dict[str, Any]:
+        """Execute a single tool call, retrying transient failures with jittered backoff"""
+        return await run_with_retry(
+            lambda: self._dispatch_tool_call(tool_call),
+            tool_call.retry_policy
+        )
         
-        return {"success": False, "error": "Max retries exceeded"}
+    async def _dispatch_tool_call(self, tool_call: ToolCall) -> Dict[str, Any]:
+        """Route a tool call to its tool - one attempt, no retries"""
+        if tool_call.tool == "llm_text":
+            return await self.llm_tool.agenerate_text(tool_call.input)
+        elif tool_call.tool == "image_generate":
+            return await self.image_tool.agenerate_image(tool_call.input)
+        elif tool_call.tool == "web_search":
+            return await self.search_tool.aweb_search(tool_call.input)
+        elif tool_call.tool == "moderation":
+            content_type = tool_call.input.get("type", "text")
+            if content_type == "text":
+                return await self.moderation_tool.amoderate_text(tool_call.input)
+            else:
+                return await self.moderation_tool.amoderate_image(tool_call.input)
+        elif tool_call.tool == "compute_embedding":
+            # Only texts the store hasn't seen are sent to the embedding model
+            return await self.embedding_store.aget_or_compute(
+                tool_call.input.get("text", ""),
+                lambda text: self.llm_tool.acompute_embedding({"text": text})
+            )
+                
+        # Unknown tools can never succeed, so don't spend retries on them
+        return {"success": False, "retryable": False, "error": f"Unknown tool: {tool_call.tool}"}
     
-    def execute_asset_generation(self, manifest: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute all tool calls for all assets in the manifest"""
+    async def execute_asset_generation(self, manifest: Dict[str, Any], on_asset_done=None) -> Dict[str, Any]:
+        """
+        Execute all tool calls for all assets in the manifest, running independent assets concurrently
+        on_asset_done(asset) is awaited as each asset's tool calls finish (progress reporting)
+        Every finished tool call is checkpointed; tool calls that already succeeded are skipped,
+        so a manifest from load_checkpoint only re-runs its missing or failed calls.
+        """
         
         asset_plan = manifest.get("asset_plan", [])
+        campaign_id = manifest.get("campaign_id", "")
         
+        # Validate every asset before any remote call is made
         for asset in asset_plan:
-            asset_obj = Asset(**asset)
-            
+            Asset(**asset)
+        
+        await asyncio.to_thread(self.checkpoints.start, manifest)
+        
+        for asset in asset_plan:
+            self._reset_checks_of_pending_generation(asset)
+        
+        done_before = {
+            (asset["id"], tool_call_data.get("id"))
+            for asset in asset_plan
+            for tool_call_data in asset.get("tool_calls", [])
+            if (tool_call_data.get("result") or {}).get("success")
+        }
+        
+        async def checkpoint(asset: Dict[str, Any], tool_call_data: Dict[str, Any]) -> None:
+            if (asset["id"], tool_call_data.get("id")) in done_before:
+                return
+            sha256 = (tool_call_data.get("result") or {}).get("sha256")
+            if sha256:
+                # Referenced right away, so GC can't take an image before the campaign is saved
+                await asyncio.to_thread(self.asset_store.add_ref, sha256, AssetStore.campaign_owner(campaign_id))
+            await asyncio.to_thread(self.checkpoints.record, campaign_id, asset, tool_call_data)
+        
+        await self.executor.run(asset_plan, on_asset_done, checkpoint)
+        await asyncio.to_thread(self.link_asset_embeddings, manifest)
+        
+        manifest["status"] = "ready"
+        return manifest
+    
+    def _reset_checks_of_pending_generation(self, asset: Dict[str, Any]) -> None:
+        """
+        A generation call that runs again produces new content, so moderation and embedding
+        results from an earlier attempt (which saw its failed or missing output) are dropped
+        and run again on the new content.
+        """
+        tool_calls = asset.get("tool_calls", [])
+        if all(
+            (tool_call_data.get("result") or {}).get("success")
+            for tool_call_data in tool_calls
+            if tool_call_data.get("tool") in GENERATION_TOOLS
+        ):
+            return
+        for tool_call_data in tool_calls:
+            if tool_call_data.get("tool") in ["moderation", "compute_embedding"]:
+                tool_call_data["result"] = None
+                tool_call_data.pop("error", None)
+    
+    def load_checkpoint(self, campaign_id: str) -> Dict[str, Any]:
+        """Checkpointed manifest of an interrupted campaign (None if there is none) - pass it to execute_asset_generation"""
+        return self.checkpoints.load(campaign_id)
+    
+    def link_asset_embeddings(self, manifest: Dict[str, Any], asset_ids=None) -> None:
+        """Register the manifest's asset vectors with the embedding store for similarity queries"""
+        links = []
+        for asset in manifest.get("asset_plan", []):
+            if asset_ids is not None and asset["id"] not in asset_ids:
+                continue
             for tool_call_data in asset.get("tool_calls", []):
-                tool_call = ToolCall(**tool_call_data)
-                
-                # Execute tool call
-                result = self.execute_tool_call(tool_call)
-                
-                # Store result
-                tool_call_data["result"] = result
-                
-                if not result.get("success"):
-                    tool_call_data["error"] = {
-                        "code": "execution_failed",
-                        "message": result.get("error", "Unknown error")
-                    }
-                
-                # Update asset based on tool type
-                if tool_call.tool == "llm_text" and result.get("success"):
-                    asset["content"] = result.get("text")
-                    asset["model"] = result.get("model")
+                result = tool_call_data.get("result") or {}
+                if tool_call_data.get("tool") == "compute_embedding" and result.get("vector_id"):
+                    links.append({
+                        "asset_id": asset["id"],
+                        "vector_id": result["vector_id"],
+                        "asset_type": asset.get("type")
+                    })
+        
+        if links:
+            self.embedding_store.link_assets(manifest.get("campaign_id", ""), links)
+    
+    def compact_embeddings(self, manifest: Dict[str, Any]) -> bool:
+        """
+        Move inline embedding vectors of older manifests into the embedding store,
+        leaving only their vector_id. Returns True if the manifest changed.
+        """
+        changed = False
+        for asset in manifest.get("asset_plan", []):
+            for tool_call_data in asset.get("tool_calls", []):
+                result = tool_call_data.get("result") or {}
+                embedding = result.get("embedding")
+                if tool_call_data.get("tool") != "compute_embedding" or not isinstance(embedding, list):
+                    continue
                 
-                elif tool_call.tool == "image_generate" and result.get("success"):
-                    # Save image
-                    image_data = result.get("image_data")
-                    if image_data:
-                        file_path = self.image_tool.save_image(
-                            image_data, 
-                            asset["id"], 
-                            self.assets_dir
-                        )
-                        asset["url"] = file_path
-                        asset["provider"] = result.get("provider")
-                        asset["model"] = result.get("model")
+                text = (tool_call_data.get("input") or {}).get("text") or json.dumps(embedding)
+                vector_id = self.embedding_store.make_id(text)
+                self.embedding_store.put(vector_id, embedding)
                 
-                elif tool_call.tool == "moderation" and result.get("success"):
-                    asset["safety"]["moderation_passed"] = result.get("moderation_passed", True)
-                    asset["safety"]["issues"] = result.get("issues", [])
+                compacted = {k: v for k, v in result.items() if k != "embedding"}
+                compacted.update({"vector_id": vector_id, "dimensions": len(embedding)})
+                tool_call_data["result"] = compacted
+                changed = True
         
-        manifest["status"] = "ready"
-        return manifest
+        if changed:
+            self.link_asset_embeddings(manifest)
+        return changed
     
-    def regenerate_asset(self, manifest: Dict[str, Any], asset_id: str, modify_instructions: str = None) -> Dict[str, Any]:
+    def _tool_call_input(self, asset: Dict[str, Any], tool_call_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Input for one run of an asset's tool call. Moderation and embedding run after
+        generation, so they get the asset's current content; the stored input is left as planned.
+        """
+        tool_input = dict(tool_call_data.get("input") or {})
+        if tool_call_data.get("tool") in ["moderation", "compute_embedding"] and asset.get("content"):
+            if tool_input.get("type", "text") == "text":
+                tool_input["text"] = asset["content"]
+        return tool_input
+    
+    async def _run_asset_tool_call(self, asset: Dict[str, Any], tool_call_data: Dict[str, Any]) -> None:
+        """Execute one tool call of an asset and fold its result back into the asset"""
+        if (tool_call_data.get("result") or {}).get("success"):
+            # Already done by an earlier, checkpointed run
+            return
+        
+        try:
+            tool_call = ToolCall(**{**tool_call_data, "input": self._tool_call_input(asset, tool_call_data)})
+            
+            # Execute tool call
+            result = await self.execute_tool_call(tool_call)
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+            tool_call = None
+        
+        # Store result
+        tool_call_data["result"] = result
+        
+        if not result.get("success"):
+            tool_call_data["error"] = {
+                "code": "execution_failed",
+                "message": result.get("error", "Unknown error")
+            }
+            return
+        tool_call_data.pop("error", None)
+        
+        # Update asset based on tool type
+        if tool_call.tool == "llm_text":
+            asset["content"] = result.get("text")
+            asset["model"] = result.get("model")
+        
+        elif tool_call.tool == "image_generate":
+            # The image tool already streamed the image into the assets directory
+            file_path = result.get("file_path")
+            if file_path:
+                asset["url"] = file_path
+                asset.setdefault("metadata", {})["derivatives"] = await self.image_derivative_urls(file_path)
+                asset["provider"] = result.get("provider")
+                asset["model"] = result.get("model")
+        
+        elif tool_call.tool == "moderation":
+            asset["safety"]["moderation_passed"] = result.get("moderation_passed", True)
+            asset["safety"]["issues"] = result.get("issues", [])
+    
+    async def image_derivative_urls(self, file_path: str) -> Dict[str, str]:
+        """Render the thumbnail and medium sizes of a stored image; returns their URL paths"""
+        derivatives = await image_derivatives.agenerate_derivatives(file_path)
+        return {name: self.asset_store.url_for(derivative["path"]) for name, derivative in derivatives.items()}
+    
+    async def regenerate_asset(self, manifest: Dict[str, Any], asset_id: str, modify_instructions: str = None) -> Dict[str, Any]:
         """Regenerate a specific asset"""
         
         asset_plan = manifest.get("asset_plan", [])
@@ -411,28 +590,45 @@ Generate a complete campaign manifest following all rules. Include strategy, ass
                     original_prompt = tool_call["input"]["prompt"]
                     tool_call["input"]["prompt"] = f"{original_prompt}\n\nModification: {modify_instructions}"
         
+        # A re-roll that looks just like the current image is generated again. Any asset with an
+        # image_generate call counts (flyers too), and its full-size blob is hashed - the same
+        # rendition the new candidates are compared at
+        previous_image = None
+        for tool_call_data in target_asset.get("tool_calls", []):
+            if tool_call_data.get("tool") == "image_generate":
+                previous_result = tool_call_data.get("result") or {}
+                previous_image = self.asset_store.local_path(previous_result.get("file_path") or target_asset.get("url"))
+                break
+        previous_hashes = None
+        if previous_image is not None and previous_image.exists():
+            previous_hashes = await asyncio.to_thread(perceptual_hash.hash_file, previous_image)
+        
         # Re-execute tool calls for this asset
         for tool_call_data in target_asset.get("tool_calls", []):
-            tool_call = ToolCall(**tool_call_data)
-            result = self.execute_tool_call(tool_call)
+            tool_call = ToolCall(**{**tool_call_data, "input": self._tool_call_input(target_asset, tool_call_data)})
+            if tool_call.tool == "image_generate" and previous_hashes:
+                tool_call.input = {**tool_call.input, "avoid_phashes": [previous_hashes["phash"]]}
+            result = await self.execute_tool_call(tool_call)
             
             tool_call_data["result"] = result
             
             if tool_call.tool == "llm_text" and result.get("success"):
                 target_asset["content"] = result.get("text")
             elif tool_call.tool == "image_generate" and result.get("success"):
-                image_data = result.get("image_data")
-                if image_data:
-                    file_path = self.image_tool.save_image(
-                        image_data, 
-                        f"{asset_id}_v{target_asset['version']}", 
-                        self.assets_dir
+                if result.get("file_path"):
+                    target_asset["url"] = result["file_path"]
+                    target_asset.setdefault("metadata", {})["derivatives"] = await self.image_derivative_urls(result["file_path"])
+                    await asyncio.to_thread(
+                        self.asset_store.add_ref,
+                        result["sha256"],
+                        AssetStore.campaign_owner(manifest.get("campaign_id", ""))
                     )
-                    target_asset["url"] = file_path
+        
+        await asyncio.to_thread(self.link_asset_embeddings, manifest, {asset_id})
         
         return {"success": True, "manifest": manifest}
     
-    def generate_media_plan(self, manifest: Dict[str, Any]) -> Dict[str, Any]:
+    async def generate_media_plan(self, manifest: Dict[str, Any]) -> Dict[str, Any]:
         """Generate comprehensive media plan for the campaign"""
         try:
             print("🎯 Media Planner Agent: Starting media plan generation...")
@@ -447,7 +643,10 @@ Generate a complete campaign manifest following all rules. Include strategy, ass
             }
             
             # Generate media plan
-            media_plan = self.media_planner.create_media_plan(campaign_data)
+            # The media planner makes blocking Gemini calls, so keep it off the event loop.
+            # Its calls are background work for the rate governor (the thread inherits the scope)
+            with priority_scope("background"):
+                media_plan = await asyncio.to_thread(self.media_planner.create_media_plan, campaign_data)
             
             # Add media plan to manifest
             manifest["media_plan"] = media_plan
@@ -1,12 +1,14 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, UploadFile, File, WebSocket, WebSocketDisconnect, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse
 from dotenv import load_dotenv
 import os
 import json
 import re
+import asyncio
 import shutil
+import time
 from pathlib import Path
 from datetime import datetime, timedelta
 import uuid
@@ -14,10 +16,24 @@ import hashlib
 import secrets
 from io import BytesIO
 import zipfile
-from typing import Dict, List
+from typing import Dict, List, Optional
 
-from models.schema import BriefRequest, RegenerateRequest, CampaignManifest, LocationTrendsRequest, RegisterRequest, LoginRequest
+from models.schema import BriefRequest, RegenerateRequest, CampaignManifest, LocationTrendsRequest, RegisterRequest, LoginRequest, SimilarAssetsRequest
 from agents.orchestrator import CampaignOrchestrator
+from tools.semantic_cache import SemanticCache
+from tools.json_stream import IncrementalJSONParser
+from tools.json_extractor import extract_json
+from models.response_schemas import field_error
+from tools.rate_limiter import priority_scope, get_governor
+from tools.prompt_budget import format_search_results, endpoint_scope, token_ledger
+from tools.template_responder import TemplateResponder
+from tools.job_queue import JobQueue, IdempotencyConflict
+from tools.telemetry import telemetry, run_scope
+from tools.asset_store import AssetStore
+from tools import image_derivatives
+from tools.perceptual_hash import PerceptualIndex, PHASH_MAX_DISTANCE
+from tools import metrics
+from tools import gemini_client
 
 # Load environment variables from parent directory or current directory
 env_path = Path(__file__).parent.parent / '.env'
@@ -54,6 +70,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Agent endpoints are interactive - their Gemini calls go ahead of background work
+INTERACTIVE_PATHS = ("/api/agents/", "/api/analyze-location-trends", "/api/generate-campaign-report")
+
+def route_path(request, unmatched: Optional[str] = None) -> str:
+    """
+    The matched route's path template (e.g. /api/campaigns/{campaign_id}) for per-endpoint stats
+    Read from the scope the router fills in, so requests aren't routed a second time here
+    """
+    route = request.scope.get("route")
+    if route is not None:
+        return route.path
+    # Mounted apps (static files) have no route; the router records the mount prefix in root_path
+    mount = request.scope.get("root_path", "")[len(request.scope.get("app_root_path", "")):]
+    return mount or unmatched or request.url.path
+
+@app.middleware("http")
+async def gemini_priority_middleware(request, call_next):
+    # Token usage of the Gemini calls made while serving the request is booked to its route,
+    # tool call telemetry also to the workflow run the frontend sends as X-Workflow-Run-Id.
+    # Request latency is timed here too rather than in another middleware layer
+    started = time.perf_counter()
+    status = 500
+    try:
+        # Resolved lazily - the route is only known once the router has matched the request
+        with endpoint_scope(lambda: route_path(request)), run_scope(request.headers.get("X-Workflow-Run-Id")):
+            if request.url.path.startswith(INTERACTIVE_PATHS):
+                with priority_scope("interactive"):
+                    response = await call_next(request)
+            else:
+                response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Unmatched paths share one label so random URLs can't grow the series count
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started, request.method, route_path(request, unmatched="unmatched"), str(status)
+        )
+
 # WebSocket connection manager for collaborative editing
 class CollaborationManager:
     def __init__(self):
@@ -97,6 +151,7 @@ class CollaborationManager:
     
     async def broadcast(self, workflow_id: str, message: dict, exclude_websocket: WebSocket = None):
         if workflow_id in self.active_connections:
+            started = time.perf_counter()
             dead_connections = []
             sent_count = 0
             for connection in self.active_connections[workflow_id]:
@@ -107,6 +162,8 @@ class CollaborationManager:
                     except:
                         dead_connections.append(connection)
             
+            metrics.WS_BROADCAST_SECONDS.observe(time.perf_counter() - started, str(message.get("type")))
+            metrics.WS_MESSAGES_SENT.inc(str(message.get("type")), amount=sent_count)
             print(f"📡 Broadcast {message.get('type')} to {sent_count} users in workflow {workflow_id}")
             
             # Clean up dead connections
@@ -131,6 +188,162 @@ collaboration_manager = CollaborationManager()
 # Initialize orchestrator
 orchestrator = CampaignOrchestrator()
 
+# Last-resort agent outputs when every Gemini model is down
+template_responder = TemplateResponder(orchestrator.media_planner)
+
+# Durable background jobs (SQLite) for long-running campaign generation
+job_queue = JobQueue()
+
+# Cached perceptual hashes of storage/assets for the near-duplicate report
+perceptual_index = PerceptualIndex()
+
+# Semantic cache for near-duplicate agent inputs (opt-in)
+async def embed_for_semantic_cache(text: str):
+    result = await orchestrator.llm_tool.acompute_embedding({"text": text})
+    return result.get("embedding") if result.get("success") else None
+
+semantic_cache = SemanticCache(
+    embed_for_semantic_cache,
+    namespace_ttls={"strategy": 24 * 3600, "research": 6 * 3600, "location_trends": 6 * 3600}
+)
+
+async def semantic_cache_lookup(namespace: str, text, requested=None):
+    """Return (output, similarity) for a near-duplicate input when the semantic cache is on"""
+    if not text or not semantic_cache.is_enabled(requested):
+        return None
+    return await semantic_cache.lookup(namespace, str(text))
+
+async def semantic_cache_store(namespace: str, text, output: dict, requested=None):
+    if text and semantic_cache.is_enabled(requested):
+        await semantic_cache.store(namespace, str(text), output)
+
+# Agent prompts - shared by the JSON endpoints and their /stream variants
+def strategy_request(user_input) -> dict:
+    prompt = f"""As a brand strategy expert, analyze this brief and create a strategic foundation:
+
+Brief: {user_input}
+
+Provide a strategic analysis including:
+1. Core campaign concept
+2. A compelling tagline
+3. Target audience definition
+4. 3-5 key messages
+5. Brand tone recommendation
+6. Recommended channels
+
+Return as JSON with keys: core_concept, tagline, target_audience, key_messages (array), tone, channels (array)"""
+    
+    return {
+        "prompt": prompt,
+        "model": "gemini-2.0-flash-exp",
+        "temperature": 0.3,
+        "max_tokens": 800,
+        "response_schema": "strategy"
+    }
+
+def copywriting_request(user_input) -> dict:
+    prompt = f"""As a creative copywriter, create engaging social media content:
+
+Context: {user_input}
+
+Generate:
+1. 3 compelling social media captions (under 140 characters each)
+2. A clear call-to-action
+3. Relevant hashtags
+
+Return as JSON with keys: captions (array of 3 strings), cta (string), hashtags (string)"""
+    
+    return {
+        "prompt": prompt,
+        "model": "gemini-2.0-flash-exp",
+        "temperature": 0.7,
+        "max_tokens": 500,
+        "response_schema": "copywriting"
+    }
+
+def research_request(user_input, results=None) -> dict:
+    """Research prompt - summarizes web search results when there are any"""
+    if results is None:
+        prompt = f"""As a market research analyst, provide insights about: {user_input}
+
+Provide:
+1. Key market trends (3-5 points)
+2. Target audience insights
+3. Competitive landscape
+4. Opportunities
+
+Return as JSON with keys: trends (array), audience_insights (string), competitive_landscape (string), opportunities (array)"""
+    else:
+        prompt = f"""As a market research analyst, analyze these search results about: {user_input}
+
+Search Results:
+{format_search_results(results)}
+
+Provide:
+1. Key market trends (3-5 points)
+2. Target audience insights
+3. Competitive landscape
+4. Opportunities
+
+Return as JSON with keys: trends (array), audience_insights (string), competitive_landscape (string), opportunities (array)"""
+    
+    return {
+        "prompt": prompt,
+        "model": "gemini-2.0-flash-exp",
+        "temperature": 0.3,
+        "max_tokens": 600,
+        "response_schema": "research"
+    }
+
+# Server-sent events for streaming agent endpoints
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_llm_events(chunks, parser: IncrementalJSONParser, schema: str = None):
+    """
+    Relay text chunks as 'delta' events and every top-level JSON field as a 'field'
+    event the moment its value closes. The parser keeps the full text and final object.
+    With a response schema each field is validated as it closes; a field that doesn't
+    fit is sent as a 'field_error' event instead.
+    """
+    async for text in chunks:
+        yield sse_event("delta", {"text": text})
+        for key, value in parser.feed(text):
+            error = field_error(schema, key, value) if schema else None
+            if error:
+                yield sse_event("field_error", {"key": key, "error": error})
+            else:
+                yield sse_event("field", {"key": key, "value": value})
+
+async def stream_agent_response(tool_input: dict, build_output, fallback_output=None):
+    """
+    SSE body for a streamed agent call: 'delta' and 'field' events while Gemini generates,
+    then one 'done' event whose output comes from build_output(parsed_json_or_None, full_text).
+    If Gemini is unavailable before anything was produced, fallback_output() (a template) is sent instead.
+    """
+    parser = IncrementalJSONParser()
+    try:
+        async for event in stream_llm_events(
+            orchestrator.llm_tool.astream_text(tool_input), parser, tool_input.get("response_schema")
+        ):
+            yield event
+    except Exception as e:
+        if fallback_output is not None and not parser.buffer and gemini_client.is_unavailable(e):
+            print(f"⚠ Streaming agent falling back to template: {e}")
+            yield sse_event("done", {"success": True, "output": fallback_output(), "fallback": "template"})
+        else:
+            yield sse_event("error", {"success": False, "error": str(e)})
+        return
+    
+    # A reply cut off mid-object never closes for the streaming parser - salvage what arrived
+    parsed = parser.result()
+    if parsed is None:
+        parsed = extract_json(parser.buffer)
+    output = await build_output(parsed, parser.buffer)
+    yield sse_event("done", {"success": True, "output": output})
+
 # Storage setup
 STORAGE_DIR = Path("./storage")
 ASSETS_DIR = STORAGE_DIR / "assets"
@@ -150,6 +363,17 @@ USERS_DIR.mkdir(exist_ok=True)
 INVITES_DIR = STORAGE_DIR / "invites"
 INVITES_DIR.mkdir(exist_ok=True)
 
+# JSON file stores (campaigns, users, invites, marketplace) - timed for /metrics
+def read_json(path: Path, store: str):
+    with metrics.STORAGE_SECONDS.time(store, "read"):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+def write_json(path: Path, data, store: str, ensure_ascii: bool = True) -> None:
+    with metrics.STORAGE_SECONDS.time(store, "write"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=ensure_ascii)
+
 # Helper function to convert file paths to URLs
 def convert_asset_paths_to_urls(manifest: dict) -> dict:
     """Convert local file paths in assets to HTTP URLs"""
@@ -160,8 +384,16 @@ def convert_asset_paths_to_urls(manifest: dict) -> dict:
     # Convert asset URLs
     for asset in manifest.get("asset_plan", []):
         if asset.get("url") and isinstance(asset["url"], str):
+            blob = AssetStore.parse(asset["url"])
+            if blob:
+                # Content-addressed blob - its URL is the immutable hash path
+                asset["url"] = f"{base_url}{AssetStore.url_path(*blob)}"
+                derivatives = (asset.get("metadata") or {}).get("derivatives") or {}
+                for name, url in derivatives.items():
+                    if url.startswith("/"):
+                        derivatives[name] = f"{base_url}{url}"
             # If it's a file path, convert to URL
-            if not asset["url"].startswith("http"):
+            elif not asset["url"].startswith("http"):
                 asset_path = Path(asset["url"])
                 if asset_path.exists():
                     # Get just the filename
@@ -170,6 +402,14 @@ def convert_asset_paths_to_urls(manifest: dict) -> dict:
     
     return manifest
 
+def sync_campaign_asset_refs(manifest: dict) -> None:
+    """The campaign references exactly the blobs its assets point at - replaced versions become collectable"""
+    blobs = [AssetStore.parse(asset.get("url")) for asset in manifest.get("asset_plan", [])]
+    orchestrator.asset_store.set_refs(
+        AssetStore.campaign_owner(manifest["campaign_id"]),
+        [blob[0] for blob in blobs if blob]
+    )
+
 # ============================================
 # Authentication Endpoints
 # ============================================
@@ -221,8 +461,7 @@ async def register(request: RegisterRequest):
         }
         
         print(f"Creating user file: {user_file}")
-        with open(user_file, "w") as f:
-            json.dump(user_data, f, indent=2)
+        write_json(user_file, user_data, "users")
         
         print(f"Registration successful: {email}")
         return {
@@ -260,8 +499,7 @@ async def login(request: LoginRequest):
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
         print(f"Found user file: {user_file}")
-        with open(user_file, "r") as f:
-            user_data = json.load(f)
+        user_data = read_json(user_file, "users")
         
         # Verify password
         if user_data["password_hash"] != hash_password(password):
@@ -298,42 +536,25 @@ async def run_strategy_agent(request: dict):
     try:
         user_input = request.get("input", "")
         
-        prompt = f"""As a brand strategy expert, analyze this brief and create a strategic foundation:
-
-Brief: {user_input}
-
-Provide a strategic analysis including:
-1. Core campaign concept
-2. A compelling tagline
-3. Target audience definition
-4. 3-5 key messages
-5. Brand tone recommendation
-6. Recommended channels
-
-Return as JSON with keys: core_concept, tagline, target_audience, key_messages (array), tone, channels (array)"""
-
-        result = orchestrator.llm_tool.generate_text({
-            "prompt": prompt,
-            "model": "gemini-2.0-flash-exp",
-            "temperature": 0.3,
-            "max_tokens": 800
-        })
+        cached = await semantic_cache_lookup("strategy", user_input, request.get("semantic_cache"))
+        if cached:
+            output, similarity = cached
+            return {"success": True, "output": output, "semantic_cache": {"hit": True, "similarity": round(similarity, 4)}}
+        
+        result = await orchestrator.llm_tool.agenerate_text(strategy_request(user_input))
         
         if result.get("success"):
             # Parse the response
-            try:
-                content = result.get("text", "")
-                # Try to extract JSON from markdown code blocks
-                if "```json" in content:
-                    content = content.split("```json")[1].split("```")[0].strip()
-                elif "```" in content:
-                    content = content.split("```")[1].split("```")[0].strip()
-                
-                strategy_data = json.loads(content)
+            strategy_data = result.get("data") or extract_json(result.get("text", ""))
+            if strategy_data is not None:
+                await semantic_cache_store("strategy", user_input, strategy_data, request.get("semantic_cache"))
                 return {"success": True, "output": strategy_data}
-            except:
-                # If parsing fails, return raw text
-                return {"success": True, "output": {"raw_output": result.get("text")}}
+            # If parsing fails, return raw text
+            return {"success": True, "output": {"raw_output": result.get("text")}}
+        elif gemini_client.is_unavailable(result):
+            # Every model in the fallback chain is down - answer from templates instead of a 500
+            print(f"⚠ Strategy agent falling back to template: {result.get('error')}")
+            return {"success": True, "output": template_responder.strategy(user_input), "fallback": "template"}
         else:
             raise HTTPException(status_code=500, detail=result.get("error"))
             
@@ -341,42 +562,48 @@ Return as JSON with keys: core_concept, tagline, target_audience, key_messages (
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/agents/strategy/stream")
+async def stream_strategy_agent(request: dict):
+    """Execute Strategy Agent, streaming partial output as server-sent events"""
+    user_input = request.get("input", "")
+    
+    async def build_output(strategy_data, text):
+        if strategy_data is None:
+            return {"raw_output": text}
+        await semantic_cache_store("strategy", user_input, strategy_data, request.get("semantic_cache"))
+        return strategy_data
+    
+    async def events():
+        cached = await semantic_cache_lookup("strategy", user_input, request.get("semantic_cache"))
+        if cached:
+            output, similarity = cached
+            yield sse_event("done", {"success": True, "output": output, "semantic_cache": {"hit": True, "similarity": round(similarity, 4)}})
+            return
+        
+        async for event in stream_agent_response(
+            strategy_request(user_input), build_output, lambda: template_responder.strategy(user_input)
+        ):
+            yield event
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 @app.post("/api/agents/copywriting")
 async def run_copywriting_agent(request: dict):
     """Execute Copywriting Agent"""
     try:
         user_input = request.get("input", "")
         
-        prompt = f"""As a creative copywriter, create engaging social media content:
-
-Context: {user_input}
-
-Generate:
-1. 3 compelling social media captions (under 140 characters each)
-2. A clear call-to-action
-3. Relevant hashtags
-
-Return as JSON with keys: captions (array of 3 strings), cta (string), hashtags (string)"""
-
-        result = orchestrator.llm_tool.generate_text({
-            "prompt": prompt,
-            "model": "gemini-2.0-flash-exp",
-            "temperature": 0.7,
-            "max_tokens": 500
-        })
+        result = await orchestrator.llm_tool.agenerate_text(copywriting_request(user_input))
         
         if result.get("success"):
-            try:
-                content = result.get("text", "")
-                if "```json" in content:
-                    content = content.split("```json")[1].split("```")[0].strip()
-                elif "```" in content:
-                    content = content.split("```")[1].split("```")[0].strip()
-                
-                copy_data = json.loads(content)
+            copy_data = result.get("data") or extract_json(result.get("text", ""))
+            if copy_data is not None:
                 return {"success": True, "output": copy_data}
-            except:
-                return {"success": True, "output": {"raw_output": result.get("text")}}
+            return {"success": True, "output": {"raw_output": result.get("text")}}
+        elif gemini_client.is_unavailable(result):
+            print(f"⚠ Copywriting agent falling back to template: {result.get('error')}")
+            return {"success": True, "output": template_responder.copywriting(user_input), "fallback": "template"}
         else:
             raise HTTPException(status_code=500, detail=result.get("error"))
             
@@ -384,11 +611,37 @@ Return as JSON with keys: captions (array of 3 strings), cta (string), hashtags
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/agents/copywriting/stream")
+async def stream_copywriting_agent(request: dict):
+    """Execute Copywriting Agent, streaming partial output as server-sent events"""
+    user_input = request.get("input", "")
+    
+    async def build_output(copy_data, text):
+        return copy_data if copy_data is not None else {"raw_output": text}
+    
+    return StreamingResponse(
+        stream_agent_response(
+            copywriting_request(user_input), build_output, lambda: template_responder.copywriting(user_input)
+        ),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
 @app.post("/api/agents/visual")
 async def run_visual_agent(request: dict):
-    """Execute Visual Design Agent - Generate Images"""
+    """
+    Execute Visual Design Agent - Generate Images
+    With "workflow_id" and "node_id" the images are referenced by that workflow node and
+    replace the node's previous ones (which become collectable by the asset GC);
+    without them they are kept under the shared "visual" owner.
+    """
     try:
         user_input = request.get("input", "")
+        if request.get("workflow_id") and request.get("node_id"):
+            owner = AssetStore.node_owner(request["workflow_id"], request["node_id"])
+        else:
+            owner = "visual"
         
         # Create a prompt for image generation
         image_prompt = f"Professional marketing visual: {user_input}. High quality, modern, clean design, commercial photography style"
@@ -396,43 +649,53 @@ async def run_visual_agent(request: dict):
         print(f"\n🎨 Visual Agent - Generating images for: {user_input}")
         print(f"📝 Image prompt: {image_prompt}")
         
-        # Generate 3 image variations
+        # Generate 3 image variations - one call, the variants are generated concurrently
+        print(f"🖼️ Generating 3 image variants...")
+        result = await orchestrator.image_tool.agenerate_image({
+            "prompt": image_prompt,
+            "size": "1024x1024",
+            "seed": None,
+            "n": 3
+        })
+        
         images = []
-        for i in range(3):
-            print(f"🖼️ Generating image {i+1}/3...")
-            result = orchestrator.image_tool.generate_image({
-                "prompt": image_prompt,
-                "size": "1024x1024",
-                "seed": None,
-                "n": 1
-            })
-            
-            if result.get("success"):
-                # Save image and get URL
-                image_id = f"img_{uuid.uuid4().hex[:8]}"
-                image_data = result.get("image_data")
+        if result.get("success"):
+            variants = result.get("variants") or [result]
+            hashes = [variant["sha256"] for variant in variants]
+            if owner == "visual":
+                for sha256 in hashes:
+                    await asyncio.to_thread(orchestrator.asset_store.add_ref, sha256, owner)
+            else:
+                await asyncio.to_thread(orchestrator.asset_store.set_refs, owner, hashes)
                 
-                # Save to file
-                image_path = ASSETS_DIR / f"{image_id}.png"
-                import base64
-                with open(image_path, "wb") as f:
-                    f.write(base64.b64decode(image_data))
+            # Thumbnail and medium sizes, rendered in the process pool
+            derivatives = await asyncio.gather(*(
+                orchestrator.image_derivative_urls(variant["file_path"]) for variant in variants
+            ))
+            
+            for i, variant in enumerate(variants):
+                # The image tool streamed the image straight into the asset store
+                image_id = f"img_{variant['sha256'][:16]}"
                 
-                print(f"✅ Image saved: {image_path}")
+                print(f"✅ Image saved: {variant['file_path']}")
                 
                 # Create URL - use HOST and PORT from env
                 host = os.getenv("HOST", "localhost")
                 port = os.getenv("PORT", "8000")
-                image_url = f"http://{host}:{port}/assets/{image_id}.png"
+                image_url = f"http://{host}:{port}{variant['url']}"
+                sizes = {name: f"http://{host}:{port}{url}" for name, url in derivatives[i].items()}
                 
                 images.append({
                     "id": image_id,
                     "url": image_url,
-                    "thumbnail": image_url,  # Same for now
+                    "thumbnail": sizes.get("thumb", image_url),
+                    "medium": sizes.get("medium", image_url),
                     "selected": i == 0  # First one selected by default
                 })
-            else:
-                print(f"❌ Image generation failed: {result.get('error')}")
+            if result.get("failed_variants"):
+                print(f"⚠ {result['failed_variants']} image variant(s) failed")
+        else:
+            print(f"❌ Image generation failed: {result.get('error')}")
         
         if images:
             print(f"✅ Visual Agent complete - Generated {len(images)} images")
@@ -486,49 +749,35 @@ async def run_research_agent(request: dict):
         if not user_input:
             raise HTTPException(status_code=400, detail="Input is required")
         
+        cached = await semantic_cache_lookup("research", user_input, request.get("semantic_cache"))
+        if cached:
+            output, similarity = cached
+            return {"success": True, "output": output, "semantic_cache": {"hit": True, "similarity": round(similarity, 4)}}
+        
         # Use search tool if available
         search_query = user_input
-        search_result = orchestrator.search_tool.web_search({
+        search_result = await orchestrator.search_tool.aweb_search({
             "q": search_query,
             "max_results": 5
         })
         
         if not search_result.get("success"):
             # Fallback without web search
-            prompt = f"""As a market research analyst, provide insights about: {user_input}
-
-Provide:
-1. Key market trends (3-5 points)
-2. Target audience insights
-3. Competitive landscape
-4. Opportunities
-
-Return as JSON with keys: trends (array), audience_insights (string), competitive_landscape (string), opportunities (array)"""
-
-            llm_result = orchestrator.llm_tool.generate_text({
-                "prompt": prompt,
-                "model": "gemini-2.0-flash-exp",
-                "temperature": 0.3,
-                "max_tokens": 600
-            })
+            llm_result = await orchestrator.llm_tool.agenerate_text(research_request(user_input))
             
             if llm_result.get("success"):
-                try:
-                    content = llm_result.get("text", "")
-                    # Extract JSON from markdown code blocks
-                    if "```json" in content:
-                        content = content.split("```json")[1].split("```")[0].strip()
-                    elif "```" in content:
-                        content = content.split("```")[1].split("```")[0].strip()
-                    
-                    research_data = json.loads(content)
+                research_data = llm_result.get("data") or extract_json(llm_result.get("text", ""))
+                if research_data is not None:
+                    await semantic_cache_store("research", user_input, research_data, request.get("semantic_cache"))
                     return {"success": True, "output": research_data}
-                except json.JSONDecodeError:
-                    # Return raw text if JSON parsing fails
-                    return {"success": True, "output": {
-                        "analysis": llm_result.get("text"),
-                        "note": "Research completed without web search data"
-                    }}
+                # Return raw text if JSON parsing fails
+                return {"success": True, "output": {
+                    "analysis": llm_result.get("text"),
+                    "note": "Research completed without web search data"
+                }}
+            elif gemini_client.is_unavailable(llm_result):
+                print(f"⚠ Research agent falling back to template: {llm_result.get('error')}")
+                return {"success": True, "output": template_responder.research(user_input), "fallback": "template"}
             else:
                 raise HTTPException(status_code=500, detail="LLM generation failed")
         
@@ -536,45 +785,23 @@ Return as JSON with keys: trends (array), audience_insights (string), competitiv
         results = search_result.get("results", [])
         
         # Summarize findings
-        prompt = f"""As a market research analyst, analyze these search results about: {user_input}
-
-Search Results:
-{json.dumps(results, indent=2)}
-
-Provide:
-1. Key market trends (3-5 points)
-2. Target audience insights
-3. Competitive landscape
-4. Opportunities
-
-Return as JSON with keys: trends (array), audience_insights (string), competitive_landscape (string), opportunities (array)"""
-
-        llm_result = orchestrator.llm_tool.generate_text({
-            "prompt": prompt,
-            "model": "gemini-2.0-flash-exp",
-            "temperature": 0.3,
-            "max_tokens": 600
-        })
+        llm_result = await orchestrator.llm_tool.agenerate_text(research_request(user_input, results))
         
         if llm_result.get("success"):
-            try:
-                content = llm_result.get("text", "")
-                # Extract JSON from markdown code blocks
-                if "```json" in content:
-                    content = content.split("```json")[1].split("```")[0].strip()
-                elif "```" in content:
-                    content = content.split("```")[1].split("```")[0].strip()
-                
-                research_data = json.loads(content)
+            research_data = llm_result.get("data") or extract_json(llm_result.get("text", ""))
+            if research_data is not None:
                 research_data["sources"] = results[:3]  # Add top 3 sources
+                await semantic_cache_store("research", user_input, research_data, request.get("semantic_cache"))
                 return {"success": True, "output": research_data}
-            except json.JSONDecodeError as e:
-                # Return formatted text if JSON parsing fails
-                return {"success": True, "output": {
-                    "analysis": llm_result.get("text"),
-                    "sources": results[:3],
-                    "note": "Research completed successfully"
-                }}
+            # Return formatted text if JSON parsing fails
+            return {"success": True, "output": {
+                "analysis": llm_result.get("text"),
+                "sources": results[:3],
+                "note": "Research completed successfully"
+            }}
+        elif gemini_client.is_unavailable(llm_result):
+            print(f"⚠ Research agent falling back to template: {llm_result.get('error')}")
+            return {"success": True, "output": template_responder.research(user_input, results), "fallback": "template"}
         else:
             raise HTTPException(status_code=500, detail="LLM analysis failed")
             
@@ -586,6 +813,52 @@ Return as JSON with keys: trends (array), audience_insights (string), competitiv
         raise HTTPException(status_code=500, detail=f"Research agent error: {str(e)}")
 
 
+@app.post("/api/agents/research/stream")
+async def stream_research_agent(request: dict):
+    """Execute Market Research Agent, streaming partial output as server-sent events"""
+    user_input = request.get("input", "")
+    
+    if not user_input:
+        raise HTTPException(status_code=400, detail="Input is required")
+    
+    async def events():
+        cached = await semantic_cache_lookup("research", user_input, request.get("semantic_cache"))
+        if cached:
+            output, similarity = cached
+            yield sse_event("done", {"success": True, "output": output, "semantic_cache": {"hit": True, "similarity": round(similarity, 4)}})
+            return
+        
+        yield sse_event("status", {"stage": "searching"})
+        search_result = await orchestrator.search_tool.aweb_search({
+            "q": user_input,
+            "max_results": 5
+        })
+        results = search_result.get("results", []) if search_result.get("success") else None
+        
+        async def build_output(research_data, text):
+            if research_data is None:
+                output = {"analysis": text}
+                if results is None:
+                    output["note"] = "Research completed without web search data"
+                else:
+                    output["sources"] = results[:3]
+                    output["note"] = "Research completed successfully"
+                return output
+            
+            if results is not None:
+                research_data["sources"] = results[:3]  # Add top 3 sources
+            await semantic_cache_store("research", user_input, research_data, request.get("semantic_cache"))
+            return research_data
+        
+        yield sse_event("status", {"stage": "analyzing", "sources": len(results or [])})
+        async for event in stream_agent_response(
+            research_request(user_input, results), build_output, lambda: template_responder.research(user_input, results)
+        ):
+            yield event
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 @app.post("/api/agents/media")
 async def run_media_agent(request: dict):
     """Execute Media Planning Agent"""
@@ -606,7 +879,7 @@ async def run_media_agent(request: dict):
             campaign_data = user_input
         
         # Call the MediaPlannerAgent to create comprehensive media plan
-        media_plan = orchestrator.generate_media_plan(campaign_data)
+        media_plan = await orchestrator.generate_media_plan(campaign_data)
         
         return {"success": True, "output": media_plan}
             
@@ -627,7 +900,7 @@ async def run_influencer_agent(request: dict):
         
         # Try to use web search for current influencer data
         search_query = f"top influencers {user_input} 2025 social media collaboration"
-        search_result = orchestrator.search_tool.web_search({
+        search_result = await orchestrator.search_tool.aweb_search({
             "q": search_query,
             "max_results": 5
         })
@@ -648,7 +921,7 @@ For EACH influencer provide:
 IMPORTANT: Return ONLY valid JSON, no extra text. Format:
 {{"influencers": [{{"name": "...", "platform": "...", "followers": "...", "niche": "...", "engagement_rate": "...", "fit_reason": "...", "content_style": "..."}}]}}"""
 
-            llm_result = orchestrator.llm_tool.generate_text({
+            llm_result = await orchestrator.llm_tool.agenerate_text({
                 "prompt": prompt,
                 "model": "gemini-2.0-flash-exp",
                 "temperature": 0.3,
@@ -658,46 +931,8 @@ IMPORTANT: Return ONLY valid JSON, no extra text. Format:
             if llm_result.get("success"):
                 content = llm_result.get("text", "")
                 
-                # Try multiple extraction methods
-                extracted_json = None
-                
-                # Method 1: Extract from markdown code blocks
-                if "```json" in content:
-                    try:
-                        extracted = content.split("```json")[1].split("```")[0].strip()
-                        extracted_json = json.loads(extracted)
-                    except:
-                        pass
-                
-                # Method 2: Try without json marker
-                if not extracted_json and "```" in content:
-                    try:
-                        extracted = content.split("```")[1].split("```")[0].strip()
-                        extracted_json = json.loads(extracted)
-                    except:
-                        pass
-                
-                # Method 3: Regex pattern search
-                if not extracted_json:
-                    try:
-                        json_match = re.search(r'\{[\s\S]*?"influencers"\s*:\s*\[[\s\S]*?\][\s\S]*?\}', content)
-                        if json_match:
-                            json_str = json_match.group(0)
-                            # Try to fix incomplete JSON
-                            if json_str.count('{') > json_str.count('}'):
-                                json_str += '}'
-                            if json_str.count('[') > json_str.count(']'):
-                                json_str += ']'
-                            extracted_json = json.loads(json_str)
-                    except:
-                        pass
-                
-                # Method 4: Try the whole content
-                if not extracted_json:
-                    try:
-                        extracted_json = json.loads(content)
-                    except:
-                        pass
+                # Truncated replies keep the influencers that did arrive
+                extracted_json = extract_json(content, required_key="influencers")
                 
                 if extracted_json and extracted_json.get("influencers"):
                     influencer_data = extracted_json
@@ -737,6 +972,9 @@ IMPORTANT: Return ONLY valid JSON, no extra text. Format:
                         "note": "The AI response was incomplete. Please try a shorter, more specific query.",
                         "raw_preview": content[:300] + "..."
                     }}
+            elif gemini_client.is_unavailable(llm_result):
+                print(f"⚠ Influencer agent falling back to template: {llm_result.get('error')}")
+                return {"success": True, "output": template_responder.influencers(user_input), "fallback": "template"}
             else:
                 raise HTTPException(status_code=500, detail="Influencer analysis failed")
         
@@ -747,7 +985,7 @@ IMPORTANT: Return ONLY valid JSON, no extra text. Format:
         prompt = f"""Analyze these search results and recommend 5 influencers for: {user_input}
 
 Search Results:
-{json.dumps(results[:3], indent=2)}
+{format_search_results(results)}
 
 For EACH influencer:
 - name: Name and handle
@@ -762,7 +1000,7 @@ For EACH influencer:
 Return ONLY valid JSON:
 {{"influencers": [...]}}"""
 
-        llm_result = orchestrator.llm_tool.generate_text({
+        llm_result = await orchestrator.llm_tool.agenerate_text({
             "prompt": prompt,
             "model": "gemini-2.0-flash-exp",
             "temperature": 0.3,
@@ -771,41 +1009,7 @@ Return ONLY valid JSON:
         
         if llm_result.get("success"):
             content = llm_result.get("text", "")
-            extracted_json = None
-            
-            # Try extraction methods
-            if "```json" in content:
-                try:
-                    extracted = content.split("```json")[1].split("```")[0].strip()
-                    extracted_json = json.loads(extracted)
-                except:
-                    pass
-            
-            if not extracted_json and "```" in content:
-                try:
-                    extracted = content.split("```")[1].split("```")[0].strip()
-                    extracted_json = json.loads(extracted)
-                except:
-                    pass
-            
-            if not extracted_json:
-                try:
-                    json_match = re.search(r'\{[\s\S]*?"influencers"\s*:\s*\[[\s\S]*?\][\s\S]*?\}', content)
-                    if json_match:
-                        json_str = json_match.group(0)
-                        if json_str.count('{') > json_str.count('}'):
-                            json_str += '}'
-                        if json_str.count('[') > json_str.count(']'):
-                            json_str += ']'
-                        extracted_json = json.loads(json_str)
-                except:
-                    pass
-            
-            if not extracted_json:
-                try:
-                    extracted_json = json.loads(content)
-                except:
-                    pass
+            extracted_json = extract_json(content, required_key="influencers")
             
             if extracted_json and extracted_json.get("influencers"):
                 influencer_data = extracted_json
@@ -842,6 +1046,9 @@ Return ONLY valid JSON:
                     "note": "The AI response was incomplete. Try a shorter query.",
                     "raw_preview": content[:300] + "..."
                 }}
+        elif gemini_client.is_unavailable(llm_result):
+            print(f"⚠ Influencer agent falling back to template: {llm_result.get('error')}")
+            return {"success": True, "output": template_responder.influencers(user_input, results), "fallback": "template"}
         else:
             raise HTTPException(status_code=500, detail="Influencer analysis failed")
             
@@ -864,9 +1071,21 @@ async def analyze_location_trends(request: LocationTrendsRequest):
         if not location:
             raise HTTPException(status_code=400, detail="Location is required")
         
+        cache_text = f"{location} {search_context}"
+        cached = await semantic_cache_lookup("location_trends", cache_text, request.semantic_cache)
+        if cached:
+            trends, similarity = cached
+            return {
+                "success": True,
+                "location": location,
+                "coordinates": coordinates,
+                "trends": trends,
+                "semantic_cache": {"hit": True, "similarity": round(similarity, 4)}
+            }
+        
         # Try web search for location-specific trends
         search_query = f"{location} {search_context} consumer demographics 2025"
-        search_result = orchestrator.search_tool.web_search({
+        search_result = await orchestrator.search_tool.aweb_search({
             "q": search_query,
             "max_results": 5
         })
@@ -875,7 +1094,7 @@ async def analyze_location_trends(request: LocationTrendsRequest):
         search_context_str = ""
         if search_result.get("success"):
             results = search_result.get("results", [])
-            search_context_str = f"\nWeb Search Results:\n{json.dumps(results[:3], indent=2)}\n"
+            search_context_str = f"\nWeb Search Results:\n{format_search_results(results)}\n"
         
         # Analyze with LLM
         prompt = f"""As a marketing and demographic analyst, provide insights for: {location}
@@ -890,7 +1109,7 @@ Analyze and return ONLY valid JSON with these keys:
 
 Format: {{"demographics": {{}}, "trending_topics": [], "consumer_behavior": "...", "opportunities": []}}"""
 
-        llm_result = orchestrator.llm_tool.generate_text({
+        llm_result = await orchestrator.llm_tool.agenerate_text({
             "prompt": prompt,
             "model": "gemini-2.0-flash-exp",
             "temperature": 0.3,
@@ -900,38 +1119,11 @@ Format: {{"demographics": {{}}, "trending_topics": [], "consumer_behavior": "...
         if llm_result.get("success"):
             content = llm_result.get("text", "")
             
-            # Extract JSON
-            extracted_json = None
-            if "```json" in content:
-                try:
-                    extracted = content.split("```json")[1].split("```")[0].strip()
-                    extracted_json = json.loads(extracted)
-                except:
-                    pass
-            
-            if not extracted_json and "```" in content:
-                try:
-                    extracted = content.split("```")[1].split("```")[0].strip()
-                    extracted_json = json.loads(extracted)
-                except:
-                    pass
-            
-            if not extracted_json:
-                try:
-                    json_match = re.search(r'\{[\s\S]*?"demographics"[\s\S]*?\}', content)
-                    if json_match:
-                        json_str = json_match.group(0)
-                        extracted_json = json.loads(json_str)
-                except:
-                    pass
-            
-            if not extracted_json:
-                try:
-                    extracted_json = json.loads(content)
-                except:
-                    pass
+            # Extract JSON (prefer the object carrying the demographics, as the prompt asks)
+            extracted_json = extract_json(content, required_key="demographics") or extract_json(content)
             
             if extracted_json:
+                await semantic_cache_store("location_trends", cache_text, extracted_json, request.semantic_cache)
                 return {
                     "success": True,
                     "location": location,
@@ -963,6 +1155,15 @@ Format: {{"demographics": {{}}, "trending_topics": [], "consumer_behavior": "...
                         ]
                     }
                 }
+        elif gemini_client.is_unavailable(llm_result):
+            print(f"⚠ Location trends falling back to template: {llm_result.get('error')}")
+            return {
+                "success": True,
+                "location": location,
+                "coordinates": coordinates,
+                "trends": template_responder.location_trends(location),
+                "fallback": "template"
+            }
         else:
             raise HTTPException(status_code=500, detail="Analysis failed")
             
@@ -988,14 +1189,12 @@ MARKETPLACE_IMAGES_DIR.mkdir(exist_ok=True)
 def load_marketplace_workflows():
     """Load marketplace workflows from JSON file"""
     if MARKETPLACE_WORKFLOWS_FILE.exists():
-        with open(MARKETPLACE_WORKFLOWS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return read_json(MARKETPLACE_WORKFLOWS_FILE, "marketplace")
     return []
 
 def save_marketplace_workflows(workflows):
     """Save marketplace workflows to JSON file"""
-    with open(MARKETPLACE_WORKFLOWS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(workflows, f, indent=2, ensure_ascii=False)
+    write_json(MARKETPLACE_WORKFLOWS_FILE, workflows, "marketplace", ensure_ascii=False)
 
 @app.get("/api/marketplace/workflows")
 async def get_marketplace_workflows(
@@ -1222,12 +1421,23 @@ async def upload_marketplace_image(file: UploadFile = File(...)):
         with open(file_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
         
+        # Smaller sizes for cards and galleries, next to the upload
+        derivatives = await image_derivatives.agenerate_derivatives(file_path)
+        
         # Return URL
         host = os.getenv("HOST", "localhost")
         port = os.getenv("PORT", "8000")
-        url = f"http://{host}:{port}/marketplace/images/{filename}"
+        base_url = f"http://{host}:{port}/marketplace/images"
+        url = f"{base_url}/{filename}"
+        sizes = {name: f"{base_url}/{Path(derivative['path']).name}" for name, derivative in derivatives.items()}
         
-        return {"success": True, "url": url, "filename": filename}
+        return {
+            "success": True,
+            "url": url,
+            "filename": filename,
+            "thumbnail_url": sizes.get("thumb", url),
+            "medium_url": sizes.get("medium", url)
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1319,7 +1529,7 @@ Write a tweet that:
 Output ONLY the tweet text:"""
             
             print(f"🚀 Calling Gemini AI...")
-            result = orchestrator.llm_tool.generate_text({
+            result = await orchestrator.llm_tool.agenerate_text({
                 "prompt": prompt,
                 "model": "gemini-2.0-flash-exp",
                 "temperature": 0.9,
@@ -1376,7 +1586,7 @@ Output ONLY the tweet text:"""
         
         # Post tweet (Twitter max 4 images)
         print(f"🐦 Posting tweet with {min(len(images), 4)} image(s)...")
-        result = twitter_tool.post_tweet(text, images[:4])
+        result = await asyncio.to_thread(twitter_tool.post_tweet, text, images[:4])
         
         if result.get("success"):
             print(f"✅ Twitter post successful!")
@@ -1432,7 +1642,7 @@ async def post_twitter_thread(request: dict):
         twitter_tool = TwitterTool()
         
         # Post thread
-        result = twitter_tool.post_thread(tweets)
+        result = await asyncio.to_thread(twitter_tool.post_thread, tweets)
         
         if result.get("success"):
             print(f"✅ Twitter thread posted!")
@@ -1464,7 +1674,7 @@ async def get_twitter_account():
         from tools.twitter_tool import TwitterTool
         
         twitter_tool = TwitterTool()
-        result = twitter_tool.get_account_info()
+        result = await asyncio.to_thread(twitter_tool.get_account_info)
         
         if result.get("success"):
             return {
@@ -1478,50 +1688,314 @@ async def get_twitter_account():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+class ImmutableStaticFiles(StaticFiles):
+    """Static files whose content never changes under the same path (content-addressed blobs)"""
+    
+    async def get_response(self, path: str, scope):
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
 # Mount assets directory (after agent endpoints to avoid route conflicts)
+# Blobs first - the more specific mount has to match before /assets
+app.mount("/assets/blobs", ImmutableStaticFiles(directory=str(orchestrator.asset_store.blobs_dir)), name="asset_blobs")
 app.mount("/assets", StaticFiles(directory=str(ASSETS_DIR)), name="assets")
 app.mount("/marketplace/images", StaticFiles(directory=str(MARKETPLACE_IMAGES_DIR)), name="marketplace_images")
-app.mount("/storage", StaticFiles(directory=str(STORAGE_DIR)), name="storage")
+# Only reports are public - the rest of ./storage holds the job queue, checkpoints, caches and indexes
+app.mount("/storage/reports", StaticFiles(directory=str(REPORTS_DIR)), name="reports")
 
 @app.get("/")
 def read_root():
     return {"message": "Campaign Generator API", "status": "running"}
 
-@app.post("/api/generate-campaign")
-async def generate_campaign(request: BriefRequest):
-    """Generate campaign from brief"""
-    try:
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """Hit/miss counters for the response caches, embedding store and single-flight coalescing"""
+    return {
+        "success": True,
+        "llm_cache": orchestrator.llm_tool.cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "embedding_store": orchestrator.embedding_store.stats(),
+        "single_flight": {
+            "llm_text": orchestrator.llm_tool.single_flight.stats(),
+            "web_search": orchestrator.search_tool.single_flight.stats(),
+            "image_generate": orchestrator.image_tool.single_flight.stats()
+        }
+    }
+
+@app.get("/api/rate-limits")
+async def get_rate_limits():
+    """Gemini rate governor budgets, queue depths, wait times and per-model circuit breaker states"""
+    return {
+        "success": True,
+        "gemini": get_governor("gemini").stats(),
+        "gemini_embed": get_governor("gemini_embed").stats(),
+        "circuit_breakers": gemini_client.breaker_stats(),
+        "fallback_chain": gemini_client.fallback_chain()
+    }
+
+# Scrape-time gauges over state that is already counted elsewhere
+def _cache_counts() -> Dict[str, tuple]:
+    """cache -> (hits, misses) for the response caches and single-flight coalescing"""
+    llm = orchestrator.llm_tool.cache.stats()
+    counts = {"llm_cache": (llm["hits"], llm["misses"])}
+    for namespace, ns in semantic_cache.stats()["namespaces"].items():
+        counts[f"semantic_cache_{namespace}"] = (ns["hits"], ns["misses"])
+    for name, tool in (("llm_text", orchestrator.llm_tool), ("web_search", orchestrator.search_tool), ("image_generate", orchestrator.image_tool)):
+        flights = tool.single_flight.stats()
+        counts[f"single_flight_{name}"] = (flights["shared_calls"], flights["upstream_calls"])
+    return counts
+
+metrics.counter(
+    "cache_hits_total", "Cache hits (shared calls for single-flight)", ("cache",),
+    collect=lambda: {(name,): hits for name, (hits, _) in _cache_counts().items()}
+)
+metrics.counter(
+    "cache_misses_total", "Cache misses (upstream calls for single-flight)", ("cache",),
+    collect=lambda: {(name,): misses for name, (_, misses) in _cache_counts().items()}
+)
+metrics.gauge(
+    "cache_hit_ratio", "Hits / lookups since start", ("cache",),
+    collect=lambda: {(name,): round(hits / (hits + misses), 4) if hits + misses else 0.0 for name, (hits, misses) in _cache_counts().items()}
+)
+metrics.counter(
+    "embedding_dedupe_hits_total", "Embeddings served from the store instead of recomputed",
+    collect=lambda: {(): orchestrator.embedding_store.stats()["dedupe_hits"]}
+)
+metrics.gauge(
+    "ws_active_connections", "Open collaboration WebSocket connections",
+    collect=lambda: {(): sum(len(connections) for connections in list(collaboration_manager.active_connections.values()))}
+)
+metrics.gauge(
+    "ws_active_rooms", "Workflows with at least one collaboration connection",
+    collect=lambda: {(): len(collaboration_manager.active_connections)}
+)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of the in-process metrics"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/assets/stats")
+async def get_asset_stats():
+    """Blob count and size, references and dedupe hits of the content-addressed asset store"""
+    return {"success": True, **await asyncio.to_thread(orchestrator.asset_store.stats)}
+
+@app.post("/api/assets/gc")
+async def collect_asset_garbage(dry_run: bool = False, grace_seconds: Optional[float] = None):
+    """Delete blobs no campaign or workflow node references (older than the grace period)"""
+    result = await asyncio.to_thread(orchestrator.asset_store.gc, grace_seconds, dry_run)
+    print(f"🧹 Asset GC: {result['removed_blobs']} blob(s), {result['freed_bytes']} bytes" + (" (dry run)" if dry_run else ""))
+    return {"success": True, **result}
+
+@app.get("/api/assets/near-duplicates")
+async def get_near_duplicate_report(max_distance: int = PHASH_MAX_DISTANCE):
+    """Groups of perceptually near-identical images across all assets, with the campaigns using them"""
+    report = await asyncio.to_thread(perceptual_index.report, str(CAMPAIGNS_DIR), max_distance)
+    return {"success": True, **report}
+
+@app.get("/api/token-usage")
+async def get_token_usage():
+    """Prompt, completion and context-cached tokens Gemini reported, per endpoint"""
+    return {"success": True, **token_ledger.stats()}
+
+@app.get("/api/telemetry")
+async def get_telemetry(campaign_id: Optional[str] = None):
+    """
+    Tool call cost and latency: per endpoint, per campaign and per workflow run, with
+    p50/p95/p99 wall time and queue wait. ?campaign_id= returns just that campaign.
+    """
+    if campaign_id:
+        return {"success": True, "campaign_id": campaign_id, "telemetry": telemetry.campaign_summary(campaign_id)}
+    return {"success": True, **telemetry.stats()}
+
+async def run_campaign_generation(brief: str, report=None) -> dict:
+    """
+    Manifest -> asset generation -> media plan -> save. report(event), if given, is awaited
+    with progress events (stage changes and one per finished asset).
+    """
+    # Every tool call of the generation - manifest included - is accounted to the campaign
+    with run_scope(str(uuid.uuid4())) as run_id:
         # Generate manifest
-        result = orchestrator.generate_campaign_manifest(request.brief)
-        
+        if report is not None:
+            await report({"stage": "manifest"})
+        result = await orchestrator.generate_campaign_manifest(brief)
+    
         if not result.get("success"):
-            raise HTTPException(status_code=500, detail=result.get("error"))
-        
-        manifest = result["manifest"]
-        
-        # Execute asset generation
-        manifest = orchestrator.execute_asset_generation(manifest)
-        
-        # Generate media plan
-        media_plan_result = orchestrator.generate_media_plan(manifest)
+            raise RuntimeError(result.get("error") or "Manifest generation failed")
+    
+        telemetry.bind_campaign(run_id, result["manifest"]["campaign_id"])
+        return await complete_campaign_generation(result["manifest"], report)
+
+async def resume_campaign_generation(campaign_id: str, report=None):
+    """
+    Continue an interrupted campaign from its checkpoint (or a saved campaign with failed
+    tool calls), re-running only the tool calls without a successful result. None if unknown.
+    """
+    manifest = await asyncio.to_thread(orchestrator.load_checkpoint, campaign_id)
+    if manifest is None:
+        campaign_file = CAMPAIGNS_DIR / f"{campaign_id}.json"
+        if not campaign_file.exists():
+            return None
+        manifest = read_json(campaign_file, "campaigns")
+    
+    with run_scope(str(uuid.uuid4())) as run_id:
+        telemetry.bind_campaign(run_id, campaign_id)
+        return await complete_campaign_generation(manifest, report)
+
+async def complete_campaign_generation(manifest: dict, report=None) -> dict:
+    """Asset generation (checkpointed per tool call) -> media plan -> save"""
+    async def emit(event: dict):
+        if report is not None:
+            await report(event)
+    
+    total_assets = len(manifest.get("asset_plan", []))
+    await emit({"stage": "assets", "campaign_id": manifest["campaign_id"], "total_assets": total_assets, "completed_assets": 0})
+    
+    completed = 0
+    async def on_asset_done(asset: dict):
+        nonlocal completed
+        completed += 1
+        failed = any(call.get("error") for call in asset.get("tool_calls", []))
+        await emit({
+            "stage": "assets",
+            "asset_id": asset["id"],
+            "asset_status": "failed" if failed else "done",
+            "completed_assets": completed,
+            "total_assets": total_assets
+        })
+    
+    # Execute asset generation
+    manifest = await orchestrator.execute_asset_generation(manifest, on_asset_done)
+    
+    # Generate media plan (a resumed campaign may already have one)
+    if not manifest.get("media_plan"):
+        await emit({"stage": "media_plan"})
+        media_plan_result = await orchestrator.generate_media_plan(manifest)
         if media_plan_result.get("success"):
             print("✅ Media plan generated successfully")
-        
-        # Convert file paths to URLs
-        manifest = convert_asset_paths_to_urls(manifest)
-        
-        # Save campaign
-        campaign_id = manifest["campaign_id"]
-        campaign_file = CAMPAIGNS_DIR / f"{campaign_id}.json"
-        
-        with open(campaign_file, "w") as f:
-            json.dump(manifest, f, indent=2)
-        
+    
+    # Convert file paths to URLs
+    manifest = convert_asset_paths_to_urls(manifest)
+    
+    campaign_id = manifest["campaign_id"]
+    manifest.setdefault("metadata", {})["telemetry"] = telemetry.campaign_summary(campaign_id)
+    
+    # Save campaign
+    campaign_file = CAMPAIGNS_DIR / f"{campaign_id}.json"
+    
+    write_json(campaign_file, manifest, "campaigns")
+    await asyncio.to_thread(sync_campaign_asset_refs, manifest)
+    
+    # The saved campaign now holds every result - the checkpoint is no longer needed
+    await asyncio.to_thread(orchestrator.checkpoints.clear, campaign_id)
+    
+    await emit({"stage": "saved"})
+    return manifest
+
+@app.post("/api/generate-campaign")
+async def generate_campaign(request: BriefRequest):
+    """Generate campaign from brief (blocking - see /api/jobs/generate-campaign for the job API)"""
+    try:
+        manifest = await run_campaign_generation(request.brief)
         return {"success": True, "campaign": manifest}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/campaign/{campaign_id}/resume")
+async def resume_campaign(campaign_id: str):
+    """Resume an interrupted campaign, re-running only its missing or failed tool calls"""
+    try:
+        manifest = await resume_campaign_generation(campaign_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return {"success": True, "campaign": manifest}
+
+@app.get("/api/campaign-checkpoints")
+async def list_campaign_checkpoints():
+    """Campaigns whose asset generation was interrupted and can be resumed"""
+    return {"success": True, "campaign_ids": await asyncio.to_thread(orchestrator.checkpoints.list)}
+
+# Background campaign generation jobs
+async def campaign_job_handler(payload: dict, report, progress: dict) -> dict:
+    # A re-queued job that got as far as asset generation continues from its checkpoint
+    campaign_id = progress.get("campaign_id")
+    manifest = None
+    if campaign_id and orchestrator.checkpoints.exists(campaign_id):
+        print(f"✓ Resuming campaign {campaign_id} from its checkpoint")
+        manifest = await resume_campaign_generation(campaign_id, report)
+    if manifest is None:
+        manifest = await run_campaign_generation(payload["brief"], report)
+    return {"campaign_id": manifest["campaign_id"]}
+
+job_queue.register("generate_campaign", campaign_job_handler)
+
+@app.on_event("startup")
+async def start_job_queue():
+    await job_queue.start()
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    await job_queue.stop()
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    await orchestrator.image_tool.aclose()
+
+@app.on_event("shutdown")
+async def stop_derivative_workers():
+    image_derivatives.shutdown()
+
+@app.post("/api/jobs/generate-campaign", status_code=202)
+async def submit_campaign_job(request: BriefRequest, idempotency_key: Optional[str] = Header(None)):
+    """
+    Queue campaign generation and return a job id at once
+    Send an Idempotency-Key header (or idempotency_key in the body) so a retried
+    submit attaches to the job it already created instead of starting another.
+    """
+    key = idempotency_key or request.idempotency_key
+    try:
+        job, created = await job_queue.submit("generate_campaign", {"brief": request.brief}, key)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"success": True, "job_id": job["job_id"], "status": job["status"], "created": created}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Job status, latest progress snapshot and result (campaign_id) or error"""
+    job = await job_queue.aget(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"success": True, "job": job}
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Job progress as server-sent events: a snapshot, then progress/status events until it finishes"""
+    if await job_queue.aget(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def events():
+        async for event in job_queue.subscribe(job_id):
+            yield sse_event(event.pop("type"), event)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.websocket("/ws/jobs/{job_id}")
+async def websocket_job_events(websocket: WebSocket, job_id: str):
+    """Same events as /api/jobs/{job_id}/events, as JSON messages"""
+    await websocket.accept()
+    try:
+        async for event in job_queue.subscribe(job_id):
+            await websocket.send_json(event)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
 @app.post("/api/generate-media-plan/{campaign_id}")
 async def generate_media_plan(campaign_id: str):
     """Generate or regenerate media plan for existing campaign"""
@@ -1531,18 +2005,16 @@ async def generate_media_plan(campaign_id: str):
         if not campaign_file.exists():
             raise HTTPException(status_code=404, detail="Campaign not found")
         
-        with open(campaign_file, "r") as f:
-            manifest = json.load(f)
+        manifest = read_json(campaign_file, "campaigns")
         
         # Generate media plan
-        result = orchestrator.generate_media_plan(manifest)
+        result = await orchestrator.generate_media_plan(manifest)
         
         if not result.get("success"):
             raise HTTPException(status_code=500, detail=result.get("error"))
         
         # Save updated campaign
-        with open(campaign_file, "w") as f:
-            json.dump(manifest, f, indent=2)
+        write_json(campaign_file, manifest, "campaigns")
         
         return {
             "success": True, 
@@ -1563,28 +2035,50 @@ async def get_campaign(campaign_id: str):
     if not campaign_file.exists():
         raise HTTPException(status_code=404, detail="Campaign not found")
     
-    with open(campaign_file, "r") as f:
-        campaign = json.load(f)
+    campaign = read_json(campaign_file, "campaigns")
+    
+    # Older campaigns carry raw embedding vectors - move them to the embedding store once
+    if await asyncio.to_thread(orchestrator.compact_embeddings, campaign):
+        write_json(campaign_file, campaign, "campaigns")
     
     # Convert file paths to URLs
     campaign = convert_asset_paths_to_urls(campaign)
     
     return {"success": True, "campaign": campaign}
 
+@app.post("/api/embeddings/similar")
+async def find_similar_assets(request: SimilarAssetsRequest):
+    """Find the most similar assets in other campaigns for a campaign's assets or given vector IDs"""
+    vector_ids = list(request.vector_ids)
+    if request.campaign_id:
+        vector_ids += orchestrator.embedding_store.campaign_vectors(request.campaign_id)
+    
+    if not vector_ids:
+        raise HTTPException(status_code=400, detail="Provide a campaign_id with embedded assets or vector_ids")
+    
+    results = await asyncio.to_thread(
+        orchestrator.embedding_store.similar,
+        list(dict.fromkeys(vector_ids)),
+        request.top_k,
+        request.include_same_campaign,
+        request.min_score
+    )
+    
+    return {"success": True, "results": results}
+
 @app.post("/api/regenerate-asset")
 async def regenerate_asset(request: RegenerateRequest):
     """Regenerate a specific asset"""
     try:
         # Find campaign containing this asset
         for campaign_file in CAMPAIGNS_DIR.glob("*.json"):
-            with open(campaign_file, "r") as f:
-                manifest = json.load(f)
+            manifest = read_json(campaign_file, "campaigns")
             
             # Check if asset exists in this campaign
             asset_ids = [a["id"] for a in manifest.get("asset_plan", [])]
             if request.asset_id in asset_ids:
                 # Regenerate
-                result = orchestrator.regenerate_asset(
+                result = await orchestrator.regenerate_asset(
                     manifest, 
                     request.asset_id, 
                     request.modify_instructions
@@ -1597,8 +2091,8 @@ async def regenerate_asset(request: RegenerateRequest):
                 result["manifest"] = convert_asset_paths_to_urls(result["manifest"])
                 
                 # Save updated manifest
-                with open(campaign_file, "w") as f:
-                    json.dump(result["manifest"], f, indent=2)
+                write_json(campaign_file, result["manifest"], "campaigns")
+                await asyncio.to_thread(sync_campaign_asset_refs, result["manifest"])
                 
                 return {"success": True, "campaign": result["manifest"]}
         
@@ -1612,14 +2106,13 @@ async def list_campaigns():
     """List all campaigns"""
     campaigns = []
     for campaign_file in CAMPAIGNS_DIR.glob("*.json"):
-        with open(campaign_file, "r") as f:
-            campaign = json.load(f)
-            campaigns.append({
-                "campaign_id": campaign["campaign_id"],
-                "brief": campaign["brief"],
-                "created_at": campaign["created_at"],
-                "status": campaign["status"]
-            })
+        campaign = read_json(campaign_file, "campaigns")
+        campaigns.append({
+            "campaign_id": campaign["campaign_id"],
+            "brief": campaign["brief"],
+            "created_at": campaign["created_at"],
+            "status": campaign["status"]
+        })
     
     return {"success": True, "campaigns": campaigns}
 
@@ -1634,8 +2127,7 @@ async def export_campaign(campaign_id: str):
     if not campaign_file.exists():
         raise HTTPException(status_code=404, detail="Campaign not found")
     
-    with open(campaign_file, "r") as f:
-        campaign = json.load(f)
+    campaign = read_json(campaign_file, "campaigns")
     
     # Create ZIP in memory
     zip_buffer = BytesIO()
@@ -1647,7 +2139,7 @@ async def export_campaign(campaign_id: str):
         # Add assets
         for asset in campaign.get("asset_plan", []):
             if asset.get("url"):
-                asset_path = Path(asset["url"])
+                asset_path = orchestrator.asset_store.local_path(asset["url"]) or Path(asset["url"])
                 if asset_path.exists():
                     zip_file.write(asset_path, f"assets/{asset_path.name}")
             
@@ -1677,7 +2169,7 @@ async def generate_campaign_report(workflow_data: dict):
         summary = await generate_campaign_summary(nodes, workflow_name)
         
         # Create PDF report
-        pdf_path = create_pdf_report(summary, nodes, workflow_name)
+        pdf_path = await asyncio.to_thread(create_pdf_report, summary, nodes, workflow_name)
         
         # Get the filename
         filename = pdf_path.name
@@ -1696,6 +2188,42 @@ async def generate_campaign_report(workflow_data: dict):
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Failed to generate report: {str(e)}")
 
+@app.post("/api/generate-campaign-report/stream")
+async def stream_campaign_report(workflow_data: dict):
+    """Generate a campaign report, streaming the summary as server-sent events before the PDF is built"""
+    from tools.report_generator import stream_campaign_summary, parse_summary_response, fallback_summary, create_pdf_report
+    
+    nodes = workflow_data.get("nodes", [])
+    workflow_name = workflow_data.get("workflowName", "Untitled Campaign")
+    
+    async def events():
+        parser = IncrementalJSONParser()
+        try:
+            async for event in stream_llm_events(stream_campaign_summary(nodes, workflow_name), parser):
+                yield event
+            summary = parse_summary_response(parser.buffer, nodes, workflow_name)
+        except Exception as e:
+            print(f"Error generating summary: {str(e)}")
+            summary = fallback_summary(nodes, workflow_name)
+        
+        yield sse_event("status", {"stage": "rendering_pdf"})
+        try:
+            pdf_path = await asyncio.to_thread(create_pdf_report, summary, nodes, workflow_name)
+        except Exception as e:
+            print(f"Error generating campaign report: {str(e)}")
+            yield sse_event("error", {"success": False, "error": f"Failed to generate report: {str(e)}"})
+            return
+        
+        filename = pdf_path.name
+        yield sse_event("done", {
+            "success": True,
+            "summary": summary,
+            "pdfUrl": f"http://{os.getenv('HOST', 'localhost')}:{os.getenv('PORT', '8000')}/storage/reports/{filename}",
+            "filename": filename
+        })
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @app.get("/api/download-report/{filename}")
 async def download_report(filename: str):
     """Download a generated campaign report PDF"""
@@ -1739,8 +2267,7 @@ async def send_invite(invite: dict):
     }
     
     invite_file = INVITES_DIR / f"{invite_id}.json"
-    with open(invite_file, "w") as f:
-        json.dump(invite_data, f, indent=2)
+    write_json(invite_file, invite_data, "invites")
     
     return {
         "success": True,
@@ -1754,8 +2281,7 @@ async def get_pending_invites(email: str):
     pending_invites = []
     
     for invite_file in INVITES_DIR.glob("*.json"):
-        with open(invite_file, "r") as f:
-            invite = json.load(f)
+        invite = read_json(invite_file, "invites")
             
         # Check if invite is for this email and still pending
         if (invite.get("to_email") == email and 
@@ -1776,8 +2302,7 @@ async def accept_invite(invite_id: str, user_info: dict):
     if not invite_file.exists():
         raise HTTPException(status_code=404, detail="Invite not found")
     
-    with open(invite_file, "r") as f:
-        invite = json.load(f)
+    invite = read_json(invite_file, "invites")
     
     if invite.get("status") != "pending":
         raise HTTPException(status_code=400, detail="Invite already processed")
@@ -1787,8 +2312,7 @@ async def accept_invite(invite_id: str, user_info: dict):
     invite["accepted_by"] = user_info
     invite["accepted_at"] = datetime.now().isoformat()
     
-    with open(invite_file, "w") as f:
-        json.dump(invite, f, indent=2)
+    write_json(invite_file, invite, "invites")
     
     return {
         "success": True,
@@ -1804,8 +2328,7 @@ async def reject_invite(invite_id: str):
     if not invite_file.exists():
         raise HTTPException(status_code=404, detail="Invite not found")
     
-    with open(invite_file, "r") as f:
-        invite = json.load(f)
+    invite = read_json(invite_file, "invites")
     
     if invite.get("status") != "pending":
         raise HTTPException(status_code=400, detail="Invite already processed")
@@ -1814,8 +2337,7 @@ async def reject_invite(invite_id: str):
     invite["status"] = "rejected"
     invite["rejected_at"] = datetime.now().isoformat()
     
-    with open(invite_file, "w") as f:
-        json.dump(invite, f, indent=2)
+    write_json(invite_file, invite, "invites")
     
     return {"success": True, "message": "Invite rejected"}
 
@@ -0,0 +1,164 @@
+"""
+Response schemas for Gemini structured output
+Shapes the model is asked to produce, registered by name so tool inputs stay JSON
+(and therefore cacheable). gemini_schema() turns a pydantic model into the OpenAPI
+subset Gemini accepts as response_schema; field_error() validates one top-level
+field of a streamed object as soon as it closes.
+
+Free-form Dict[str, Any] fields can't be expressed as a Gemini schema (objects need
+properties), so the manifest is requested as ManifestResponse and the orchestrator
+fills the remaining CampaignManifest fields locally.
+"""
+
+import hashlib
+import json
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Literal, Type
+
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+
+from models.schema import CampaignStrategy, PostingCalendarItem, Influencer
+
+# Keys of the OpenAPI subset Gemini's Schema proto understands
+GEMINI_SCHEMA_KEYS = {"type", "format", "description", "nullable", "enum", "items", "properties", "required"}
+
+
+class ToolCallInputSpec(BaseModel):
+    # Union of the inputs the manifest's tool calls use (llm_text, image_generate, web_search, moderation, compute_embedding)
+    prompt: Optional[str] = None
+    model: Optional[str] = None
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None
+    provider: Optional[str] = None
+    size: Optional[str] = None
+    seed: Optional[int] = None
+    n: Optional[int] = None
+    q: Optional[str] = None
+    location: Optional[str] = None
+    max_results: Optional[int] = None
+    text: Optional[str] = None
+    type: Optional[str] = None
+
+class ToolCallSpec(BaseModel):
+    tool: Literal["llm_text", "image_generate", "web_search", "moderation", "store_asset", "compute_embedding"]
+    id: str
+    input: ToolCallInputSpec
+    safety_checks: List[str] = Field(default_factory=list)
+    requires_approval: Optional[bool] = None
+
+class AssetSpec(BaseModel):
+    id: str
+    type: Literal["image", "text", "video_script", "caption", "blog", "flyer"]
+    prompt: str
+    seed: Optional[int] = None
+    model: Optional[str] = None
+    provider: Optional[str] = None
+    tool_calls: List[ToolCallSpec] = Field(default_factory=list)
+
+class ManifestSpec(BaseModel):
+    strategy: CampaignStrategy
+    asset_plan: List[AssetSpec]
+    posting_calendar: List[PostingCalendarItem] = Field(default_factory=list)
+    influencers: List[Influencer] = Field(default_factory=list)
+
+class ManifestResponse(BaseModel):
+    campaign_manifest: ManifestSpec
+
+class AssetBrief(BaseModel):
+    type: Literal["image", "text", "video_script", "caption", "blog", "flyer"]
+    prompt: str
+
+class AssetSection(BaseModel):
+    # One slice of the asset_plan, generated in parallel with the other slices
+    assets: List[AssetBrief]
+
+class InfluencerSection(BaseModel):
+    influencers: List[Influencer]
+
+class CopywritingOutput(BaseModel):
+    captions: List[str]
+    cta: str
+    hashtags: str
+
+class ResearchOutput(BaseModel):
+    trends: List[str]
+    audience_insights: str
+    competitive_landscape: str
+    opportunities: List[str]
+
+
+RESPONSE_SCHEMAS: Dict[str, Type[BaseModel]] = {
+    "campaign_manifest": ManifestResponse,
+    "asset_section": AssetSection,
+    "influencer_section": InfluencerSection,
+    "strategy": CampaignStrategy,
+    "copywriting": CopywritingOutput,
+    "research": ResearchOutput,
+}
+
+
+def get_response_model(name: str) -> Type[BaseModel]:
+    model = RESPONSE_SCHEMAS.get(name)
+    if model is None:
+        raise ValueError(f"Unknown response schema: {name}")
+    return model
+
+
+def _to_gemini(node: Dict[str, Any], defs: Dict[str, Any]) -> Dict[str, Any]:
+    if "$ref" in node:
+        node = defs[node["$ref"].split("/")[-1]]
+    
+    # Optional[X] comes out as anyOf [X, null] - Gemini spells that nullable
+    any_of = node.get("anyOf")
+    if any_of:
+        options = [option for option in any_of if option.get("type") != "null"]
+        schema = _to_gemini(options[0], defs)
+        if len(options) < len(any_of):
+            schema["nullable"] = True
+        return schema
+    
+    schema = {key: value for key, value in node.items() if key in GEMINI_SCHEMA_KEYS}
+    if "properties" in schema:
+        schema["properties"] = {name: _to_gemini(prop, defs) for name, prop in schema["properties"].items()}
+    if "items" in schema:
+        schema["items"] = _to_gemini(schema["items"], defs)
+    return schema
+
+
+@lru_cache(maxsize=None)
+def _gemini_schema_json(name: str) -> str:
+    json_schema = get_response_model(name).model_json_schema()
+    return json.dumps(_to_gemini(json_schema, json_schema.get("$defs", {})))
+
+
+def gemini_schema(name: str) -> Dict[str, Any]:
+    """response_schema dict for a registered schema name (a fresh copy each call)"""
+    return json.loads(_gemini_schema_json(name))
+
+
+def schema_fingerprint(name: str) -> str:
+    """Changes whenever the schema does, so cached responses for an old shape aren't reused"""
+    return hashlib.sha256(f"{name}\0{_gemini_schema_json(name)}".encode("utf-8")).hexdigest()[:16]
+
+
+def validate_output(name: str, data: Any) -> Dict[str, Any]:
+    """Validate a complete response; raises pydantic.ValidationError"""
+    return get_response_model(name).model_validate(data).model_dump()
+
+
+@lru_cache(maxsize=None)
+def _field_adapters(name: str) -> Dict[str, TypeAdapter]:
+    fields = get_response_model(name).model_fields
+    return {key: TypeAdapter(field.annotation) for key, field in fields.items()}
+
+
+def field_error(name: str, key: str, value: Any) -> Optional[str]:
+    """Why one streamed top-level field doesn't fit the schema, or None if it does"""
+    adapter = _field_adapters(name).get(key)
+    if adapter is None:
+        return f"Unexpected field '{key}'"
+    try:
+        adapter.validate_python(value)
+    except ValidationError as e:
+        return "; ".join(error["msg"] for error in e.errors())
+    return None
@@ -5,6 +5,8 @@ from datetime import datetime
 class RetryPolicy(BaseModel):
     max_attempts: int = 3
     backoff: Literal["exponential", "linear"] = "exponential"
+    base_delay: float = 1.0
+    max_delay: float = 30.0
 
 class ToolCall(BaseModel):
     tool: Literal["llm_text", "image_generate", "web_search", "moderation", "store_asset", "compute_embedding"]
@@ -53,6 +55,7 @@ class LocationTrendsRequest(BaseModel):
     location: str
     coordinates: Optional[Dict[str, float]] = None
     search_context: Optional[str] = "marketing trends"
+    semantic_cache: Optional[bool] = None
 
 class RegisterRequest(BaseModel):
     name: str
@@ -88,7 +91,15 @@ class CampaignManifestWrapper(BaseModel):
 
 class BriefRequest(BaseModel):
     brief: str
+    idempotency_key: Optional[str] = None
 
 class RegenerateRequest(BaseModel):
     asset_id: str
     modify_instructions: Optional[str] = None
+
+class SimilarAssetsRequest(BaseModel):
+    campaign_id: Optional[str] = None
+    vector_ids: List[str] = Field(default_factory=list)
+    top_k: int = 5
+    include_same_campaign: bool = False
+    min_score: float = 0.0
@@ -0,0 +1,10 @@
+import os
+import sys
+from pathlib import Path
+
+# Tests import the backend modules the way main.py does (models.*, tools.*, agents.*)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
+os.environ.setdefault("HUGGINGFACE_API_TOKEN", "test-token")
+os.environ.setdefault("LLM_CACHE_ENABLED", "false")
@@ -0,0 +1,61 @@
+import os
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(scope="module")
+def main_module(tmp_path_factory):
+    # main.py creates its ./storage tree on import
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("backend"))
+    try:
+        import main
+        yield main
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def client(main_module, monkeypatch):
+    async def search_unavailable(tool_input):
+        return {"success": False, "retryable": False, "error": "Search disabled in tests", "results": []}
+    
+    monkeypatch.setattr(main_module.orchestrator.search_tool, "aweb_search", search_unavailable)
+    return TestClient(main_module.app)
+
+
+@pytest.fixture
+def breakers_open(main_module):
+    gemini_client = main_module.gemini_client
+    breakers = [gemini_client.get_breaker(name) for name in gemini_client.fallback_chain()]
+    for breaker in breakers:
+        breaker.state = "open"
+        breaker._opened_at = time.monotonic()
+    yield
+    for breaker in breakers:
+        breaker.state = "closed"
+        breaker._failures = 0
+
+
+def test_influencer_agent_falls_back_to_template_when_breaker_is_open(client, breakers_open):
+    response = client.post("/api/agents/influencer", json={"input": "eco sneakers for Gen Z in Mumbai"})
+    
+    assert response.status_code == 200
+    body = response.json()
+    assert body["success"] is True
+    assert body["fallback"] == "template"
+    assert body["output"]["type"] == "influencer_list"
+    assert body["output"]["influencers"]
+
+
+def test_location_trends_falls_back_to_template_when_breaker_is_open(client, breakers_open):
+    response = client.post("/api/analyze-location-trends", json={"location": "Mumbai"})
+    
+    assert response.status_code == 200
+    body = response.json()
+    assert body["success"] is True
+    assert body["fallback"] == "template"
+    assert body["location"] == "Mumbai"
+    assert set(body["trends"]) >= {"demographics", "trending_topics", "consumer_behavior", "opportunities"}
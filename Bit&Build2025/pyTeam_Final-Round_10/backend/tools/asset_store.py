@@ -0,0 +1,264 @@
+"""
+Asset Store - content-addressed blob storage for generated assets
+Blobs are keyed by the SHA-256 of their bytes and sharded two levels deep
+(blobs/ab/cd/abcd….png), so identical images are stored once and a blob's path -
+and its /assets URL - never changes meaning; they are served with far-future,
+immutable cache headers. A SQLite index counts references per owner (a campaign,
+or a workflow node) and gc() removes blobs nothing references any more.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Iterable, Tuple, Union
+
+# Unreferenced blobs younger than this are kept - a generation in progress references
+# its images only once they are done
+GC_GRACE_SECONDS = float(os.getenv("ASSET_GC_GRACE_SECONDS", "3600"))
+
+BLOB_PATTERN = re.compile(r"blobs/([0-9a-f]{2})/([0-9a-f]{2})/([0-9a-f]{64})\.(\w+)")
+
+
+class AssetStore:
+    """
+    Layout:
+    - <assets_dir>/blobs/<sha[:2]>/<sha[2:4]>/<sha>.<ext>  the blobs (served under /assets)
+    - <tmp_dir>/                                           in-progress writes, moved into blobs/
+    - <index_path>                                         SQLite: blobs and their owners
+    """
+    
+    def __init__(self, assets_dir: Optional[str] = None, index_path: Optional[str] = None, tmp_dir: Optional[str] = None):
+        self.assets_dir = Path(assets_dir or os.getenv("ASSETS_DIR", "./storage/assets"))
+        self.blobs_dir = self.assets_dir / "blobs"
+        # Outside the served directory, but on the same filesystem so moving a blob in is a rename
+        self.tmp_dir = Path(tmp_dir or os.getenv("ASSET_TMP_DIR", "./storage/tmp"))
+        self.index_path = Path(index_path or os.getenv("ASSET_INDEX_DB", "./storage/assets.db"))
+        for directory in (self.blobs_dir, self.tmp_dir, self.index_path.parent):
+            directory.mkdir(parents=True, exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.index_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._init_db()
+        
+        self.dedupe_hits = 0
+    
+    def _init_db(self) -> None:
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS blobs (
+                    sha256 TEXT PRIMARY KEY,
+                    ext TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at TEXT NOT NULL,
+                    touched_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS refs (
+                    sha256 TEXT NOT NULL,
+                    owner TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    PRIMARY KEY (sha256, owner)
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS refs_owner ON refs (owner)")
+            self._conn.commit()
+    
+    # Owners
+    
+    @staticmethod
+    def campaign_owner(campaign_id: str) -> str:
+        return f"campaign:{campaign_id}"
+    
+    @staticmethod
+    def node_owner(workflow_id: str, node_id: str) -> str:
+        return f"node:{workflow_id}/{node_id}"
+    
+    # Paths and URLs
+    
+    def blob_path(self, sha256: str, ext: str = "png") -> Path:
+        return self.blobs_dir / sha256[:2] / sha256[2:4] / f"{sha256}.{ext}"
+    
+    @staticmethod
+    def url_path(sha256: str, ext: str = "png") -> str:
+        """Immutable URL path of a blob (relative to the API host)"""
+        return f"/assets/blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}.{ext}"
+    
+    @staticmethod
+    def parse(path_or_url: Any) -> Optional[Tuple[str, str]]:
+        """(sha256, ext) of a blob path or URL, or None for anything else (legacy asset files)"""
+        if not isinstance(path_or_url, str):
+            return None
+        match = BLOB_PATTERN.search(path_or_url.replace("\\", "/"))
+        if match is None or match.group(3)[:2] != match.group(1) or match.group(3)[2:4] != match.group(2):
+            return None
+        return match.group(3), match.group(4)
+    
+    def url_for(self, path: Union[str, Path]) -> str:
+        """URL path of a file under the assets directory (a blob or one of its derivatives)"""
+        return "/assets/" + Path(path).relative_to(self.assets_dir).as_posix()
+    
+    def local_path(self, path_or_url: Any) -> Optional[Path]:
+        """Where the blob a path or URL points at lives on disk"""
+        parsed = self.parse(path_or_url)
+        return self.blob_path(*parsed) if parsed else None
+    
+    def temp_path(self, ext: str = "png") -> Path:
+        return self.tmp_dir / f"{uuid.uuid4().hex}.{ext}.part"
+    
+    # Writes (blocking - call through asyncio.to_thread from async code)
+    
+    def put_file(self, tmp_path: Union[str, Path], sha256: Optional[str] = None, ext: str = "png", owner: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Move a finished temp file into the store. sha256 is computed if the writer didn't
+        hash while writing; if the blob already exists the temp file is just dropped.
+        """
+        tmp_path = Path(tmp_path)
+        if sha256 is None:
+            sha256 = self._hash_file(tmp_path)
+        size = tmp_path.stat().st_size
+        path = self.blob_path(sha256, ext)
+        
+        with self._lock:
+            if path.exists():
+                tmp_path.unlink(missing_ok=True)
+                self.dedupe_hits += 1
+                deduped = True
+            else:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, path)
+                deduped = False
+            # Touching restarts the GC grace period, so a blob just produced again isn't collected
+            self._conn.execute(
+                "INSERT INTO blobs (sha256, ext, size, created_at, touched_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(sha256) DO UPDATE SET touched_at = excluded.touched_at",
+                (sha256, ext, size, datetime.now().isoformat(), time.time())
+            )
+            if owner:
+                self._add_ref(sha256, owner)
+            self._conn.commit()
+        
+        return {
+            "sha256": sha256,
+            "file_path": str(path),
+            "url": self.url_path(sha256, ext),
+            "bytes": size,
+            "deduped": deduped
+        }
+    
+    def put_bytes(self, data: Union[bytes, memoryview], ext: str = "png", owner: Optional[str] = None) -> Dict[str, Any]:
+        tmp_path = self.temp_path(ext)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        return self.put_file(tmp_path, hashlib.sha256(data).hexdigest(), ext, owner)
+    
+    @staticmethod
+    def _hash_file(path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    # References
+    
+    def _add_ref(self, sha256: str, owner: str) -> None:
+        self._conn.execute(
+            "INSERT OR IGNORE INTO refs (sha256, owner, created_at) VALUES (?, ?, ?)",
+            (sha256, owner, datetime.now().isoformat())
+        )
+    
+    def add_ref(self, sha256: str, owner: str) -> None:
+        with self._lock:
+            self._add_ref(sha256, owner)
+            self._conn.commit()
+    
+    def set_refs(self, owner: str, hashes: Iterable[str]) -> None:
+        """Make owner reference exactly these blobs - blobs it dropped lose a reference"""
+        with self._lock:
+            self._conn.execute("DELETE FROM refs WHERE owner = ?", (owner,))
+            for sha256 in set(hashes):
+                self._add_ref(sha256, owner)
+            self._conn.commit()
+    
+    def release(self, owner: str) -> int:
+        """Drop every reference an owner holds; returns how many"""
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM refs WHERE owner = ?", (owner,)).rowcount
+            self._conn.commit()
+        return removed
+    
+    def refcount(self, sha256: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM refs WHERE sha256 = ?", (sha256,)).fetchone()[0]
+    
+    def owner_blobs(self, owner: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT sha256 FROM refs WHERE owner = ? ORDER BY sha256", (owner,)).fetchall()
+        return [row["sha256"] for row in rows]
+    
+    # Garbage collection
+    
+    def gc(self, grace_seconds: Optional[float] = None, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Delete blobs with no references that weren't written within the grace period,
+        and temp files left behind by interrupted writes
+        """
+        cutoff = time.time() - (GC_GRACE_SECONDS if grace_seconds is None else grace_seconds)
+        removed, freed = [], 0
+        
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT sha256, ext, size FROM blobs "
+                "WHERE touched_at < ? AND NOT EXISTS (SELECT 1 FROM refs WHERE refs.sha256 = blobs.sha256)",
+                (cutoff,)
+            ).fetchall()
+            for row in rows:
+                removed.append(row["sha256"])
+                freed += row["size"]
+                if dry_run:
+                    continue
+                path = self.blob_path(row["sha256"], row["ext"])
+                path.unlink(missing_ok=True)
+                # Files derived from the blob (thumbnails) are named <sha>_<suffix> next to it
+                for derived in path.parent.glob(f"{row['sha256']}_*"):
+                    derived.unlink(missing_ok=True)
+                self._conn.execute("DELETE FROM blobs WHERE sha256 = ?", (row["sha256"],))
+            self._conn.commit()
+        
+        stale_temp = [path for path in self.tmp_dir.glob("*.part") if path.stat().st_mtime < cutoff]
+        if not dry_run:
+            for path in stale_temp:
+                path.unlink(missing_ok=True)
+        
+        return {
+            "removed_blobs": len(removed),
+            "freed_bytes": freed,
+            "removed_temp_files": len(stale_temp),
+            "dry_run": dry_run,
+            "blobs": removed
+        }
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            blobs, total_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+            unreferenced = self._conn.execute(
+                "SELECT COUNT(*) FROM blobs WHERE NOT EXISTS (SELECT 1 FROM refs WHERE refs.sha256 = blobs.sha256)"
+            ).fetchone()[0]
+            refs, owners = self._conn.execute("SELECT COUNT(*), COUNT(DISTINCT owner) FROM refs").fetchone()
+        return {
+            "blobs": blobs,
+            "bytes": total_bytes,
+            "unreferenced_blobs": unreferenced,
+            "refs": refs,
+            "owners": owners,
+            "dedupe_hits": self.dedupe_hits
+        }
@@ -0,0 +1,122 @@
+"""
+Checkpoint Store - durable per-tool-call progress of campaign asset generation
+The manifest is written when asset generation starts and every finished tool call
+is appended to the campaign's log as it completes, so a crash or restart loses at
+most the calls that were in flight. load() replays the log onto the manifest;
+resuming then skips every tool call that already has a successful result.
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+# Asset fields a tool call can change (see CampaignOrchestrator._run_asset_tool_call)
+ASSET_FIELDS = ("content", "url", "model", "provider", "safety", "metadata")
+
+
+class CheckpointStore:
+    """
+    Layout under checkpoints_dir, per campaign:
+    - <campaign_id>.json   the manifest as it was when asset generation (re)started
+    - <campaign_id>.jsonl  one line per finished tool call: its input, result, error
+                           and the asset fields after it ran
+    """
+    
+    def __init__(self, checkpoints_dir: Optional[str] = None):
+        self.checkpoints_dir = Path(checkpoints_dir or os.getenv("CHECKPOINTS_DIR", "./storage/checkpoints"))
+        self.checkpoints_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+    
+    def _manifest_path(self, campaign_id: str) -> Path:
+        return self.checkpoints_dir / f"{campaign_id}.json"
+    
+    def _log_path(self, campaign_id: str) -> Path:
+        return self.checkpoints_dir / f"{campaign_id}.jsonl"
+    
+    def exists(self, campaign_id: str) -> bool:
+        return self._manifest_path(campaign_id).exists()
+    
+    def start(self, manifest: Dict[str, Any]) -> None:
+        """Write the manifest; results already in the log stay valid and are replayed on load"""
+        path = self._manifest_path(manifest["campaign_id"])
+        tmp_path = path.with_suffix(".json.tmp")
+        with self._lock:
+            with open(tmp_path, "w") as f:
+                json.dump(manifest, f)
+                f.flush()
+                os.fsync(f.fileno())
+            # Atomic swap, so a crash mid-write leaves the previous manifest intact
+            os.replace(tmp_path, path)
+    
+    def record(self, campaign_id: str, asset: Dict[str, Any], tool_call_data: Dict[str, Any]) -> None:
+        """Append one finished tool call to the campaign's log"""
+        entry = {
+            "asset_id": asset["id"],
+            "tool_call_id": tool_call_data.get("id"),
+            "input": tool_call_data.get("input"),
+            "result": tool_call_data.get("result"),
+            "error": tool_call_data.get("error"),
+            "asset": {field: asset.get(field) for field in ASSET_FIELDS if field in asset},
+        }
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            with open(self._log_path(campaign_id), "a") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+    
+    def load(self, campaign_id: str) -> Optional[Dict[str, Any]]:
+        """The checkpointed manifest with every logged tool call result applied, or None"""
+        with self._lock:
+            path = self._manifest_path(campaign_id)
+            if not path.exists():
+                return None
+            with open(path, "r") as f:
+                manifest = json.load(f)
+            entries = self._read_log(campaign_id)
+        
+        assets = {asset["id"]: asset for asset in manifest.get("asset_plan", [])}
+        # Later lines win - a call that failed and then succeeded on resume ends up successful
+        for entry in entries:
+            asset = assets.get(entry.get("asset_id"))
+            if asset is None:
+                continue
+            for tool_call_data in asset.get("tool_calls", []):
+                if tool_call_data.get("id") != entry.get("tool_call_id"):
+                    continue
+                if entry.get("input") is not None:
+                    tool_call_data["input"] = entry["input"]
+                tool_call_data["result"] = entry.get("result")
+                if entry.get("error"):
+                    tool_call_data["error"] = entry["error"]
+                else:
+                    tool_call_data.pop("error", None)
+            asset.update(entry.get("asset") or {})
+        return manifest
+    
+    def _read_log(self, campaign_id: str) -> List[Dict[str, Any]]:
+        path = self._log_path(campaign_id)
+        if not path.exists():
+            return []
+        entries = []
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # A torn last line from an interrupted append - that call simply runs again
+                    continue
+        return entries
+    
+    def clear(self, campaign_id: str) -> None:
+        """Drop a campaign's checkpoint once the finished campaign is saved"""
+        with self._lock:
+            for path in (self._manifest_path(campaign_id), self._log_path(campaign_id)):
+                if path.exists():
+                    path.unlink()
+    
+    def list(self) -> List[str]:
+        """Campaign ids with an unfinished checkpoint"""
+        return sorted(path.stem for path in self.checkpoints_dir.glob("*.json"))
@@ -0,0 +1,113 @@
+"""
+Circuit Breaker - fail fast on a degraded model instead of waiting out timeouts
+Closed: calls flow and consecutive transient failures and slow calls are counted.
+The slow-call budget and the request timeout scale with the call's max_output_tokens,
+so long outputs aren't mistaken for a degraded model.
+Open: after too many consecutive failures every call is rejected immediately.
+Half-open: once the cooldown passes a single probe call is let through; its
+outcome closes the breaker again or re-opens it for another cooldown.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Any, Optional
+
+
+# Output budget LLM_BREAKER_SLOW_MS and LLM_REQUEST_TIMEOUT are set for; larger budgets get proportionally longer
+SLOW_CALL_REFERENCE_TOKENS = 1024
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a model whose breaker is open"""
+    
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"Circuit open for {name} (retry in {retry_in:.1f}s)")
+        self.name = name
+        self.retry_after = retry_in
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: Optional[int] = None,
+        slow_call_seconds: Optional[float] = None,
+        cooldown_seconds: Optional[float] = None,
+        timeout_seconds: Optional[float] = None
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold or int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+        self.slow_call_seconds = slow_call_seconds or float(os.getenv("LLM_BREAKER_SLOW_MS", "20000")) / 1000
+        self.timeout_seconds = timeout_seconds or float(os.getenv("LLM_REQUEST_TIMEOUT", "60"))
+        self.cooldown_seconds = cooldown_seconds or float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+        
+        self.state = "closed"
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        
+        self.rejected = 0
+        self.trips = 0
+    
+    def allow(self) -> None:
+        """Raise CircuitOpenError unless a call may go through now"""
+        with self._lock:
+            if self.state == "closed":
+                return
+            remaining = self._opened_at + self.cooldown_seconds - time.monotonic()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self.rejected += 1
+            raise CircuitOpenError(self.name, max(remaining, 0.0))
+    
+    @staticmethod
+    def _output_scale(max_output_tokens: Optional[int]) -> float:
+        # Long outputs legitimately take longer
+        return max(1.0, (max_output_tokens or SLOW_CALL_REFERENCE_TOKENS) / SLOW_CALL_REFERENCE_TOKENS)
+    
+    def slow_call_budget(self, max_output_tokens: Optional[int] = None) -> float:
+        """Seconds a call may take before it counts as slow"""
+        return self.slow_call_seconds * self._output_scale(max_output_tokens)
+    
+    def request_timeout(self, max_output_tokens: Optional[int] = None) -> float:
+        """Seconds before a call is abandoned - a hung call then fails and is counted"""
+        return self.timeout_seconds * self._output_scale(max_output_tokens)
+    
+    def record_success(self, duration: float, max_output_tokens: Optional[int] = None) -> None:
+        if duration > self.slow_call_budget(max_output_tokens):
+            # Too slow for its output budget - counts toward tripping the breaker like an error
+            self.record_failure()
+            return
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            self.state = "closed"
+    
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.trips += 1
+                self.state = "open"
+                self._opened_at = time.monotonic()
+    
+    def release(self) -> None:
+        """The call ended without a verdict (e.g. a request error) - free the probe slot"""
+        with self._lock:
+            self._probe_in_flight = False
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self._failures,
+                "trips": self.trips,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,102 @@
+"""
+Embedding Batcher - coalesces concurrent compute_embedding calls into batched requests
+Texts submitted within a short window (or until the batch is full) are sent to the
+provider in one call and the vectors are split back to each waiting caller, so N
+embedding tool calls cost ceil(N / batch_size) round trips instead of N.
+If the provider rejects a batch (a non-retryable error), its texts are embedded one
+by one so a single bad text only fails its own caller. Transient failures (429, 503,
+timeouts) fail the whole batch and are left to the callers' retry backoff.
+"""
+
+import asyncio
+import os
+from typing import Dict, List, Tuple, Callable, Awaitable, Optional
+
+from tools.retry import error_details, is_retryable
+
+
+class EmbeddingBatcher:
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], Awaitable[List[List[float]]]],
+        max_batch_size: Optional[int] = None,
+        window_ms: Optional[float] = None
+    ):
+        self.embed_batch = embed_batch
+        # text-embedding-004 accepts up to 100 texts per batch request
+        self.max_batch_size = max_batch_size or int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+        self.window = (window_ms if window_ms is not None else float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "15"))) / 1000
+        
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        
+        self.batches_sent = 0
+        self.texts_embedded = 0
+    
+    async def embed(self, text: str) -> List[float]:
+        """Queue a text for the next batch and wait for its vector"""
+        # The provider rejects empty content, which would fail the whole batch
+        if not text or not text.strip():
+            raise ValueError("Cannot embed empty text")
+        
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        
+        return await future
+    
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        pending, self._pending = self._pending, []
+        for start in range(0, len(pending), self.max_batch_size):
+            task = asyncio.create_task(self._run(pending[start:start + self.max_batch_size]))
+            # Keep a reference so the task isn't garbage collected mid-flight
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        # Callers that gave up before the flush don't need a vector
+        batch = [(text, future) for text, future in batch if not future.done()]
+        if not batch:
+            return
+        
+        # Identical texts in one batch are embedded once
+        unique_texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            by_text = await self._embed(unique_texts)
+        except Exception as e:
+            if len(unique_texts) == 1 or is_retryable(error_details(e)):
+                # Re-sending every text on its own would turn one rate-limited call into N more
+                by_text = {text: e for text in unique_texts}
+            else:
+                # Find the text the provider rejected - the rest of the batch still gets its vectors
+                results = await asyncio.gather(*(self._embed([text]) for text in unique_texts), return_exceptions=True)
+                by_text = {}
+                for text, result in zip(unique_texts, results):
+                    by_text[text] = result if isinstance(result, Exception) else result[text]
+        
+        for text, future in batch:
+            if future.done():
+                continue
+            if isinstance(by_text[text], Exception):
+                future.set_exception(by_text[text])
+            else:
+                future.set_result(by_text[text])
+    
+    async def _embed(self, texts: List[str]) -> Dict[str, List[float]]:
+        vectors = await self.embed_batch(texts)
+        if len(vectors) != len(texts):
+            raise ValueError(f"Expected {len(texts)} embeddings, got {len(vectors)}")
+        
+        self.batches_sent += 1
+        self.texts_embedded += len(texts)
+        return dict(zip(texts, vectors))
@@ -0,0 +1,276 @@
+"""
+Embedding Store - persistent, deduplicated storage for asset alignment vectors
+Vectors are keyed by a hash of (model, text), appended to a float32 binary file and
+read back through a memory map, so manifests only carry vector IDs and the same text
+is never embedded twice. Asset links make "similar assets across campaigns" a single
+matrix product over the stored vectors.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+
+import numpy as np
+
+EMBEDDING_MODEL = "models/text-embedding-004"
+
+
+class EmbeddingStore:
+    """
+    Layout under store_dir:
+    - vectors.f32   append-only float32 rows
+    - vectors.jsonl one {"id", "row"} line per stored vector
+    - meta.json     model and dimensions
+    - links.json    vector id -> assets ({campaign_id, asset_id, asset_type}) using it
+    """
+    
+    def __init__(self, store_dir: Optional[str] = None, model: str = EMBEDDING_MODEL):
+        self.store_dir = Path(store_dir or os.getenv("EMBEDDINGS_DIR", "./storage/embeddings"))
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.model = model
+        
+        self._vectors_path = self.store_dir / "vectors.f32"
+        self._keys_path = self.store_dir / "vectors.jsonl"
+        self._meta_path = self.store_dir / "meta.json"
+        self._links_path = self.store_dir / "links.json"
+        
+        self._lock = threading.Lock()
+        self._rows: Dict[str, int] = {}
+        self._links: Dict[str, List[Dict[str, Any]]] = {}
+        self._dim: Optional[int] = None
+        self._memmap: Optional[np.memmap] = None
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        
+        self.dedupe_hits = 0
+        self._load()
+    
+    def _load(self) -> None:
+        if self._meta_path.exists():
+            with open(self._meta_path, "r") as f:
+                self._dim = json.load(f).get("dim")
+        
+        if self._keys_path.exists():
+            torn = False
+            with open(self._keys_path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        torn = True
+                        continue
+                    self._rows[entry["id"]] = entry["row"]
+            if torn:
+                # Drop the torn line left by an interrupted write; its row is rewritten on next append
+                with open(self._keys_path, "w") as f:
+                    for vector_id, row in sorted(self._rows.items(), key=lambda item: item[1]):
+                        f.write(json.dumps({"id": vector_id, "row": row}) + "\n")
+        
+        if self._links_path.exists():
+            with open(self._links_path, "r") as f:
+                self._links = json.load(f)
+    
+    def make_id(self, text: str) -> str:
+        """Content address of a text under the store's embedding model"""
+        digest = hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).hexdigest()
+        return f"emb_{digest[:32]}"
+    
+    def __contains__(self, vector_id: str) -> bool:
+        return vector_id in self._rows
+    
+    def __len__(self) -> int:
+        return len(self._rows)
+    
+    # Vector storage
+    
+    def _matrix(self) -> np.ndarray:
+        """Memory-mapped view of every stored row (callers hold the lock)"""
+        rows = len(self._rows)
+        if rows == 0 or self._dim is None:
+            return np.empty((0, self._dim or 0), dtype=np.float32)
+        if self._memmap is None or self._memmap.shape[0] != rows:
+            self._memmap = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self._dim))
+        return self._memmap
+    
+    def put(self, vector_id: str, vector: List[float]) -> None:
+        """Append a vector under vector_id (no-op if it is already stored)"""
+        data = np.asarray(vector, dtype=np.float32).reshape(-1)
+        with self._lock:
+            if vector_id in self._rows:
+                return
+            if self._dim is None:
+                self._dim = len(data)
+                with open(self._meta_path, "w") as f:
+                    json.dump({"model": self.model, "dim": self._dim}, f)
+            elif len(data) != self._dim:
+                raise ValueError(f"Expected {self._dim}-dimensional vector, got {len(data)}")
+            
+            row = len(self._rows)
+            mode = "r+b" if self._vectors_path.exists() else "wb"
+            with open(self._vectors_path, mode) as f:
+                f.seek(row * self._dim * 4)
+                f.write(data.tobytes())
+            with open(self._keys_path, "a") as f:
+                f.write(json.dumps({"id": vector_id, "row": row}) + "\n")
+            self._rows[vector_id] = row
+    
+    def get(self, vector_id: str) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._rows.get(vector_id)
+            if row is None:
+                return None
+            return np.array(self._matrix()[row])
+    
+    async def aget_or_compute(
+        self,
+        text: str,
+        compute: Callable[[str], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """
+        Return {"success", "vector_id", "dimensions", "deduplicated"} for text,
+        calling compute (a compute_embedding tool) only if the text was never embedded.
+        Concurrent requests for the same text share one compute call.
+        """
+        vector_id = self.make_id(text)
+        if vector_id in self._rows:
+            self.dedupe_hits += 1
+            return {"success": True, "vector_id": vector_id, "dimensions": self._dim, "deduplicated": True}
+        
+        pending = self._in_flight.get(vector_id)
+        if pending is not None:
+            result = await asyncio.shield(pending)
+            if result.get("success"):
+                self.dedupe_hits += 1
+                return {**result, "deduplicated": True}
+            return result
+        
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[vector_id] = future
+        # Stays in place if this call is cancelled, so callers waiting on the same text never hang
+        result: Dict[str, Any] = {"success": False, "error": "Embedding cancelled"}
+        try:
+            computed = await compute(text)
+            if not computed.get("success"):
+                result = computed
+            else:
+                await asyncio.to_thread(self.put, vector_id, computed["embedding"])
+                result = {
+                    "success": True,
+                    "vector_id": vector_id,
+                    "dimensions": len(computed["embedding"]),
+                    "deduplicated": False
+                }
+        except Exception as e:
+            result = {"success": False, "error": str(e), "error_type": type(e).__name__}
+        finally:
+            self._in_flight.pop(vector_id, None)
+            future.set_result(result)
+        
+        return result
+    
+    # Asset links
+    
+    def link_assets(self, campaign_id: str, assets: List[Dict[str, Any]]) -> None:
+        """
+        Record which assets use which vectors, replacing previous links of those assets
+        Expected input: [{"asset_id": str, "vector_id": str, "asset_type": str}]
+        """
+        asset_ids = {a["asset_id"] for a in assets}
+        with self._lock:
+            for vector_id in list(self._links):
+                kept = [
+                    ref for ref in self._links[vector_id]
+                    if not (ref["campaign_id"] == campaign_id and ref["asset_id"] in asset_ids)
+                ]
+                if kept:
+                    self._links[vector_id] = kept
+                else:
+                    del self._links[vector_id]
+            
+            for a in assets:
+                self._links.setdefault(a["vector_id"], []).append({
+                    "campaign_id": campaign_id,
+                    "asset_id": a["asset_id"],
+                    "asset_type": a.get("asset_type")
+                })
+            
+            tmp_path = self._links_path.with_suffix(".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(self._links, f)
+            os.replace(tmp_path, self._links_path)
+    
+    def campaign_vectors(self, campaign_id: str) -> List[str]:
+        with self._lock:
+            return [
+                vector_id for vector_id, refs in self._links.items()
+                if any(ref["campaign_id"] == campaign_id for ref in refs)
+            ]
+    
+    def similar(
+        self,
+        vector_ids: List[str],
+        top_k: int = 5,
+        include_same_campaign: bool = False,
+        min_score: float = 0.0
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Bulk nearest-asset query: for each vector id, the top_k most similar linked
+        assets (cosine similarity), by default only from other campaigns
+        """
+        with self._lock:
+            queries = [v for v in vector_ids if v in self._rows]
+            candidates = [v for v in self._links if v in self._rows]
+            if not queries or not candidates:
+                return {v: [] for v in vector_ids}
+            
+            matrix = self._matrix()
+            query_vectors = np.asarray(matrix[[self._rows[v] for v in queries]])
+            candidate_vectors = np.asarray(matrix[[self._rows[v] for v in candidates]])
+            links = {v: list(self._links[v]) for v in set(candidates) | set(queries) if v in self._links}
+        
+        def unit(m: np.ndarray) -> np.ndarray:
+            norms = np.linalg.norm(m, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            return m / norms
+        
+        scores = unit(query_vectors) @ unit(candidate_vectors).T
+        
+        results: Dict[str, List[Dict[str, Any]]] = {v: [] for v in vector_ids}
+        for q, vector_id in enumerate(queries):
+            own_refs = links.get(vector_id, [])
+            own_campaigns = {ref["campaign_id"] for ref in own_refs}
+            own_assets = {(ref["campaign_id"], ref["asset_id"]) for ref in own_refs}
+            
+            # Over-fetch a little since filtered candidates drop out
+            k = min(len(candidates), top_k * 4 + len(own_refs))
+            top = np.argpartition(-scores[q], k - 1)[:k]
+            top = top[np.argsort(-scores[q][top])]
+            
+            matches = []
+            for c in top.tolist():
+                score = float(scores[q][c])
+                if score < min_score or len(matches) >= top_k:
+                    break
+                for ref in links[candidates[c]]:
+                    if (ref["campaign_id"], ref["asset_id"]) in own_assets:
+                        continue
+                    if not include_same_campaign and ref["campaign_id"] in own_campaigns:
+                        continue
+                    matches.append({**ref, "vector_id": candidates[c], "score": round(score, 4)})
+                    if len(matches) >= top_k:
+                        break
+            results[vector_id] = matches
+        return results
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "vectors": len(self._rows),
+                "dimensions": self._dim,
+                "linked_vectors": len(self._links),
+                "dedupe_hits": self.dedupe_hits,
+                "bytes": len(self._rows) * (self._dim or 0) * 4
+            }
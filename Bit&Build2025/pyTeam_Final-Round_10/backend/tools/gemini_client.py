@@ -0,0 +1,296 @@
+"""
+Gemini Client Registry - shared SDK configuration and GenerativeModel instances
+The SDK is configured once per process and models are cached by name (bounded LRU),
+so every caller reuses the same model objects and underlying client channels.
+Generation config is passed per request instead of being baked into the model.
+Models are handed out wrapped in GovernedModel, so every generate call goes through
+the process-wide rate governor and the model's circuit breaker. generate_with_fallback
+walks the LLM_FALLBACK_MODELS chain when a model is failing.
+A static system prompt can be passed as system_instruction; when it is large enough
+for Gemini context caching it is uploaded once and reused instead of resent.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Dict, Optional, List, Tuple
+
+import google.generativeai as genai
+from google.generativeai import caching
+
+from tools.rate_limiter import get_governor, estimate_tokens
+from tools.prompt_budget import token_ledger, context_cache_eligible, CONTEXT_CACHE_TTL
+from tools.circuit_breaker import CircuitBreaker
+from tools.retry import error_details, is_retryable
+from tools.telemetry import add_queue_wait, add_usage
+
+DEFAULT_MODEL = "gemini-2.0-flash-exp"
+
+# Maximum number of distinct model names kept alive at once
+MODEL_CACHE_SIZE = 8
+
+_lock = threading.Lock()
+_configured = False
+_models: "OrderedDict[str, GovernedModel]" = OrderedDict()
+# Breakers outlive evicted models so a failing model stays tripped
+_breakers_lock = threading.Lock()
+_breakers: "dict[str, CircuitBreaker]" = {}
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "code", None) == 429 or type(error).__name__ == "ResourceExhausted"
+
+
+def _total_tokens(response: Any) -> Optional[int]:
+    usage = getattr(response, "usage_metadata", None)
+    total = getattr(usage, "total_token_count", None) if usage else None
+    return total if isinstance(total, int) and total > 0 else None
+
+
+def _max_output_tokens(generation_config: Any) -> Optional[int]:
+    if isinstance(generation_config, dict):
+        return generation_config.get("max_output_tokens")
+    return getattr(generation_config, "max_output_tokens", None)
+
+
+def get_breaker(model_name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(model_name)
+        if breaker is None:
+            breaker = CircuitBreaker(model_name)
+            _breakers[model_name] = breaker
+        return breaker
+
+
+class GovernedModel:
+    """
+    GenerativeModel wrapper that fails fast (CircuitOpenError) while the model's breaker
+    is open, waits for rate-governor budget before each call and settles the token charge
+    with the usage Gemini reports. Accepts an optional priority= ("interactive" /
+    "default" / "background") on generate calls.
+    """
+    
+    def __init__(self, model: genai.GenerativeModel, model_name: str):
+        self.model = model
+        self.model_name = model_name
+        self.governor = get_governor("gemini")
+        self.breaker = get_breaker(model_name)
+        # Set for models bound to a context cache, which Gemini drops after its TTL
+        self.expires_at: Optional[float] = None
+    
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.model, name)
+    
+    def _record_error(self, error: BaseException) -> None:
+        if not isinstance(error, Exception):
+            # Cancelled - no verdict on the model's health
+            self.breaker.release()
+            return
+        if _is_rate_limited(error):
+            self.governor.throttle()
+        if is_retryable(error_details(error)):
+            self.breaker.record_failure()
+        else:
+            # Bad requests say nothing about the model's health
+            self.breaker.release()
+    
+    def _with_timeout(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Add the breaker's request timeout unless the caller set one"""
+        request_options = dict(kwargs.get("request_options") or {})
+        request_options.setdefault(
+            "timeout", self.breaker.request_timeout(_max_output_tokens(kwargs.get("generation_config")))
+        )
+        return {**kwargs, "request_options": request_options}
+    
+    @staticmethod
+    def _settle(response: Any, governor: Any, estimate: int) -> None:
+        governor.settle(estimate, _total_tokens(response))
+        token_ledger.record(getattr(response, "usage_metadata", None))
+        add_usage(getattr(response, "usage_metadata", None))
+    
+    def generate_content(self, contents: Any, priority: Optional[str] = None, **kwargs) -> Any:
+        self.breaker.allow()
+        estimate = estimate_tokens(contents, kwargs.get("generation_config"))
+        started = time.monotonic()
+        try:
+            self.governor.acquire(estimate, priority)
+            add_queue_wait(time.monotonic() - started)
+            started = time.monotonic()
+            response = self.model.generate_content(contents, **self._with_timeout(kwargs))
+        except BaseException as e:
+            self._record_error(e)
+            raise
+        self.breaker.record_success(time.monotonic() - started, _max_output_tokens(kwargs.get("generation_config")))
+        if kwargs.get("stream"):
+            # Usage is only known once the stream is consumed - see settle_stream
+            response._governor_estimate = (self.governor, estimate)
+        else:
+            self._settle(response, self.governor, estimate)
+        return response
+    
+    async def generate_content_async(self, contents: Any, priority: Optional[str] = None, **kwargs) -> Any:
+        self.breaker.allow()
+        estimate = estimate_tokens(contents, kwargs.get("generation_config"))
+        started = time.monotonic()
+        try:
+            await self.governor.aacquire(estimate, priority)
+            add_queue_wait(time.monotonic() - started)
+            started = time.monotonic()
+            response = await self.model.generate_content_async(contents, **self._with_timeout(kwargs))
+        except BaseException as e:
+            self._record_error(e)
+            raise
+        self.breaker.record_success(time.monotonic() - started, _max_output_tokens(kwargs.get("generation_config")))
+        if kwargs.get("stream"):
+            # Usage is only known once the stream is consumed - see settle_stream
+            response._governor_estimate = (self.governor, estimate)
+        else:
+            self._settle(response, self.governor, estimate)
+        return response
+
+
+def configure() -> None:
+    """Configure the Gemini SDK with GOOGLE_API_KEY (idempotent)"""
+    global _configured
+    with _lock:
+        if _configured:
+            return
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY not found in environment variables")
+        genai.configure(api_key=api_key)
+        _configured = True
+
+
+def _build_model(model_name: str, system_instruction: Optional[str]) -> GovernedModel:
+    if context_cache_eligible(system_instruction):
+        try:
+            cached = caching.CachedContent.create(
+                model=f"models/{model_name}",
+                system_instruction=system_instruction,
+                ttl=timedelta(seconds=CONTEXT_CACHE_TTL)
+            )
+            model = GovernedModel(genai.GenerativeModel.from_cached_content(cached), model_name)
+            # Rebuild a little before Gemini expires the cache
+            model.expires_at = time.monotonic() + CONTEXT_CACHE_TTL * 0.9
+            return model
+        except Exception as e:
+            print(f"⚠ Context cache unavailable for {model_name}, sending the system prompt inline: {e}")
+    return GovernedModel(genai.GenerativeModel(model_name=model_name, system_instruction=system_instruction), model_name)
+
+
+def get_model(model_name: str = DEFAULT_MODEL, system_instruction: Optional[str] = None) -> GovernedModel:
+    """Return the shared (rate-governed) GenerativeModel for model_name (+ system prompt), creating it on first use"""
+    configure()
+    key = model_name
+    if system_instruction:
+        key = f"{model_name}#{hashlib.sha256(system_instruction.encode('utf-8')).hexdigest()[:16]}"
+    with _lock:
+        model = _models.get(key)
+        if model is not None and (model.expires_at is None or model.expires_at > time.monotonic()):
+            _models.move_to_end(key)
+            return model
+    
+    # Built outside the lock - creating a context cache is a network call
+    model = _build_model(model_name, system_instruction)
+    with _lock:
+        _models[key] = model
+        _models.move_to_end(key)
+        while len(_models) > MODEL_CACHE_SIZE:
+            _models.popitem(last=False)
+    return model
+
+
+def fallback_chain(model_name: str = DEFAULT_MODEL) -> List[str]:
+    """model_name followed by the LLM_FALLBACK_MODELS chain (comma-separated, in order)"""
+    fallbacks = os.getenv("LLM_FALLBACK_MODELS", "gemini-1.5-flash,gemini-1.5-flash-8b")
+    models = [model_name] + [m.strip() for m in fallbacks.split(",") if m.strip()]
+    return list(dict.fromkeys(models))
+
+
+def is_unavailable(failure: Any) -> bool:
+    """
+    True when a failure (exception or failed tool result) means Gemini itself is unavailable -
+    open breakers, or transient errors on every model of the chain. Bad requests, invalid keys
+    and schema problems return False, so callers report them instead of covering them up.
+    """
+    details = failure if isinstance(failure, dict) else error_details(failure)
+    return details.get("error_type") == "CircuitOpenError" or is_retryable(details)
+
+
+def generate_with_fallback(
+    contents: Any, model_name: str = DEFAULT_MODEL, system_instruction: Optional[str] = None, **kwargs
+) -> Tuple[Any, str]:
+    """generate_content on the first healthy model of the chain; returns (response, model used)"""
+    last_error: Optional[Exception] = None
+    for name in fallback_chain(model_name):
+        try:
+            return get_model(name, system_instruction).generate_content(contents, **kwargs), name
+        except Exception as e:
+            # Open breakers and transient provider failures move on to the next model;
+            # a malformed request would fail the same way everywhere
+            if not is_unavailable(e):
+                raise
+            last_error = e
+    raise last_error
+
+
+async def agenerate_with_fallback(
+    contents: Any, model_name: str = DEFAULT_MODEL, system_instruction: Optional[str] = None, **kwargs
+) -> Tuple[Any, str]:
+    """Async variant of generate_with_fallback"""
+    last_error: Optional[Exception] = None
+    for name in fallback_chain(model_name):
+        try:
+            return await get_model(name, system_instruction).generate_content_async(contents, **kwargs), name
+        except Exception as e:
+            # Open breakers and transient provider failures move on to the next model;
+            # a malformed request would fail the same way everywhere
+            if not is_unavailable(e):
+                raise
+            last_error = e
+    raise last_error
+
+
+def settle_stream(response: Any) -> None:
+    """Settle a consumed stream's token estimate with the usage Gemini reported at its end"""
+    pending = getattr(response, "_governor_estimate", None)
+    if pending is None:
+        return
+    response._governor_estimate = None
+    GovernedModel._settle(response, *pending)
+
+
+def breaker_stats() -> dict:
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {name: breaker.stats() for name, breaker in breakers.items()}
+
+
+def embed_content(model: str, content: Any, priority: Optional[str] = None) -> Any:
+    """genai.embed_content under the embedding quota's rate governor"""
+    configure()
+    governor = get_governor("gemini_embed")
+    governor.acquire(len(str(content)) // 4, priority)
+    try:
+        return genai.embed_content(model=model, content=content)
+    except Exception as e:
+        if _is_rate_limited(e):
+            governor.throttle()
+        raise
+
+
+async def embed_content_async(model: str, content: Any, priority: Optional[str] = None) -> Any:
+    """genai.embed_content_async under the embedding quota's rate governor"""
+    configure()
+    governor = get_governor("gemini_embed")
+    await governor.aacquire(len(str(content)) // 4, priority)
+    try:
+        return await genai.embed_content_async(model=model, content=content)
+    except Exception as e:
+        if _is_rate_limited(e):
+            governor.throttle()
+        raise
@@ -0,0 +1,114 @@
+"""
+Image Derivatives - thumbnail and medium renditions of generated and uploaded images
+Full 1024x1024 PNGs are megabytes each; cards and canvases only need a few hundred
+pixels. Derivatives are resized with Pillow and encoded as WebP (or JPEG) in a
+process pool, so decoding and encoding never run on the event loop - not even in
+one of its threads, where they would hold the GIL.
+
+A derivative is written next to its source as <stem>_<size>.<format>. For asset
+store blobs the stem is the content hash, so derivative paths are immutable too.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple, Union
+
+from PIL import Image
+
+# Longest edge in pixels per derivative
+DERIVATIVE_SIZES: Tuple[Tuple[str, int], ...] = (("thumb", 256), ("medium", 768))
+DERIVATIVE_FORMAT = os.getenv("IMAGE_DERIVATIVE_FORMAT", "webp").lower()
+DERIVATIVE_QUALITY = int(os.getenv("IMAGE_DERIVATIVE_QUALITY", "80"))
+DERIVATIVE_WORKERS = int(os.getenv("IMAGE_DERIVATIVE_WORKERS", "2"))
+
+_EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def render_derivatives(
+    source_path: str,
+    out_dir: str,
+    stem: str,
+    sizes: Tuple[Tuple[str, int], ...] = DERIVATIVE_SIZES,
+    image_format: str = DERIVATIVE_FORMAT,
+    quality: int = DERIVATIVE_QUALITY
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Write each size of source_path into out_dir (runs in a pool worker process)
+    Returns {size name: {"path", "width", "height", "bytes"}}; existing derivatives are reused.
+    """
+    extension = _EXTENSIONS[image_format]
+    targets = {name: Path(out_dir) / f"{stem}_{name}.{extension}" for name, _ in sizes}
+    results: Dict[str, Dict[str, Any]] = {}
+    
+    missing = []
+    for name, edge in sizes:
+        target = targets[name]
+        if not target.exists():
+            missing.append((name, edge))
+            continue
+        # Already rendered - only the header is read for its dimensions
+        with Image.open(target) as existing:
+            results[name] = _describe(target, existing.size)
+    if not missing:
+        return results
+    
+    with Image.open(source_path) as source:
+        source.load()
+        image = source.convert("RGB") if image_format == "jpeg" and source.mode not in ("RGB", "L") else source
+        for name, edge in missing:
+            resized = image.copy()
+            resized.thumbnail((edge, edge), Image.LANCZOS)
+            target = targets[name]
+            tmp_path = target.with_name(f"{target.name}.{os.getpid()}.part")
+            if image_format == "webp":
+                resized.save(tmp_path, format="WEBP", quality=quality, method=4)
+            else:
+                resized.save(tmp_path, format="JPEG", quality=quality, optimize=True, progressive=True)
+            # Readers only ever see a complete file
+            os.replace(tmp_path, target)
+            results[name] = _describe(target, resized.size)
+    return results
+
+
+def _describe(path: Path, size: Tuple[int, int]) -> Dict[str, Any]:
+    return {"path": str(path), "width": size[0], "height": size[1], "bytes": path.stat().st_size}
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=DERIVATIVE_WORKERS)
+    return _pool
+
+
+async def agenerate_derivatives(
+    source_path: Union[str, Path],
+    out_dir: Optional[Union[str, Path]] = None,
+    stem: Optional[str] = None
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Render the derivatives of an image in the process pool
+    Defaults to the source's directory and file stem. Failures are logged and return {} -
+    the full-size image is still there to fall back on.
+    """
+    source_path = Path(source_path)
+    out_dir = Path(out_dir) if out_dir is not None else source_path.parent
+    stem = stem or source_path.stem
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_pool(), render_derivatives, str(source_path), str(out_dir), stem)
+    except Exception as e:
+        print(f"⚠ Image derivatives failed for {source_path.name}: {e}")
+        return {}
+
+
+def shutdown() -> None:
+    """Stop the worker processes (app shutdown)"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
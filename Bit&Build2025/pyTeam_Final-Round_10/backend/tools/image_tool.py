@@ -1,12 +1,36 @@
 import requests
+import httpx
+import aiofiles
+import asyncio
+import functools
+import hashlib
 import os
-from typing import Dict, Any
+import random
+from typing import Dict, Any, List, Optional
 import time
 import base64
-from pathlib import Path
+
+from tools.asset_store import AssetStore
+from tools import perceptual_hash
+from tools.retry import error_details, response_error_details
+from tools.single_flight import SingleFlight
+from tools.telemetry import instrument
+
+# Concurrent requests to the Hugging Face endpoint (variants and separate calls share it)
+PROVIDER_CONCURRENCY = int(os.getenv("IMAGE_PROVIDER_CONCURRENCY", "3"))
+# Most variants one call may ask for
+MAX_VARIANTS = int(os.getenv("IMAGE_MAX_VARIANTS", "4"))
+# Extra generations one call may spend replacing near-duplicate variants
+NEAR_DUPLICATE_BUDGET = int(os.getenv("IMAGE_NEAR_DUPLICATE_BUDGET", "2"))
+# Model-loading 503s: how often to wait for the model, and the longest single wait
+MAX_WARMUP_WAITS = 2
+MAX_WARMUP_SECONDS = float(os.getenv("IMAGE_MAX_WARMUP_SECONDS", "60"))
+DEFAULT_WARMUP_SECONDS = 20.0
+# Generated images are streamed to disk CHUNK_SIZE bytes at a time
+CHUNK_SIZE = 64 * 1024
 
 class ImageTool:
-    def __init__(self):
+    def __init__(self, asset_store: Optional[AssetStore] = None):
         self.api_token = os.getenv("HUGGINGFACE_API_TOKEN")
         if not self.api_token:
             raise ValueError("HUGGINGFACE_API_TOKEN not found in environment variables")
@@ -14,7 +38,161 @@ class ImageTool:
         # Using Stable Diffusion XL on Hugging Face
         self.api_url = "https://api-inference.huggingface.co/models/stabilityai/stable-diffusion-xl-base-1.0"
         self.headers = {"Authorization": f"Bearer {self.api_token}"}
+        # Images are streamed into the content-addressed asset store
+        self.asset_store = asset_store or AssetStore()
+        
+        # Identical concurrent generations share one Hugging Face request
+        self.single_flight = SingleFlight("image_generate")
+        
+        # Keep-alive connections: a requests session for sync calls, one pooled AsyncClient
+        # (created on first use, on the running loop) for async calls
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=httpx.Timeout(60, connect=10),
+                limits=httpx.Limits(
+                    max_connections=PROVIDER_CONCURRENCY,
+                    max_keepalive_connections=PROVIDER_CONCURRENCY,
+                    keepalive_expiry=60
+                )
+            )
+            self._client_loop = loop
+            self._semaphore = asyncio.Semaphore(PROVIDER_CONCURRENCY)
+        return self._client
+    
+    async def aclose(self) -> None:
+        """Close the pooled connections (app shutdown)"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self.session.close()
+        
+    def _build_payload(self, tool_input: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the Hugging Face API payload from a tool input"""
+        prompt = tool_input.get("prompt", "")
+        seed = tool_input.get("seed")
+        
+        # Hugging Face API payload
+        payload = {
+            "inputs": prompt,
+            "parameters": {
+                "num_inference_steps": 30,
+            }
+        }
         
+        if seed is not None:
+            payload["parameters"]["seed"] = seed
+        
+        return payload
+    
+    @staticmethod
+    def _file_result(blob: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "success": True,
+            "file_path": blob["file_path"],
+            "url": blob["url"],
+            "sha256": blob["sha256"],
+            "bytes": blob["bytes"],
+            "format": "png",
+            "provider": "huggingface",
+            "model": "stable-diffusion-xl-base-1.0"
+        }
+    
+    @staticmethod
+    def _error_response(status_code: int, text: str, headers: Any = None) -> Dict[str, Any]:
+        return {
+            "success": False,
+            **response_error_details(status_code, headers, text)
+        }
+    
+    @staticmethod
+    def _read_base64(file_path: str) -> str:
+        """Base64 of a saved image - only for callers that ask for it (return_base64)"""
+        with open(file_path, "rb") as f:
+            return base64.b64encode(f.read()).decode('utf-8')
+    
+    def _stream_to_store(self, response: requests.Response) -> Dict[str, Any]:
+        """Write a streamed response body to a temp file chunk by chunk, hashing as it goes, then store it"""
+        part_path = self.asset_store.temp_path("png")
+        digest = hashlib.sha256()
+        try:
+            with open(part_path, "wb") as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+            # Only a complete image ever reaches the store
+            return self.asset_store.put_file(part_path, digest.hexdigest(), "png")
+        except BaseException:
+            part_path.unlink(missing_ok=True)
+            raise
+    
+    async def _astream_to_store(self, response: httpx.Response) -> Dict[str, Any]:
+        """Async _stream_to_store - file writes don't block the event loop"""
+        part_path = self.asset_store.temp_path("png")
+        digest = hashlib.sha256()
+        try:
+            async with aiofiles.open(part_path, "wb") as f:
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    await f.write(chunk)
+                    digest.update(chunk)
+            return await asyncio.to_thread(self.asset_store.put_file, part_path, digest.hexdigest(), "png")
+        except BaseException:
+            part_path.unlink(missing_ok=True)
+            raise
+    
+    @staticmethod
+    def _warmup_wait(result: Dict[str, Any]) -> Optional[float]:
+        """Seconds to wait for a loading model (its estimated_time), or None if the failure isn't a warm-up"""
+        if result.get("status_code") != 503:
+            return None
+        return min(result.get("retry_after") or DEFAULT_WARMUP_SECONDS, MAX_WARMUP_SECONDS)
+    
+    @staticmethod
+    def _variant_inputs(tool_input: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        One input per requested variant. Variants need distinct seeds - identical inputs
+        would be coalesced (and cached by the provider) into the same image.
+        """
+        n = max(1, min(int(tool_input.get("n") or 1), MAX_VARIANTS))
+        if n == 1:
+            return [tool_input]
+        seed = tool_input.get("seed")
+        seeds = [seed + i for i in range(n)] if seed is not None else random.sample(range(1, 2**31), n)
+        return [{**tool_input, "seed": variant_seed, "n": 1} for variant_seed in seeds]
+    
+    @staticmethod
+    def _combine_variants(variant_inputs: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """n > 1: every successful variant under "variants"; file_path is the first of them"""
+        variants = [
+            {
+                "file_path": result["file_path"],
+                "url": result["url"],
+                "sha256": result["sha256"],
+                "bytes": result["bytes"],
+                "seed": variant_input.get("seed"),
+                **({"phash": result["phash"]} if "phash" in result else {}),
+                **({"image_data": result["image_data"]} if "image_data" in result else {})
+            }
+            for variant_input, result in zip(variant_inputs, results)
+            if result.get("success")
+        ]
+        if not variants:
+            # Every variant failed - report the first failure (status, retry_after) as the call's
+            return results[0]
+        first = next(result for result in results if result.get("success"))
+        combined = {**first, "variants": variants}
+        if len(variants) < len(results):
+            combined["failed_variants"] = len(results) - len(variants)
+        return combined
+    
     def generate_image(self, tool_input: Dict[str, Any]) -> Dict[str, Any]:
         """
         Generate image using Hugging Face Inference API
@@ -22,77 +200,119 @@ class ImageTool:
             "prompt": str,
             "size": str (e.g., "1024x1024"),
             "seed": int|None,
-            "n": int (number of variants, default 1)
+            "n": int (number of variants, default 1 - more than one adds a "variants" list),
+            "return_base64": bool (default False - also return the image as base64 "image_data")
         }
+        The image is streamed into the asset store; the result has its "file_path", immutable
+        "url", "sha256" and "bytes".
         """
+        variant_inputs = self._variant_inputs(tool_input)
+        results = [self._generate_one(variant_input) for variant_input in variant_inputs]
+        if len(results) == 1:
+            return results[0]
+        return self._combine_variants(variant_inputs, results)
+    
+    def _generate_one(self, tool_input: Dict[str, Any]) -> Dict[str, Any]:
         try:
-            prompt = tool_input.get("prompt", "")
-            seed = tool_input.get("seed")
-            n = tool_input.get("n", 1)
-            
-            # Hugging Face API payload
-            payload = {
-                "inputs": prompt,
-                "parameters": {
-                    "num_inference_steps": 30,
-                }
-            }
-            
-            if seed is not None:
-                payload["parameters"]["seed"] = seed
-            
-            # Make request
-            response = requests.post(
-                self.api_url,
-                headers=self.headers,
-                json=payload,
-                timeout=60
-            )
-            
-            if response.status_code == 503:
-                # Model is loading, wait and retry
-                time.sleep(20)
-                response = requests.post(
-                    self.api_url,
-                    headers=self.headers,
-                    json=payload,
-                    timeout=60
-                )
+            payload = self._build_payload(tool_input)
             
-            if response.status_code == 200:
-                # Save image
-                image_data = response.content
-                
-                return {
-                    "success": True,
-                    "image_data": base64.b64encode(image_data).decode('utf-8'),
-                    "format": "png",
-                    "provider": "huggingface",
-                    "model": "stable-diffusion-xl-base-1.0"
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"API returned status {response.status_code}: {response.text}"
-                }
+            for warmups in range(MAX_WARMUP_WAITS + 1):
+                with self.session.post(self.api_url, json=payload, timeout=60, stream=True) as response:
+                    if response.status_code == 200:
+                        result = self._file_result(self._stream_to_store(response))
+                        if tool_input.get("return_base64"):
+                            result["image_data"] = self._read_base64(result["file_path"])
+                        return result
+                    result = self._error_response(response.status_code, response.text, response.headers)
+                wait = self._warmup_wait(result)
+                if wait is None or warmups == MAX_WARMUP_WAITS:
+                    return result
+                # Model is loading - wait as long as Hugging Face estimates
+                time.sleep(wait)
+            return result
                 
         except Exception as e:
             return {
                 "success": False,
-                "error": str(e)
+                **error_details(e)
             }
     
-    def save_image(self, image_data: str, asset_id: str, assets_dir: str) -> str:
-        """Save base64 image data to file"""
+    @instrument("image_generate", provider="huggingface")
+    async def agenerate_image(self, tool_input: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Async variant of generate_image - waits on the HTTP call without blocking the event loop
+        Variants are generated concurrently over the pooled client, at most
+        IMAGE_PROVIDER_CONCURRENCY requests at a time. Concurrent calls with the same
+        input (prompt and seed) share one request.
+        A variant that is a near-duplicate of an earlier one - or of an image whose pHash
+        is in tool_input["avoid_phashes"] - is generated again with a new seed.
+        """
+        variant_inputs = self._variant_inputs(tool_input)
+        results = list(await asyncio.gather(*(
+            self.single_flight.do(variant_input, functools.partial(self._agenerate_image, variant_input))
+            for variant_input in variant_inputs
+        )))
+        avoid = list(tool_input.get("avoid_phashes") or [])
+        rejected = 0
+        if len(results) > 1 or avoid:
+            rejected = await self._replace_near_duplicates(variant_inputs, results, avoid)
+        result = results[0] if len(results) == 1 else self._combine_variants(variant_inputs, results)
+        if rejected:
+            result = {**result, "near_duplicates_rejected": rejected}
+        return result
+    
+    async def _replace_near_duplicates(self, variant_inputs: List[Dict[str, Any]], results: List[Dict[str, Any]], avoid: List[str]) -> int:
+        """
+        Re-roll near-duplicate variants in place, spending at most NEAR_DUPLICATE_BUDGET
+        extra generations; past the budget a near-duplicate is kept. Returns the re-rolls.
+        """
+        budget = NEAR_DUPLICATE_BUDGET
+        seen = list(avoid)
+        for i, variant_input in enumerate(variant_inputs):
+            result = results[i]
+            while result.get("success"):
+                hashes = await asyncio.to_thread(perceptual_hash.hash_file, result["file_path"])
+                if hashes is None:
+                    break
+                result["phash"] = hashes["phash"]
+                if budget == 0 or not perceptual_hash.is_near_duplicate(hashes["phash"], seen):
+                    break
+                budget -= 1
+                print(f"⚠ Near-duplicate image variant - generating it again ({budget} re-roll(s) left)")
+                variant_input = {**variant_input, "seed": random.randint(1, 2**31 - 1)}
+                result = await self.single_flight.do(variant_input, functools.partial(self._agenerate_image, variant_input))
+            variant_inputs[i] = variant_input
+            results[i] = result
+            if result.get("phash"):
+                seen.append(result["phash"])
+        return NEAR_DUPLICATE_BUDGET - budget
+    
+    async def _agenerate_image(self, tool_input: Dict[str, Any]) -> Dict[str, Any]:
         try:
-            Path(assets_dir).mkdir(parents=True, exist_ok=True)
+            payload = self._build_payload(tool_input)
+            client = self._get_client()
             
-            image_bytes = base64.b64decode(image_data)
-            file_path = os.path.join(assets_dir, f"{asset_id}.png")
-            
-            with open(file_path, "wb") as f:
-                f.write(image_bytes)
-            
-            return file_path
+            for warmups in range(MAX_WARMUP_WAITS + 1):
+                async with self._semaphore:
+                    async with client.stream("POST", self.api_url, json=payload) as response:
+                        if response.status_code == 200:
+                            result = self._file_result(await self._astream_to_store(response))
+                        else:
+                            await response.aread()
+                            result = self._error_response(response.status_code, response.text, response.headers)
+                if result.get("success"):
+                    if tool_input.get("return_base64"):
+                        result["image_data"] = await asyncio.to_thread(self._read_base64, result["file_path"])
+                    return result
+                wait = self._warmup_wait(result)
+                if wait is None or warmups == MAX_WARMUP_WAITS:
+                    return result
+                # Model is loading - wait (without holding a connection slot) as long as Hugging Face estimates
+                await asyncio.sleep(wait)
+            return result
+                
         except Exception as e:
-            raise Exception(f"Failed to save image: {str(e)}")
+            return {
+                "success": False,
+                **error_details(e)
+            }
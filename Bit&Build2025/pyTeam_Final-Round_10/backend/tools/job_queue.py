@@ -0,0 +1,287 @@
+"""
+Job Queue - durable background jobs for long-running work (campaign generation)
+Jobs are stored in SQLite (storage/jobs.db) and run by a bounded pool of asyncio
+workers. Submitting returns at once with a job id; progress events are persisted
+as a snapshot and pushed live to subscribers (SSE / WebSocket). Jobs that were
+queued or running when the process stopped are picked up again on start, up to
+JOB_MAX_ATTEMPTS runs in total - a job that keeps crashing or hanging the process is
+marked failed instead of being retried forever.
+An idempotency key makes a retried submit attach to the job it already created.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Callable, Awaitable, Optional, AsyncIterator, List, Tuple
+
+FINISHED_STATUSES = {"succeeded", "failed"}
+
+# handler(payload, report, progress) -> result; report(event) records a progress event and
+# progress is the snapshot an earlier attempt left ({} on the first), so a re-queued job can
+# continue where it stopped
+ProgressReporter = Callable[[Dict[str, Any]], Awaitable[None]]
+JobHandler = Callable[[Dict[str, Any], ProgressReporter, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class IdempotencyConflict(Exception):
+    """The idempotency key was already used for a different request"""
+
+
+class JobQueue:
+    def __init__(self, db_path: Optional[str] = None, workers: Optional[int] = None, max_attempts: Optional[int] = None):
+        self.db_path = Path(db_path or os.getenv("JOBS_DB", "./storage/jobs.db"))
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.workers = workers or int(os.getenv("JOB_WORKERS", "2"))
+        self.max_attempts = max_attempts or int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+        
+        self._handlers: Dict[str, JobHandler] = {}
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._init_db()
+        
+        self._queue: Optional[asyncio.Queue] = None
+        self._started = False
+        self._tasks: List[asyncio.Task] = []
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+    
+    def _init_db(self) -> None:
+        with self._db_lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    idempotency_key TEXT UNIQUE,
+                    payload_hash TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    progress TEXT NOT NULL DEFAULT '{}',
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+            self._conn.commit()
+    
+    def register(self, kind: str, handler: JobHandler) -> None:
+        self._handlers[kind] = handler
+    
+    # Storage (blocking - called through asyncio.to_thread)
+    
+    def _execute(self, sql: str, params: Tuple = ()) -> int:
+        """Run a write; returns the number of rows it changed"""
+        with self._db_lock:
+            rowcount = self._conn.execute(sql, params).rowcount
+            self._conn.commit()
+            return rowcount
+    
+    def _fetch(self, sql: str, params: Tuple = ()) -> List[sqlite3.Row]:
+        with self._db_lock:
+            return self._conn.execute(sql, params).fetchall()
+    
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "progress": json.loads(row["progress"] or "{}"),
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+    
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._fetch("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self._row_to_job(rows[0]) if rows else None
+    
+    def _payload(self, job_id: str) -> Dict[str, Any]:
+        rows = self._fetch("SELECT payload FROM jobs WHERE id = ?", (job_id,))
+        return json.loads(rows[0]["payload"]) if rows else {}
+    
+    def _insert(self, kind: str, payload: Dict[str, Any], idempotency_key: Optional[str]) -> Tuple[Dict[str, Any], bool]:
+        payload_json = json.dumps(payload, sort_keys=True)
+        payload_hash = hashlib.sha256(f"{kind}\0{payload_json}".encode("utf-8")).hexdigest()
+        now = datetime.now().isoformat()
+        job_id = str(uuid.uuid4())
+        with self._db_lock:
+            if idempotency_key:
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE idempotency_key = ?", (idempotency_key,)
+                ).fetchone()
+                if row is not None:
+                    if row["payload_hash"] != payload_hash:
+                        raise IdempotencyConflict(f"Idempotency key '{idempotency_key}' was used for a different request")
+                    return self._row_to_job(row), False
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, idempotency_key, payload_hash, payload, created_at, updated_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, kind, idempotency_key, payload_hash, payload_json, now, now)
+            )
+            self._conn.commit()
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row), True
+    
+    # Public API
+    
+    async def submit(self, kind: str, payload: Dict[str, Any], idempotency_key: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """Queue a job; returns (job, created). A known idempotency key returns the existing job"""
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind '{kind}'")
+        job, created = await asyncio.to_thread(self._insert, kind, payload, idempotency_key)
+        if created:
+            self._enqueue(job["job_id"])
+        return job, created
+    
+    async def aget(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.get, job_id)
+    
+    async def start(self) -> None:
+        """Start the worker pool and re-queue jobs left unfinished by a previous process"""
+        if self._started:
+            return
+        self._started = True
+        await asyncio.to_thread(
+            self._execute, "UPDATE jobs SET status = 'queued' WHERE status = 'running'"
+        )
+        rows = await asyncio.to_thread(
+            self._fetch, "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at"
+        )
+        # Assigned only after the SELECT, so jobs submitted while it ran are queued once by
+        # this loop rather than by submit() as well; _run's atomic claim covers the rest
+        queue: asyncio.Queue = asyncio.Queue()
+        for row in rows:
+            queue.put_nowait(row["id"])
+        self._queue = queue
+        if rows:
+            print(f"✓ Job queue: resuming {len(rows)} unfinished job(s)")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+    
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._started = False
+    
+    def _enqueue(self, job_id: str) -> None:
+        if self._queue is not None:
+            self._queue.put_nowait(job_id)
+        # Before start() the job stays 'queued' in the database and start() picks it up
+    
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                print(f"❌ Job {job_id} crashed the worker loop: {e}")
+            finally:
+                self._queue.task_done()
+    
+    async def _run(self, job_id: str) -> None:
+        job = await self.aget(job_id)
+        if job is None or job["status"] in FINISHED_STATUSES:
+            return
+        if job["attempts"] >= self.max_attempts:
+            # Every earlier run died with the process before it could finish
+            await self._fail(job_id, f"Gave up after {job['attempts']} attempt(s) that did not finish")
+            return
+        handler = self._handlers.get(job["kind"])
+        payload = await asyncio.to_thread(self._payload, job_id)
+        
+        # Claim the job atomically - a job id queued twice, or picked up by another worker, runs once
+        now = datetime.now().isoformat()
+        claimed = await asyncio.to_thread(
+            self._execute,
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ? AND status = 'queued'",
+            (now, job_id)
+        )
+        if not claimed:
+            return
+        await self._publish(job_id, {"type": "status", "status": "running"})
+        
+        progress = dict(job["progress"])
+        
+        async def report(event: Dict[str, Any]) -> None:
+            # The snapshot keeps the latest value of each key; subscribers get every event
+            progress.update({k: v for k, v in event.items() if k != "type"})
+            await asyncio.to_thread(
+                self._execute,
+                "UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(progress), datetime.now().isoformat(), job_id)
+            )
+            await self._publish(job_id, {"type": "progress", **event})
+        
+        try:
+            result = await handler(payload, report, dict(job["progress"]))
+        except Exception as e:
+            await self._fail(job_id, str(e))
+            return
+        
+        await asyncio.to_thread(
+            self._execute,
+            "UPDATE jobs SET status = 'succeeded', result = ?, error = NULL, updated_at = ? WHERE id = ?",
+            (json.dumps(result), datetime.now().isoformat(), job_id)
+        )
+        await self._publish(job_id, {"type": "status", "status": "succeeded", "result": result})
+    
+    async def _fail(self, job_id: str, error: str) -> None:
+        await asyncio.to_thread(
+            self._execute,
+            "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+            (error, datetime.now().isoformat(), job_id)
+        )
+        await self._publish(job_id, {"type": "status", "status": "failed", "error": error})
+    
+    # Live progress
+    
+    async def _publish(self, job_id: str, event: Dict[str, Any]) -> None:
+        for queue in list(self._subscribers.get(job_id, [])):
+            queue.put_nowait(event)
+    
+    async def subscribe(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Current state first, then live events until the job finishes"""
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, []).append(queue)
+        try:
+            job = await self.aget(job_id)
+            if job is None:
+                return
+            yield {"type": "snapshot", **job}
+            if job["status"] in FINISHED_STATUSES:
+                return
+            while True:
+                event = await queue.get()
+                # Each subscriber gets its own copy so consumers can reshape it freely
+                yield dict(event)
+                if event.get("type") == "status" and event.get("status") in FINISHED_STATUSES:
+                    return
+        finally:
+            subscribers = self._subscribers.get(job_id, [])
+            if queue in subscribers:
+                subscribers.remove(queue)
+            if not subscribers:
+                self._subscribers.pop(job_id, None)
+    
+    def stats(self) -> Dict[str, Any]:
+        rows = self._fetch("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status")
+        return {
+            "workers": self.workers,
+            "max_attempts": self.max_attempts,
+            "running": self._queue is not None,
+            "queued_in_memory": self._queue.qsize() if self._queue is not None else 0,
+            "jobs": {row["status"]: row["count"] for row in rows},
+        }
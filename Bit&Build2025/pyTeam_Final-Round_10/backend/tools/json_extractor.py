@@ -0,0 +1,336 @@
+"""
+JSON Extractor - pull one JSON value out of free-form LLM output
+A single left-to-right scan finds balanced {...} / [...] spans (string and escape
+aware), so the cost stays linear however long or malformed the output is. Spans
+inside a ```json fence are tried first. A span that json.loads rejects is repaired
+for the faults models commonly produce - trailing commas, // and /* */ comments,
+single or smart quotes, Python literals, raw newlines inside strings - and output
+cut off at max_tokens is closed (open string, dangling key, open brackets) so the
+fields that did arrive are kept.
+
+Run `python -m tools.json_extractor` for a benchmark on pathological outputs.
+"""
+
+import json
+from typing import Any, List, Optional, Tuple
+
+OPENERS = {"{": "}", "[": "]"}
+CLOSERS = {"}": "{", "]": "["}
+SMART_QUOTES = ("“", "‘")
+PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+# An unclosed stray brace in prose swallows everything after it; retry from a few later openers
+MAX_RESTARTS = 3
+
+
+def _fenced(text: str) -> Optional[str]:
+    """Contents of the first ``` fence (to the end of the text if the fence never closes)"""
+    start = text.find("```")
+    if start == -1:
+        return None
+    # Skip the info string ("json", "JSON", ...) up to the end of the fence line
+    line_end = text.find("\n", start + 3)
+    if line_end == -1:
+        return None
+    end = text.find("```", line_end)
+    return text[line_end + 1:end if end != -1 else len(text)]
+
+
+def find_spans(text: str, start: int = 0) -> Tuple[List[Tuple[int, int]], Optional[int]]:
+    """Top-level balanced spans as (start, end) pairs, plus the start of a final unclosed span"""
+    spans = []
+    stack: List[str] = []
+    span_start = None
+    in_string = False
+    quote = '"'
+    escape = False
+    i = start
+    n = len(text)
+    
+    while i < n:
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == quote:
+                in_string = False
+        elif not stack:
+            if ch in OPENERS:
+                stack.append(ch)
+                span_start = i
+        elif ch == '"' or ch == "'" and text[i - 1] in "{[,: \n\t":
+            # Single quotes only open a string where a value or key can start ("it's" stays prose)
+            in_string = True
+            quote = ch
+        elif ch in OPENERS:
+            stack.append(ch)
+        elif ch in CLOSERS:
+            # Tolerate a mismatched closer by unwinding to its opener
+            while stack and stack[-1] != CLOSERS[ch]:
+                stack.pop()
+            if stack:
+                stack.pop()
+            if not stack:
+                spans.append((span_start, i + 1))
+                span_start = None
+        i += 1
+    
+    return spans, span_start if stack else None
+
+
+def repair(fragment: str) -> str:
+    """Rewrite a JSON-ish fragment into valid JSON where the faults are recognisable"""
+    out: List[str] = []
+    stack: List[str] = []
+    in_string = False
+    quote = '"'
+    escape = False
+    # Output index after the last complete member at each depth - truncation falls back to it
+    safe_points: List[int] = []
+    i = 0
+    n = len(fragment)
+    
+    while i < n:
+        ch = fragment[i]
+        if in_string:
+            if escape:
+                escape = False
+                out.append(ch)
+            elif ch == "\\":
+                escape = True
+                out.append(ch)
+            elif ch == quote:
+                in_string = False
+                out.append('"')
+            elif ch == '"':
+                # A double quote inside a single-quoted string
+                out.append('\\"')
+            elif ch == "\n":
+                out.append("\\n")
+            elif ch == "\t":
+                out.append("\\t")
+            elif ch == "\r":
+                pass
+            else:
+                out.append(ch)
+        elif ch in "\"'" or ch in SMART_QUOTES:
+            # A string opened with a smart quote ends at the matching smart quote
+            in_string = True
+            quote = {"“": "”", "‘": "’"}.get(ch, ch)
+            out.append('"')
+        elif ch == "/" and fragment.startswith("//", i):
+            newline = fragment.find("\n", i)
+            i = n if newline == -1 else newline
+            continue
+        elif ch == "/" and fragment.startswith("/*", i):
+            close = fragment.find("*/", i + 2)
+            i = n if close == -1 else close + 2
+            continue
+        elif ch in OPENERS:
+            stack.append(ch)
+            out.append(ch)
+            safe_points.append(len(out))
+        elif ch in CLOSERS:
+            _drop_trailing_comma(out)
+            while stack and stack[-1] != CLOSERS[ch]:
+                out.append(OPENERS[stack.pop()])
+                safe_points.pop()
+            if stack:
+                stack.pop()
+                safe_points.pop()
+                out.append(ch)
+            if safe_points:
+                safe_points[-1] = len(out)
+        elif ch == ",":
+            if safe_points:
+                safe_points[-1] = len(out)
+            out.append(ch)
+        elif ch.isalpha():
+            j = i
+            while j < n and (fragment[j].isalnum() or fragment[j] == "_"):
+                j += 1
+            word = fragment[i:j]
+            out.append(PY_LITERALS.get(word, word))
+            i = j
+            continue
+        else:
+            out.append(ch)
+        i += 1
+    
+    if not in_string and not stack:
+        return "".join(out)
+    
+    # Truncated: close the open string, then try keeping the last member before cutting back to the last complete one
+    if in_string:
+        if escape:
+            out.pop()
+        out.append('"')
+    closers = "".join(OPENERS[opener] for opener in reversed(stack))
+    body = "".join(out).rstrip()
+    candidates = [body, body + " null", body + ": null"]
+    if safe_points:
+        candidates.append("".join(out[:safe_points[-1]]))
+    for candidate in candidates:
+        candidate = candidate.rstrip().rstrip(",")
+        try:
+            json.loads(candidate + closers)
+            return candidate + closers
+        except ValueError:
+            continue
+    return body + closers
+
+
+def _drop_trailing_comma(out: List[str]) -> None:
+    j = len(out) - 1
+    while j >= 0 and out[j].isspace():
+        j -= 1
+    if j >= 0 and out[j] == ",":
+        del out[j]
+
+
+def _loads(fragment: str) -> Any:
+    try:
+        return json.loads(fragment)
+    except ValueError:
+        pass
+    try:
+        return json.loads(repair(fragment))
+    except ValueError:
+        return None
+
+
+def _matches(value: Any, expect: Optional[type], required_key: Optional[str]) -> bool:
+    if value is None:
+        return False
+    if expect is not None and not isinstance(value, expect):
+        return False
+    if required_key is not None and not (isinstance(value, dict) and required_key in value):
+        return False
+    return True
+
+
+def _search(text: str, expect: Optional[type], required_key: Optional[str]) -> Any:
+    offset = 0
+    for _ in range(MAX_RESTARTS + 1):
+        spans, unclosed = find_spans(text, offset)
+        for start, end in spans:
+            # Cheap pre-check before parsing: the required key has to appear in the span
+            if required_key is not None and f'"{required_key}"' not in text[start:end] and f"'{required_key}'" not in text[start:end]:
+                continue
+            value = _loads(text[start:end])
+            if _matches(value, expect, required_key):
+                return value
+        if unclosed is None:
+            return None
+        value = _loads(text[unclosed:])
+        if _matches(value, expect, required_key):
+            return value
+        # The unclosed opener may be stray prose - look again from the next opener after it
+        next_openers = [pos for pos in (text.find("{", unclosed + 1), text.find("[", unclosed + 1)) if pos != -1]
+        if not next_openers:
+            return None
+        offset = min(next_openers)
+    return None
+
+
+def extract_json(text: Optional[str], expect: Optional[type] = dict, required_key: Optional[str] = None, default: Any = None) -> Any:
+    """
+    Extract the first JSON value of the expected type from LLM output
+    
+    Expected input: the raw model text; expect=dict/list/None (any), required_key to
+    skip values without that key (e.g. "influencers"). Returns default when nothing
+    usable is found.
+    """
+    if not text:
+        return default
+    
+    stripped = text.strip()
+    try:
+        value = json.loads(stripped)
+        if _matches(value, expect, required_key):
+            return value
+    except ValueError:
+        pass
+    
+    fenced = _fenced(stripped)
+    if fenced is not None:
+        value = _search(fenced, expect, required_key)
+        if value is not None:
+            return value
+    
+    value = _search(stripped, expect, required_key)
+    return default if value is None else value
+
+
+# ============================================
+# Benchmark
+# ============================================
+
+def _old_extract(content: str, key: str) -> Any:
+    """The split/regex/whole-text chain the agent handlers used before this module"""
+    import re
+    if "```json" in content:
+        try:
+            return json.loads(content.split("```json")[1].split("```")[0].strip())
+        except ValueError:
+            pass
+    if "```" in content:
+        try:
+            return json.loads(content.split("```")[1].split("```")[0].strip())
+        except (ValueError, IndexError):
+            pass
+    match = re.search(r'\{[\s\S]*?"' + key + r'"\s*:\s*\[[\s\S]*?\][\s\S]*?\}', content)
+    if match:
+        try:
+            return json.loads(match.group(0))
+        except ValueError:
+            pass
+    try:
+        return json.loads(content)
+    except ValueError:
+        return None
+
+
+def _benchmark_cases(tokens: int) -> List[Tuple[str, str]]:
+    chars = tokens * 4
+    influencer = {"name": "Creator @handle", "platform": "Instagram", "followers": "120K", "fit_reason": "Posts daily about it, with \"quotes\" too"}
+    items = []
+    size = 0
+    while size < chars:
+        entry = json.dumps(influencer)
+        items.append(entry)
+        size += len(entry) + 2
+    full = '{"influencers": [' + ", ".join(items) + "]}"
+    prose = "Here is my analysis { of the market } and what {brands} should do. " * (chars // 68)
+    return [
+        ("fenced, trailing commas", "```json\n" + full.replace("}]}", "},]}") + "\n```"),
+        ("truncated at max_tokens", "```json\n" + full[:-len(full) // 3]),
+        ("prose with stray braces", prose + full),
+        ("prose, object never arrives", prose + '"influencers": ['),
+        ("python literals, single quotes", full.replace('"Instagram"', "'Instagram'").replace('"120K"', "None")),
+    ]
+
+
+def _benchmark() -> None:
+    import time
+    
+    def timed(fn, *args):
+        started = time.perf_counter()
+        value = fn(*args)
+        return value, (time.perf_counter() - started) * 1000
+    
+    # The old lazy regex grows quadratically on brace-heavy prose, the extractor linearly
+    for tokens in (1000, 10000, 20000):
+        print(f"\n~{tokens} tokens")
+        for name, text in _benchmark_cases(tokens):
+            new, new_ms = timed(extract_json, text, dict, "influencers")
+            old, old_ms = timed(_old_extract, text, "influencers")
+            new_count = len(new["influencers"]) if new else 0
+            old_count = len(old["influencers"]) if isinstance(old, dict) and "influencers" in old else 0
+            print(f"  {name:32} extractor {new_ms:8.1f}ms ({new_count} items)   old {old_ms:8.1f}ms ({old_count} items)")
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,84 @@
+"""
+Incremental JSON field parser for streamed LLM output
+Feeds on text chunks as they arrive, skips any prose or ```json fence before the
+object, and reports each top-level field as soon as its value closes. The scan
+resumes where the previous chunk ended, so total work stays linear in the output.
+"""
+
+import json
+from typing import Dict, Any, List, Tuple, Optional
+
+
+class IncrementalJSONParser:
+    def __init__(self):
+        self.buffer = ""
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+        
+        self._pos = 0
+        self._start: Optional[int] = None
+        self._end: Optional[int] = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member_start = 0
+    
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Add a chunk and return the (key, value) fields that closed within it"""
+        self.buffer += chunk
+        closed = []
+        buf = self.buffer
+        i = self._pos
+        
+        while i < len(buf) and not self.done:
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif self._start is None:
+                # Anything before the first brace is prose or a code fence
+                if ch == "{":
+                    self._start = i
+                    self._depth = 1
+                    self._member_start = i + 1
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    closed.extend(self._close_member(self._member_start, i))
+                    self._end = i
+                    self.done = True
+            elif ch == "," and self._depth == 1:
+                closed.extend(self._close_member(self._member_start, i))
+                self._member_start = i + 1
+            i += 1
+        
+        self._pos = i
+        return closed
+    
+    def _close_member(self, start: int, end: int) -> List[Tuple[str, Any]]:
+        member = self.buffer[start:end].strip()
+        if not member:
+            return []
+        try:
+            parsed = json.loads("{" + member + "}")
+        except ValueError:
+            return []
+        self.fields.update(parsed)
+        return list(parsed.items())
+    
+    def result(self) -> Optional[Dict[str, Any]]:
+        """The complete object once it has closed, otherwise None"""
+        if not self.done:
+            return None
+        try:
+            return json.loads(self.buffer[self._start:self._end + 1])
+        except ValueError:
+            return dict(self.fields)
@@ -0,0 +1,209 @@
+"""
+LLM Response Cache - content-addressed cache for LLMTool.generate_text
+Two tiers: an in-memory LRU and an on-disk store with size-bounded eviction.
+Keys are SHA-256 hashes of (model, prompt, temperature, max_tokens) plus the
+response schema fingerprint for structured-output calls.
+"""
+
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from models.response_schemas import schema_fingerprint
+
+
+class LLMResponseCache:
+    """
+    Caches successful generate_text responses.
+    - Calls with temperature <= LLM_CACHE_MAX_TEMPERATURE are always cached
+    - Hotter calls are cached only when the tool input sets "cache": True
+    - "cache": False on a tool input bypasses the cache entirely
+    """
+    
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_memory_entries: Optional[int] = None,
+        max_disk_bytes: Optional[int] = None,
+        temperature_threshold: Optional[float] = None
+    ):
+        self.enabled = os.getenv("LLM_CACHE_ENABLED", "true").lower() != "false"
+        self.cache_dir = Path(cache_dir or os.getenv("LLM_CACHE_DIR", "./storage/cache/llm"))
+        self.max_memory_entries = max_memory_entries or int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "512"))
+        self.max_disk_bytes = max_disk_bytes or int(os.getenv("LLM_CACHE_MAX_DISK_MB", "256")) * 1024 * 1024
+        self.temperature_threshold = (
+            temperature_threshold if temperature_threshold is not None
+            else float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.3"))
+        )
+        
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        
+        if self.enabled:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._disk_bytes = sum(f.stat().st_size for f in self.cache_dir.glob("*/*.json"))
+    
+    @staticmethod
+    def make_key(tool_input: Dict[str, Any]) -> str:
+        """Content address for a generate_text input"""
+        key_fields = [
+            tool_input.get("model", "gemini-2.0-flash-exp"),
+            tool_input.get("prompt", ""),
+            tool_input.get("temperature", 0.7),
+            tool_input.get("max_tokens", 1024),
+        ]
+        if tool_input.get("response_schema"):
+            key_fields.append(schema_fingerprint(tool_input["response_schema"]))
+        return hashlib.sha256(json.dumps(key_fields, ensure_ascii=False).encode("utf-8")).hexdigest()
+    
+    def should_cache(self, tool_input: Dict[str, Any]) -> bool:
+        if not self.enabled or tool_input.get("cache") is False:
+            return False
+        if tool_input.get("temperature", 0.7) <= self.temperature_threshold:
+            return True
+        return tool_input.get("cache") is True
+    
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+    
+    # Memory tier - callers modify results (e.g. result["data"]), so entries go in and out as copies
+    
+    def _get_memory(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+        return copy.deepcopy(entry)
+    
+    def _put_memory(self, key: str, value: Dict[str, Any]) -> None:
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+    
+    # Disk tier
+    
+    def _get_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            # Touch so eviction sees this entry as recently used
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        
+        with self._lock:
+            self.disk_hits += 1
+        self._put_memory(key, value)
+        return value
+    
+    def _put_disk(self, key: str, value: Dict[str, Any]) -> None:
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            # An overwritten entry gives its bytes back
+            try:
+                replaced_bytes = path.stat().st_size
+            except OSError:
+                replaced_bytes = 0
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠ LLM cache write failed: {e}")
+            return
+        
+        with self._lock:
+            self._disk_bytes += len(data) - replaced_bytes
+            over_budget = self._disk_bytes > self.max_disk_bytes
+        if over_budget:
+            self._evict_disk()
+    
+    def _evict_disk(self) -> None:
+        """Delete least recently used files until the disk tier is under 90% of its budget"""
+        files = []
+        total = 0
+        for f in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = f.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, f))
+            total += stat.st_size
+        
+        target = int(self.max_disk_bytes * 0.9)
+        files.sort()
+        for _, size, f in files:
+            if total <= target:
+                break
+            try:
+                f.unlink()
+                total -= size
+                self.evictions += 1
+            except OSError:
+                continue
+        
+        with self._lock:
+            self._disk_bytes = total
+    
+    # Public API
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._get_memory(key) or self._get_disk(key)
+    
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        self._put_memory(key, value)
+        with self._lock:
+            self.stores += 1
+        self._put_disk(key, value)
+    
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        """Async lookup - memory hits stay on the loop, disk reads go to a worker thread"""
+        return self._get_memory(key) or await asyncio.to_thread(self._get_disk, key)
+    
+    async def aput(self, key: str, value: Dict[str, Any]) -> None:
+        self._put_memory(key, value)
+        with self._lock:
+            self.stores += 1
+        await asyncio.to_thread(self._put_disk, key, value)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+                "max_disk_bytes": self.max_disk_bytes,
+                "temperature_threshold": self.temperature_threshold,
+            }
@@ -1,15 +1,78 @@
-import google.generativeai as genai
-import os
-from typing import Dict, Any
+from typing import Dict, Any, List, AsyncIterator, Optional
 import json
 
+from pydantic import ValidationError
+
+from tools.retry import error_details
+from tools.llm_cache import LLMResponseCache
+from tools.embedding_batcher import EmbeddingBatcher
+from tools.single_flight import SingleFlight
+from tools.json_extractor import extract_json
+from tools import gemini_client
+from tools.telemetry import instrument
+from models.response_schemas import gemini_schema, validate_output
+
 class LLMTool:
     def __init__(self):
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            raise ValueError("GOOGLE_API_KEY not found in environment variables")
-        genai.configure(api_key=api_key)
+        gemini_client.configure()
+        
+        # Content-addressed response cache (memory LRU + disk)
+        self.cache = LLMResponseCache()
+        
+        # Coalesces concurrent acompute_embedding calls into batched requests
+        self.embedding_batcher = EmbeddingBatcher(self.acompute_embeddings)
+        
+        # Identical concurrent generations share one Gemini request
+        self.single_flight = SingleFlight("llm_text")
+        
+    def _build_request(self, tool_input: Dict[str, Any]):
+        """Resolve the requested model name, prompt and per-request generation config"""
+        model_name = tool_input.get("model", gemini_client.DEFAULT_MODEL)
+        prompt = tool_input.get("prompt", "")
+        temperature = tool_input.get("temperature", 0.7)
+        max_tokens = tool_input.get("max_tokens", 1024)
+        
+        generation_config = {
+            "temperature": temperature,
+            "max_output_tokens": max_tokens,
+        }
         
+        # Structured output - the model is constrained to emit JSON matching the schema
+        if tool_input.get("response_schema"):
+            generation_config["response_mime_type"] = "application/json"
+            generation_config["response_schema"] = gemini_schema(tool_input["response_schema"])
+        
+        return model_name, prompt, generation_config
+    
+    def _format_response(self, response, model_name: str, requested_model: str, schema: Optional[str] = None) -> Dict[str, Any]:
+        result = {
+            "success": True,
+            "text": response.text,
+            "model": model_name,
+            "usage": {
+                "prompt_tokens": response.usage_metadata.prompt_token_count if hasattr(response, 'usage_metadata') else 0,
+                "completion_tokens": response.usage_metadata.candidates_token_count if hasattr(response, 'usage_metadata') else 0,
+            }
+        }
+        if model_name != requested_model:
+            result["fallback_from"] = requested_model
+        return self._validate(result, schema)
+    
+    @staticmethod
+    def _validate(result: Dict[str, Any], schema: Optional[str]) -> Dict[str, Any]:
+        """Attach the schema-validated JSON as data, or why it doesn't fit as schema_errors"""
+        if schema:
+            try:
+                result["data"] = validate_output(schema, extract_json(result["text"]))
+            except ValidationError as e:
+                result["schema_errors"] = [f"{'.'.join(str(p) for p in error['loc'])}: {error['msg']}" for error in e.errors()]
+        return result
+    
+    @staticmethod
+    def _cacheable(result: Dict[str, Any], used_model: str, model_name: str) -> bool:
+        # Fallback answers aren't what was asked for, and off-schema answers would be served again
+        return used_model == model_name and "schema_errors" not in result
+    
     def generate_text(self, tool_input: Dict[str, Any]) -> Dict[str, Any]:
         """
         Generate text using Gemini API
@@ -17,42 +80,116 @@ class LLMTool:
             "prompt": str,
             "model": str (default: "gemini-2.0-flash-exp"),
             "temperature": float,
-            "max_tokens": int
+            "max_tokens": int,
+            "cache": bool (optional - opt in above the cache temperature threshold, False to bypass),
+            "response_schema": str (optional - name in models.response_schemas; JSON output,
+                                    validated into "data" or reported as "schema_errors")
         }
         """
         try:
-            model_name = tool_input.get("model", "gemini-2.0-flash-exp")
-            prompt = tool_input.get("prompt", "")
-            temperature = tool_input.get("temperature", 0.7)
-            max_tokens = tool_input.get("max_tokens", 1024)
+            use_cache = self.cache.should_cache(tool_input)
+            if use_cache:
+                cache_key = self.cache.make_key(tool_input)
+                cached = self.cache.get(cache_key)
+                if cached:
+                    return {**cached, "cached": True}
             
-            generation_config = {
-                "temperature": temperature,
-                "max_output_tokens": max_tokens,
-            }
+            model_name, prompt, generation_config = self._build_request(tool_input)
             
-            model = genai.GenerativeModel(
-                model_name=model_name,
-                generation_config=generation_config
+            # Falls back along LLM_FALLBACK_MODELS when the requested model is failing
+            response, used_model = gemini_client.generate_with_fallback(
+                prompt, model_name, generation_config=generation_config
             )
             
-            response = model.generate_content(prompt)
-            
+            result = self._format_response(response, used_model, model_name, tool_input.get("response_schema"))
+            if use_cache and self._cacheable(result, used_model, model_name):
+                self.cache.put(cache_key, result)
+            return result
+        except Exception as e:
             return {
-                "success": True,
-                "text": response.text,
-                "model": model_name,
-                "usage": {
-                    "prompt_tokens": response.usage_metadata.prompt_token_count if hasattr(response, 'usage_metadata') else 0,
-                    "completion_tokens": response.usage_metadata.candidates_token_count if hasattr(response, 'usage_metadata') else 0,
-                }
+                "success": False,
+                **error_details(e)
             }
+    
+    @instrument("llm_text", provider="google")
+    async def agenerate_text(self, tool_input: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Async variant of generate_text - awaits Gemini without blocking the event loop
+        Concurrent calls with the same input share one request
+        """
+        return await self.single_flight.do(tool_input, lambda: self._agenerate_text(tool_input))
+    
+    async def _agenerate_text(self, tool_input: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            use_cache = self.cache.should_cache(tool_input)
+            if use_cache:
+                cache_key = self.cache.make_key(tool_input)
+                cached = await self.cache.aget(cache_key)
+                if cached:
+                    return {**cached, "cached": True}
+            
+            model_name, prompt, generation_config = self._build_request(tool_input)
+            
+            response, used_model = await gemini_client.agenerate_with_fallback(
+                prompt, model_name, generation_config=generation_config
+            )
+            
+            result = self._format_response(response, used_model, model_name, tool_input.get("response_schema"))
+            if use_cache and self._cacheable(result, used_model, model_name):
+                await self.cache.aput(cache_key, result)
+            return result
         except Exception as e:
             return {
                 "success": False,
-                "error": str(e)
+                **error_details(e)
             }
     
+    async def astream_text(self, tool_input: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Stream generated text chunk by chunk (same input as generate_text)
+        Cache hits are yielded as a single chunk; completed streams are cached like
+        generate_text results. Provider errors are raised to the caller.
+        """
+        use_cache = self.cache.should_cache(tool_input)
+        if use_cache:
+            cache_key = self.cache.make_key(tool_input)
+            cached = await self.cache.aget(cache_key)
+            if cached:
+                yield cached.get("text", "")
+                return
+        
+        model_name, prompt, generation_config = self._build_request(tool_input)
+        
+        response, used_model = await gemini_client.agenerate_with_fallback(
+            prompt, model_name, generation_config=generation_config, stream=True
+        )
+        
+        chunks = []
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. a final safety/finish chunk)
+                continue
+            if text:
+                chunks.append(text)
+                yield text
+        
+        gemini_client.settle_stream(response)
+        usage = getattr(response, "usage_metadata", None)
+        if use_cache:
+            result = self._validate({
+                "success": True,
+                "text": "".join(chunks),
+                "model": model_name,
+                "usage": {
+                    "prompt_tokens": getattr(usage, "prompt_token_count", 0) if usage else 0,
+                    "completion_tokens": getattr(usage, "candidates_token_count", 0) if usage else 0,
+                }
+            }, tool_input.get("response_schema"))
+            if self._cacheable(result, used_model, model_name):
+                await self.cache.aput(cache_key, result)
+    
     def compute_embedding(self, tool_input: Dict[str, Any]) -> Dict[str, Any]:
         """
         Compute embeddings using Gemini
@@ -62,7 +199,7 @@ class LLMTool:
         """
         try:
             text = tool_input.get("text", "")
-            result = genai.embed_content(
+            result = gemini_client.embed_content(
                 model="models/text-embedding-004",
                 content=text
             )
@@ -75,5 +212,39 @@ class LLMTool:
         except Exception as e:
             return {
                 "success": False,
-                "error": str(e)
+                **error_details(e)
             }
+    
+    @instrument("compute_embedding", provider="google")
+    async def acompute_embedding(self, tool_input: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Async variant of compute_embedding
+        Concurrent calls are coalesced by the embedding batcher into batched requests
+        """
+        try:
+            text = tool_input.get("text", "")
+            embedding = await self.embedding_batcher.embed(text)
+            
+            return {
+                "success": True,
+                "embedding": embedding,
+                "dimensions": len(embedding)
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                **error_details(e)
+            }
+    
+    async def acompute_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed several texts in one batched request
+        Raises on failure; used by the embedding batcher
+        """
+        if not texts:
+            return []
+        result = await gemini_client.embed_content_async(
+            model="models/text-embedding-004",
+            content=texts
+        )
+        return result['embedding']
@@ -0,0 +1,227 @@
+"""
+Metrics - in-process counters, gauges and histograms for GET /metrics
+Rendered in the Prometheus text exposition format (0.0.4). Recording on a hot path
+is a tuple-keyed dict lookup, a bisect and two adds under an uncontended lock, so
+it costs well under a microsecond (`python -m tools.metrics` measures it). Values
+that already exist elsewhere - cache hit counters, WebSocket rooms - are read by
+collect callbacks at scrape time instead of being counted twice.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Any, List, Tuple, Callable, Optional, Sequence
+
+# Seconds - from fast local calls up to slow image generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Seconds - local JSON file reads and writes
+STORAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+
+Labels = Tuple[str, ...]
+Collector = Callable[[], Dict[Labels, float]]
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[Any]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class _Metric:
+    kind = "untyped"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), collect: Optional[Collector] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._collect = collect
+        self._lock = threading.Lock()
+        self._values: Dict[Labels, float] = {}
+    
+    def _samples(self) -> List[str]:
+        if self._collect is not None:
+            values = self._collect()
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [
+            f"{self.name}{_label_text(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in sorted(values.items())
+        ]
+    
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+
+class Counter(_Metric):
+    kind = "counter"
+    
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+    
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+    
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[Labels, List[Any]] = {}
+    
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+    
+    @contextmanager
+    def time(self, *labels: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+    
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        
+        names = self.labelnames + ("le",)
+        lines = []
+        for labels, (counts, total) in sorted(series.items()):
+            # Exposition buckets are cumulative
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_label_text(names, labels + (_format_value(bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+    
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+    
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # A failing collect callback shouldn't take the whole scrape down
+                print(f"⚠ Metric {metric.name} failed to render: {e}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry served by /metrics
+registry = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = (), collect: Optional[Collector] = None) -> Counter:
+    return registry.register(Counter(name, documentation, labelnames, collect))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = (), collect: Optional[Collector] = None) -> Gauge:
+    return registry.register(Gauge(name, documentation, labelnames, collect))
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# Hot-path metrics shared across modules
+HTTP_REQUEST_SECONDS = histogram(
+    "http_request_duration_seconds",
+    "Time to the response start per route (streams keep running after it)",
+    ("method", "route", "status")
+)
+TOOL_CALL_SECONDS = histogram(
+    "tool_call_duration_seconds",
+    "Wall time of tool invocations (llm_text, image_generate, web_search, moderation, compute_embedding)",
+    ("tool", "provider", "outcome")
+)
+STORAGE_SECONDS = histogram(
+    "storage_operation_duration_seconds",
+    "Read/write latency of the JSON file stores",
+    ("store", "operation"),
+    STORAGE_BUCKETS
+)
+WS_BROADCAST_SECONDS = histogram(
+    "ws_broadcast_duration_seconds",
+    "Fan-out time of one collaboration broadcast to every connection in the room",
+    ("type",)
+)
+WS_MESSAGES_SENT = counter(
+    "ws_broadcast_messages_total",
+    "Messages delivered by collaboration broadcasts",
+    ("type",)
+)
+
+
+# ============================================
+# Benchmark
+# ============================================
+
+def _benchmark() -> None:
+    iterations = 200000
+    bench = Histogram("bench_seconds", "benchmark", ("route", "status"))
+    started = time.perf_counter()
+    for i in range(iterations):
+        bench.observe(i % 1000 / 1000, "/api/agents/strategy", "200")
+    per_call = (time.perf_counter() - started) / iterations
+    print(f"Histogram.observe: {per_call * 1e9:.0f}ns per call")
+    
+    count = Counter("bench_total", "benchmark", ("cache",))
+    started = time.perf_counter()
+    for _ in range(iterations):
+        count.inc("llm")
+    per_call = (time.perf_counter() - started) / iterations
+    print(f"Counter.inc:       {per_call * 1e9:.0f}ns per call")
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,307 @@
+"""
+Perceptual Hash - near-duplicate detection for generated images
+Two 64-bit hashes per image, computed with NumPy over a whole batch at once:
+- pHash: sign of the low-frequency 8x8 DCT coefficients of a 32x32 grayscale
+  version against their median - robust to resizing, re-encoding and small edits
+- dHash: sign of horizontal gradients of a 9x8 grayscale version - cheap, and a
+  second opinion on the structure
+Images whose pHash differs in at most PHASH_MAX_DISTANCE bits are near-duplicates.
+
+The index caches hashes in storage/phash_index.jsonl: blobs by content hash (their
+bytes never change), other files by path, size and mtime. Decoding is what costs -
+an existing thumbnail derivative is hashed instead of the full-size PNG, and files
+are decoded on a thread pool (Pillow releases the GIL while decoding).
+
+python -m tools.perceptual_hash prints the near-duplicate report across all campaigns.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from tools.asset_store import AssetStore
+
+# Bits (of 64) two pHashes may differ in and still count as near-duplicates
+PHASH_MAX_DISTANCE = int(os.getenv("PHASH_MAX_DISTANCE", "8"))
+DECODE_WORKERS = int(os.getenv("PHASH_DECODE_WORKERS", "8"))
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp"}
+# Files written by tools.image_derivatives - renditions of another image, not assets
+DERIVATIVE_MARKERS = ("_thumb.", "_medium.")
+
+_HASH_SIZE = 8
+_DCT_SIZE = 32
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II matrix, so the 2-D DCT of X is D @ X @ D.T"""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(_DCT_SIZE)
+_BIT_WEIGHTS = np.left_shift(np.uint64(1), np.arange(63, -1, -1, dtype=np.uint64))
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _pack(bits: np.ndarray) -> np.ndarray:
+    """(N, 64) booleans -> (N,) uint64, first bit most significant"""
+    return (bits.astype(np.uint64) * _BIT_WEIGHTS).sum(axis=1, dtype=np.uint64)
+
+
+def phash_batch(pixels: np.ndarray) -> np.ndarray:
+    """pHashes of (N, 32, 32) grayscale arrays"""
+    coefficients = np.einsum("ij,njk,lk->nil", _DCT, pixels.astype(np.float64), _DCT, optimize=True)
+    low = coefficients[:, :_HASH_SIZE, :_HASH_SIZE].reshape(len(pixels), -1)
+    # The DC term is the mean brightness - leave it out of the median
+    median = np.median(low[:, 1:], axis=1, keepdims=True)
+    return _pack(low > median)
+
+
+def dhash_batch(pixels: np.ndarray) -> np.ndarray:
+    """dHashes of (N, 8, 9) grayscale arrays"""
+    pixels = pixels.astype(np.int16)
+    return _pack((pixels[:, :, 1:] > pixels[:, :, :-1]).reshape(len(pixels), -1))
+
+
+def hamming(a: Union[int, np.ndarray], b: Union[int, np.ndarray]) -> np.ndarray:
+    """Differing bits between uint64 hashes (broadcasts)"""
+    xor = np.bitwise_xor(np.asarray(a, dtype=np.uint64), np.asarray(b, dtype=np.uint64))
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(xor).astype(np.int64)
+    return _POPCOUNT[xor[..., None].view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+
+def to_hex(value: int) -> str:
+    return f"{int(value):016x}"
+
+
+def from_hex(value: str) -> int:
+    return int(value, 16)
+
+
+def _hash_source(path: Path) -> Path:
+    """The file to decode for path - its thumbnail derivative if one was rendered"""
+    for thumbnail in path.parent.glob(f"{path.stem}_thumb.*"):
+        return thumbnail
+    return path
+
+
+def _load(path: Path) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """Grayscale pixels for pHash (32x32) and dHash (9x8), or None if it can't be decoded"""
+    try:
+        with Image.open(_hash_source(path)) as image:
+            # JPEG can decode straight at a reduced scale
+            image.draft("L", (_DCT_SIZE * 2, _DCT_SIZE * 2))
+            gray = image.convert("L")
+        gray.thumbnail((_DCT_SIZE * 4, _DCT_SIZE * 4), Image.BILINEAR)
+        return (
+            np.asarray(gray.resize((_DCT_SIZE, _DCT_SIZE), Image.LANCZOS), dtype=np.uint8),
+            np.asarray(gray.resize((_HASH_SIZE + 1, _HASH_SIZE), Image.LANCZOS), dtype=np.uint8)
+        )
+    except Exception as e:
+        print(f"⚠ Perceptual hash: can't read {path.name}: {e}")
+        return None
+
+
+def hash_files(paths: Sequence[Union[str, Path]]) -> List[Optional[Dict[str, str]]]:
+    """{"phash", "dhash"} (hex) per file, None for files that can't be decoded"""
+    paths = [Path(path) for path in paths]
+    if not paths:
+        return []
+    if len(paths) == 1:
+        loaded = [_load(paths[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(DECODE_WORKERS, len(paths))) as pool:
+            loaded = list(pool.map(_load, paths))
+    
+    ok = [i for i, pixels in enumerate(loaded) if pixels is not None]
+    results: List[Optional[Dict[str, str]]] = [None] * len(paths)
+    if not ok:
+        return results
+    phashes = phash_batch(np.stack([loaded[i][0] for i in ok]))
+    dhashes = dhash_batch(np.stack([loaded[i][1] for i in ok]))
+    for i, phash, dhash in zip(ok, phashes, dhashes):
+        results[i] = {"phash": to_hex(phash), "dhash": to_hex(dhash)}
+    return results
+
+
+def hash_file(path: Union[str, Path]) -> Optional[Dict[str, str]]:
+    return hash_files([path])[0]
+
+
+def is_near_duplicate(phash: str, others: Sequence[str], max_distance: int = PHASH_MAX_DISTANCE) -> bool:
+    """Whether a pHash is within max_distance bits of any of others"""
+    if not others:
+        return False
+    distances = hamming(from_hex(phash), np.array([from_hex(other) for other in others], dtype=np.uint64))
+    return bool(distances.min() <= max_distance)
+
+
+class PerceptualIndex:
+    """Cached hashes of every image under the assets directory"""
+    
+    def __init__(self, assets_dir: Optional[str] = None, index_path: Optional[str] = None):
+        self.assets_dir = Path(assets_dir or os.getenv("ASSETS_DIR", "./storage/assets"))
+        self.index_path = Path(index_path or os.getenv("PHASH_INDEX", "./storage/phash_index.jsonl"))
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._hashes: Dict[str, Dict[str, str]] = {}
+        self._load()
+    
+    def _load(self) -> None:
+        if not self.index_path.exists():
+            return
+        with open(self.index_path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn last line - that image is simply hashed again
+                    continue
+                self._hashes[entry["key"]] = {"phash": entry["phash"], "dhash": entry["dhash"]}
+    
+    @staticmethod
+    def _key(path: Path) -> str:
+        blob = AssetStore.parse(path.as_posix())
+        if blob:
+            return blob[0]
+        stat = path.stat()
+        return f"file:{path.as_posix()}:{stat.st_size}:{stat.st_mtime_ns}"
+    
+    def image_files(self) -> List[Path]:
+        return sorted(
+            path for path in self.assets_dir.rglob("*")
+            if path.suffix.lower() in IMAGE_SUFFIXES
+            and not any(marker in path.name for marker in DERIVATIVE_MARKERS)
+            and path.is_file()
+        )
+    
+    def hashes(self, paths: Sequence[Path]) -> Dict[Path, Dict[str, str]]:
+        """Hashes of paths - cached ones from the index, the rest computed in one batch and cached"""
+        keys = {path: self._key(path) for path in paths}
+        with self._lock:
+            missing = [path for path in paths if keys[path] not in self._hashes]
+        computed = hash_files(missing)
+        new_entries = [(keys[path], hashes) for path, hashes in zip(missing, computed) if hashes is not None]
+        with self._lock:
+            if new_entries:
+                with open(self.index_path, "a") as f:
+                    for key, hashes in new_entries:
+                        f.write(json.dumps({"key": key, **hashes}) + "\n")
+                        self._hashes[key] = hashes
+            return {path: self._hashes[keys[path]] for path in paths if keys[path] in self._hashes}
+    
+    def report(self, campaigns_dir: Optional[str] = None, max_distance: int = PHASH_MAX_DISTANCE) -> Dict[str, Any]:
+        """
+        Groups of near-duplicate images across every asset and the campaigns using them
+        A group keeps its first file; the others' bytes are what deduplication would free.
+        """
+        started = time.perf_counter()
+        paths = self.image_files()
+        hashed = self.hashes(paths)
+        paths = [path for path in paths if path in hashed]
+        hash_seconds = time.perf_counter() - started
+        
+        usage = self._campaign_usage(Path(campaigns_dir or "./storage/campaigns"))
+        
+        groups: List[Dict[str, Any]] = []
+        if paths:
+            phashes = np.array([from_hex(hashed[path]["phash"]) for path in paths], dtype=np.uint64)
+            # Union-find over every pair within max_distance, a block of rows at a time
+            parent = list(range(len(paths)))
+            
+            def find(i: int) -> int:
+                while parent[i] != i:
+                    parent[i] = parent[parent[i]]
+                    i = parent[i]
+                return i
+            
+            block = 1024
+            for start in range(0, len(paths), block):
+                distances = hamming(phashes[start:start + block, None], phashes[None, :])
+                rows, cols = np.nonzero(distances <= max_distance)
+                for row, col in zip(rows + start, cols):
+                    if col > row:
+                        a, b = find(row), find(col)
+                        if a != b:
+                            parent[b] = a
+            
+            members: Dict[int, List[int]] = {}
+            for i in range(len(paths)):
+                members.setdefault(find(i), []).append(i)
+            for indices in members.values():
+                if len(indices) < 2:
+                    continue
+                group_hashes = phashes[indices]
+                files = [self._describe(paths[i], usage) for i in indices]
+                groups.append({
+                    "files": files,
+                    "campaigns": sorted({campaign for file in files for campaign in file["campaigns"]}),
+                    "max_distance": int(hamming(group_hashes[:, None], group_hashes[None, :]).max()),
+                    "reclaimable_bytes": sum(file["bytes"] for file in files[1:])
+                })
+        groups.sort(key=lambda group: group["reclaimable_bytes"], reverse=True)
+        
+        return {
+            "images": len(paths),
+            "groups": groups,
+            "near_duplicate_images": sum(len(group["files"]) - 1 for group in groups),
+            "reclaimable_bytes": sum(group["reclaimable_bytes"] for group in groups),
+            "max_distance": max_distance,
+            "hash_seconds": round(hash_seconds, 3),
+            "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+        }
+    
+    def _describe(self, path: Path, usage: Dict[str, List[str]]) -> Dict[str, Any]:
+        blob = AssetStore.parse(path.as_posix())
+        return {
+            "path": path.as_posix(),
+            "url": "/assets/" + path.relative_to(self.assets_dir).as_posix(),
+            "bytes": path.stat().st_size,
+            "campaigns": usage.get(blob[0] if blob else path.name, [])
+        }
+    
+    @staticmethod
+    def _campaign_usage(campaigns_dir: Path) -> Dict[str, List[str]]:
+        """Blob hash (or legacy file name) -> ids of the campaigns whose assets point at it"""
+        usage: Dict[str, List[str]] = {}
+        for campaign_file in sorted(campaigns_dir.glob("*.json")):
+            try:
+                with open(campaign_file, "r") as f:
+                    campaign = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for asset in campaign.get("asset_plan", []):
+                url = asset.get("url")
+                if not isinstance(url, str):
+                    continue
+                blob = AssetStore.parse(url)
+                key = blob[0] if blob else url.replace("\\", "/").rsplit("/", 1)[-1]
+                campaign_id = campaign.get("campaign_id", campaign_file.stem)
+                if campaign_id not in usage.setdefault(key, []):
+                    usage[key].append(campaign_id)
+        return usage
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"hashed_images": len(self._hashes)}
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Near-duplicate image report across all campaigns")
+    parser.add_argument("--max-distance", type=int, default=PHASH_MAX_DISTANCE)
+    args = parser.parse_args()
+    print(json.dumps(PerceptualIndex().report(max_distance=args.max_distance), indent=2))
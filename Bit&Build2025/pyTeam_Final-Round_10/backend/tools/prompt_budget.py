@@ -0,0 +1,127 @@
+"""
+Prompt Budget - keep input tokens down before a prompt is sent
+- count_tokens: local estimate (~4 characters per token), no API round trip
+- format_search_results: compact, trimmed search context instead of json.dumps(indent=2)
+  of raw Tavily results; each result gets a token budget and is cut on a word boundary
+- TokenLedger: prompt / completion / cached tokens Gemini reported, per endpoint
+- Context caching settings for large static system prompts (see gemini_client.get_model)
+"""
+
+import contextvars
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Callable, Union
+
+CHARS_PER_TOKEN = 4
+
+# Tokens of content kept per search result, and for the whole search context
+RESULT_TOKENS = int(os.getenv("PROMPT_RESULT_TOKENS", "120"))
+SEARCH_CONTEXT_TOKENS = int(os.getenv("PROMPT_SEARCH_CONTEXT_TOKENS", "600"))
+
+# Gemini only caches contexts above a model-specific minimum size
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "true").lower() != "false"
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", "32768"))
+CONTEXT_CACHE_TTL = int(os.getenv("CONTEXT_CACHE_TTL", "3600"))
+
+_endpoint: contextvars.ContextVar = contextvars.ContextVar("token_ledger_endpoint", default="background")
+
+
+def count_tokens(text: Any) -> int:
+    return (len(str(text)) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def trim_text(text: str, max_tokens: int) -> str:
+    """Cut text to about max_tokens on a word boundary"""
+    text = " ".join(str(text or "").split())
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars)
+    return text[:cut if cut > max_chars // 2 else max_chars].rstrip(" ,.;:") + "…"
+
+
+def format_search_results(
+    results: List[Dict[str, Any]],
+    max_results: int = 3,
+    result_tokens: Optional[int] = None,
+    total_tokens: Optional[int] = None
+) -> str:
+    """Numbered title / url / trimmed content lines for the top results, within the token budget"""
+    results = [r for r in (results or []) if isinstance(r, dict)][:max_results]
+    if not results:
+        return "(no results)"
+    # Share the total budget between the results, but never exceed the per-result budget
+    per_result = min(result_tokens or RESULT_TOKENS, (total_tokens or SEARCH_CONTEXT_TOKENS) // len(results))
+    lines = []
+    for i, result in enumerate(results, 1):
+        title = trim_text(result.get("title", ""), 25)
+        url = result.get("url", "")
+        lines.append(f"{i}. {title}" + (f" ({url})" if url else ""))
+        content = trim_text(result.get("content", ""), per_result)
+        if content:
+            lines.append(f"   {content}")
+    return "\n".join(lines)
+
+
+def context_cache_eligible(system_instruction: Optional[str]) -> bool:
+    return bool(CONTEXT_CACHE_ENABLED and system_instruction and count_tokens(system_instruction) >= CONTEXT_CACHE_MIN_TOKENS)
+
+
+@contextmanager
+def endpoint_scope(endpoint: Union[str, Callable[[], str]]):
+    """
+    Attribute the enclosed Gemini calls' token usage to an endpoint
+    A callable is resolved when usage is booked (e.g. once routing has matched the request)
+    """
+    token = _endpoint.set(endpoint)
+    try:
+        yield
+    finally:
+        _endpoint.reset(token)
+
+
+def current_endpoint() -> str:
+    endpoint = _endpoint.get()
+    return endpoint() if callable(endpoint) else endpoint
+
+
+class TokenLedger:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, int]] = {}
+    
+    def record(self, usage: Any, endpoint: Optional[str] = None) -> None:
+        """Add a response's usage_metadata to the current (or given) endpoint's totals"""
+        if usage is None:
+            return
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        completion_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        cached_tokens = getattr(usage, "cached_content_token_count", 0) or 0
+        if not isinstance(prompt_tokens, int) or not isinstance(completion_tokens, int):
+            return
+        
+        endpoint = endpoint or current_endpoint()
+        with self._lock:
+            entry = self._entries.setdefault(endpoint, {
+                "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0
+            })
+            entry["calls"] += 1
+            entry["prompt_tokens"] += prompt_tokens
+            entry["completion_tokens"] += completion_tokens
+            entry["cached_tokens"] += cached_tokens if isinstance(cached_tokens, int) else 0
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            endpoints = {name: dict(entry) for name, entry in self._entries.items()}
+        for entry in endpoints.values():
+            entry["avg_prompt_tokens"] = round(entry["prompt_tokens"] / entry["calls"], 1) if entry["calls"] else 0.0
+        totals = {
+            key: sum(entry[key] for entry in endpoints.values())
+            for key in ("calls", "prompt_tokens", "completion_tokens", "cached_tokens")
+        }
+        return {"endpoints": endpoints, "totals": totals}
+
+
+# Process-wide ledger fed by gemini_client
+token_ledger = TokenLedger()
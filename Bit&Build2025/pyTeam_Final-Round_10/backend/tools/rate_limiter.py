@@ -0,0 +1,214 @@
+"""
+Rate Governor - process-wide requests/min and tokens/min budgets for Gemini
+Every call takes one request from the RPM bucket and its estimated tokens from the
+TPM bucket before it is sent. Once the response reports real usage, the difference
+is settled with the TPM bucket. Callers that don't fit wait in priority-ordered
+FIFO queues instead of failing, so interactive agent calls go ahead of background
+work and nobody overtakes an earlier caller of the same class.
+"""
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+# Lower value = served first
+PRIORITIES = {"interactive": 0, "default": 1, "background": 2}
+
+# Default (requests/min, tokens/min) per quota, overridable with <NAME>_RPM / <NAME>_TPM
+DEFAULT_LIMITS = {
+    "gemini": (60, 1000000),
+    "gemini_embed": (1500, 1000000),
+}
+
+_priority: contextvars.ContextVar = contextvars.ContextVar("gemini_priority", default="default")
+
+
+@contextmanager
+def priority_scope(priority: str):
+    """Run the enclosed Gemini calls (including asyncio.to_thread work) under a priority class"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+def estimate_tokens(contents: Any, generation_config: Optional[Dict[str, Any]] = None) -> int:
+    """Rough pre-call estimate: ~4 characters per prompt token plus the output budget"""
+    max_output = 1024
+    if isinstance(generation_config, dict):
+        max_output = generation_config.get("max_output_tokens", max_output)
+    return len(str(contents)) // 4 + max_output
+
+
+class TokenBucket:
+    """Refills at capacity per minute; the balance may go negative when usage is settled after the fact"""
+    
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+    
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available (0 if it already is)"""
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+
+class _Ticket:
+    def __init__(self, tokens: int, priority: str):
+        self.tokens = tokens
+        self.priority = priority
+        self.granted = False
+        self.enqueued = time.monotonic()
+
+
+class RateGovernor:
+    def __init__(self, name: str, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        prefix = name.upper()
+        default_rpm, default_tpm = DEFAULT_LIMITS.get(name, DEFAULT_LIMITS["gemini"])
+        self.name = name
+        self.enabled = os.getenv("GEMINI_RATE_LIMIT_ENABLED", "true").lower() != "false"
+        self.requests = TokenBucket(rpm or float(os.getenv(f"{prefix}_RPM", str(default_rpm))))
+        self.tokens = TokenBucket(tpm or float(os.getenv(f"{prefix}_TPM", str(default_tpm))))
+        
+        self._lock = threading.Lock()
+        self._queues = {priority: deque() for priority in PRIORITIES}
+        
+        self.granted = 0
+        self.queued = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+    
+    def _head(self) -> Optional[_Ticket]:
+        for priority in sorted(PRIORITIES, key=PRIORITIES.get):
+            if self._queues[priority]:
+                return self._queues[priority][0]
+        return None
+    
+    def _pump(self) -> float:
+        """Grant queued tickets in order while both buckets allow it; return the wait for the next one"""
+        now = time.monotonic()
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        while True:
+            head = self._head()
+            if head is None:
+                return 0.0
+            # A single call larger than the whole budget only has to wait for a full bucket
+            needed = min(head.tokens, self.tokens.capacity)
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(needed))
+            if wait > 0:
+                return wait
+            self.requests.tokens -= 1
+            self.tokens.tokens -= head.tokens
+            self._queues[head.priority].popleft()
+            head.granted = True
+            self.granted += 1
+            self.total_wait += now - head.enqueued
+    
+    def _enqueue(self, tokens: int, priority: Optional[str]) -> _Ticket:
+        priority = priority or current_priority()
+        if priority not in PRIORITIES:
+            priority = "default"
+        ticket = _Ticket(max(0, int(tokens)), priority)
+        with self._lock:
+            self._queues[priority].append(ticket)
+            self._pump()
+            if not ticket.granted:
+                self.queued += 1
+        return ticket
+    
+    def _poll(self) -> float:
+        """Grant whatever fits now; return how long to sleep before polling again"""
+        with self._lock:
+            wait = self._pump()
+        # Poll at least every 50ms - tickets ahead of us may be granted or cancelled meanwhile
+        return min(max(wait, 0.005), 0.05)
+    
+    def acquire(self, tokens: int, priority: Optional[str] = None) -> None:
+        """Block the calling thread until the call fits the budget"""
+        if not self.enabled:
+            return
+        ticket = self._enqueue(tokens, priority)
+        while not ticket.granted:
+            delay = self._poll()
+            if not ticket.granted:
+                time.sleep(delay)
+    
+    async def aacquire(self, tokens: int, priority: Optional[str] = None) -> None:
+        """Wait (without blocking the event loop) until the call fits the budget"""
+        if not self.enabled:
+            return
+        ticket = self._enqueue(tokens, priority)
+        try:
+            while not ticket.granted:
+                delay = self._poll()
+                if not ticket.granted:
+                    await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            with self._lock:
+                if not ticket.granted:
+                    self._queues[ticket.priority].remove(ticket)
+            raise
+    
+    def settle(self, estimated: int, actual: Optional[int]) -> None:
+        """Replace a call's estimated token charge with the usage the provider reported"""
+        if not self.enabled or actual is None:
+            return
+        with self._lock:
+            self.tokens.tokens = min(self.tokens.capacity, self.tokens.tokens + estimated - actual)
+    
+    def throttle(self) -> None:
+        """Provider returned 429 - empty the request bucket so queued calls back off together"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.requests.refill(time.monotonic())
+            self.requests.tokens = min(self.requests.tokens, 0.0)
+            self.throttled += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._pump()
+            return {
+                "enabled": self.enabled,
+                "rpm": self.requests.capacity,
+                "tpm": self.tokens.capacity,
+                "available_requests": round(self.requests.tokens, 2),
+                "available_tokens": round(self.tokens.tokens),
+                "waiting": {priority: len(queue) for priority, queue in self._queues.items()},
+                "granted": self.granted,
+                "queued": self.queued,
+                "throttled": self.throttled,
+                "avg_wait_ms": round(self.total_wait / self.granted * 1000, 1) if self.granted else 0.0,
+            }
+
+
+_governors: Dict[str, RateGovernor] = {}
+_governors_lock = threading.Lock()
+
+
+def get_governor(name: str = "gemini") -> RateGovernor:
+    """Process-wide governor for a quota ("gemini" for generation, "gemini_embed" for embeddings)"""
+    with _governors_lock:
+        governor = _governors.get(name)
+        if governor is None:
+            governor = RateGovernor(name)
+            _governors[name] = governor
+        return governor
@@ -3,7 +3,6 @@ import json
 from datetime import datetime
 from pathlib import Path
 from io import BytesIO
-import google.generativeai as genai
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -12,13 +11,12 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, Tabl
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_JUSTIFY
 from reportlab.pdfgen import canvas
 import markdown
-import re
 
-# Initialize Gemini
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+from tools import gemini_client
+from tools.json_extractor import extract_json
 
-async def generate_campaign_summary(nodes: list, workflow_name: str) -> dict:
-    """Generate a comprehensive campaign summary using LLM"""
+def build_summary_prompt(nodes: list, workflow_name: str) -> str:
+    """Build the executive summary prompt from the workflow's agent outputs"""
     
     # Extract agent outputs
     agent_outputs = []
@@ -83,58 +81,78 @@ Please format your response as a JSON object with these sections as keys. Each s
 
 Make it professional, data-driven, and actionable.
 """
+    return prompt
+
+def summary_metadata(nodes: list, workflow_name: str) -> dict:
+    return {
+        "campaign_name": workflow_name,
+        "generated_at": datetime.now().isoformat(),
+        "total_agents": len(nodes),
+        "agent_types": list(set([n["data"]["agentType"] for n in nodes if "data" in n]))
+    }
+
+def parse_summary_response(response_text: str, nodes: list, workflow_name: str) -> dict:
+    """Turn the model's summary text into the report's summary dict"""
+    response_text = response_text.strip()
     
-    try:
-        # Use Gemini 2.0 Flash for better performance and compatibility
-        model = genai.GenerativeModel("gemini-2.0-flash-exp")
-        response = model.generate_content(prompt)
-        
-        # Parse the response
-        response_text = response.text.strip()
-        
-        # Try to extract JSON from the response
-        json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-        if json_match:
-            summary_data = json.loads(json_match.group())
-        else:
-            # Fallback: create structured data from text
-            summary_data = {
-                "executive_summary": {
-                    "title": "Executive Summary",
-                    "content": [response_text[:500]]
-                },
-                "full_text": response_text
-            }
-        
-        # Add metadata
-        summary_data["metadata"] = {
-            "campaign_name": workflow_name,
-            "generated_at": datetime.now().isoformat(),
-            "total_agents": len(nodes),
-            "agent_types": list(set([n["data"]["agentType"] for n in nodes if "data" in n]))
+    # Try to extract JSON from the response
+    summary_data = extract_json(response_text)
+    if summary_data is None:
+        # Fallback: create structured data from text
+        summary_data = {
+            "executive_summary": {
+                "title": "Executive Summary",
+                "content": [response_text[:500]]
+            },
+            "full_text": response_text
         }
+    
+    # Add metadata
+    summary_data["metadata"] = summary_metadata(nodes, workflow_name)
+    
+    return summary_data
+
+def fallback_summary(nodes: list, workflow_name: str) -> dict:
+    """Basic summary used when the model call or parsing fails"""
+    return {
+        "executive_summary": {
+            "title": "Executive Summary",
+            "content": [
+                f"Campaign '{workflow_name}' consists of {len(nodes)} agents working in coordination.",
+                "This automated campaign leverages AI-powered strategy, copywriting, visual design, research, and media planning.",
+                "The integrated workflow ensures consistent messaging and optimized performance across all channels."
+            ]
+        },
+        "metadata": summary_metadata(nodes, workflow_name)
+    }
+
+async def generate_campaign_summary(nodes: list, workflow_name: str) -> dict:
+    """Generate a comprehensive campaign summary using LLM"""
+    prompt = build_summary_prompt(nodes, workflow_name)
+    
+    try:
+        # Use Gemini 2.0 Flash for better performance and compatibility (falls back along LLM_FALLBACK_MODELS)
+        response, _ = await gemini_client.agenerate_with_fallback(prompt)
         
-        return summary_data
+        return parse_summary_response(response.text, nodes, workflow_name)
         
     except Exception as e:
         print(f"Error generating summary: {str(e)}")
         # Return a basic fallback summary
-        return {
-            "executive_summary": {
-                "title": "Executive Summary",
-                "content": [
-                    f"Campaign '{workflow_name}' consists of {len(nodes)} agents working in coordination.",
-                    "This automated campaign leverages AI-powered strategy, copywriting, visual design, research, and media planning.",
-                    "The integrated workflow ensures consistent messaging and optimized performance across all channels."
-                ]
-            },
-            "metadata": {
-                "campaign_name": workflow_name,
-                "generated_at": datetime.now().isoformat(),
-                "total_agents": len(nodes),
-                "agent_types": list(set([n["data"]["agentType"] for n in nodes if "data" in n]))
-            }
-        }
+        return fallback_summary(nodes, workflow_name)
+
+async def stream_campaign_summary(nodes: list, workflow_name: str):
+    """Stream the summary text as the model produces it (parse it with parse_summary_response)"""
+    response, _ = await gemini_client.agenerate_with_fallback(build_summary_prompt(nodes, workflow_name), stream=True)
+    
+    async for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            continue
+        if text:
+            yield text
+    gemini_client.settle_stream(response)
 
 
 def format_output_for_pdf(output: dict, agent_type: str) -> str:
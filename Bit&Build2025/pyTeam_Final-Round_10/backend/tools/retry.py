@@ -0,0 +1,195 @@
+"""
+Retry helpers for tool calls
+Non-blocking retries with full-jitter exponential backoff, retryable/permanent
+error classification, provider Retry-After hints and per-attempt timing.
+"""
+
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Callable, Awaitable, Optional
+
+from tools.telemetry import attempt_scope
+
+# HTTP statuses worth retrying - rate limits, overload and transient gateway errors
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+# Exception types that signal a problem with the request itself, so retrying can't help
+PERMANENT_ERROR_TYPES = {
+    "ValidationError", "ValueError", "TypeError", "KeyError",
+    "JSONDecodeError", "InvalidArgument", "PermissionDenied", "NotFound",
+    "Unauthenticated", "InvalidAPIKeyError", "BadRequestError",
+    # Every model in the fallback chain is tripped - retrying within seconds can't help
+    "CircuitOpenError",
+}
+
+# Error text fragments for transient provider failures that only surface as strings
+TRANSIENT_MARKERS = (
+    "timeout", "timed out", "deadline exceeded", "resource exhausted",
+    "rate limit", "quota", "temporarily unavailable", "service unavailable",
+    "connection reset", "connection aborted", "429", "503",
+)
+
+
+def parse_retry_after(value: Any) -> Optional[float]:
+    """Parse a Retry-After header (delta-seconds or HTTP date) into seconds"""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = parsedate_to_datetime(str(value))
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def error_details(error: Exception) -> Dict[str, Any]:
+    """
+    Convert a provider exception into the failure fields used by tool results:
+    error, error_type, status_code and retry_after (when the provider sent them)
+    """
+    details = {
+        "error": str(error),
+        "error_type": type(error).__name__,
+    }
+    
+    # google.api_core exceptions carry the HTTP status in .code, HTTP clients in .status_code
+    response = getattr(error, "response", None)
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(response, "status_code", None)
+    if status_code is None:
+        status_code = getattr(error, "code", None)
+    if isinstance(status_code, int):
+        details["status_code"] = status_code
+    
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        retry_after = parse_retry_after(headers.get("Retry-After"))
+        if retry_after is not None:
+            details["retry_after"] = retry_after
+    
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)) or "Timeout" in type(error).__name__:
+        details["timeout"] = True
+    
+    return details
+
+
+def response_error_details(status_code: int, headers: Any, body: str) -> Dict[str, Any]:
+    """Failure fields for a non-2xx HTTP response"""
+    details = {
+        "error": f"API returned status {status_code}: {body}",
+        "status_code": status_code,
+    }
+    retry_after = parse_retry_after(headers.get("Retry-After")) if headers is not None else None
+    if retry_after is None and status_code == 503:
+        # Hugging Face reports model warm-up time in the body instead of a header
+        try:
+            retry_after = float(json.loads(body).get("estimated_time"))
+        except (ValueError, TypeError, AttributeError):
+            retry_after = None
+    if retry_after is not None:
+        details["retry_after"] = retry_after
+    return details
+
+
+def is_retryable(result: Dict[str, Any]) -> bool:
+    """Decide whether a failed tool result is worth another attempt"""
+    if result.get("retryable") is not None:
+        return bool(result["retryable"])
+    
+    status_code = result.get("status_code")
+    if isinstance(status_code, int):
+        return status_code in RETRYABLE_STATUS_CODES
+    
+    if result.get("timeout"):
+        return True
+    
+    if result.get("error_type") in PERMANENT_ERROR_TYPES:
+        return False
+    
+    error_text = str(result.get("error", "")).lower()
+    if any(marker in error_text for marker in TRANSIENT_MARKERS):
+        return True
+    
+    # Unknown failures (network hiccups, provider glitches) keep the old retry behaviour
+    return True
+
+
+def compute_backoff(attempt: int, retry_policy: Any, retry_after: Optional[float] = None) -> float:
+    """
+    Seconds to wait before the next attempt.
+    Full jitter: uniform(0, min(max_delay, base_delay * 2 ** attempt)), or a linear
+    ceiling for "linear" policies. A provider Retry-After hint takes precedence.
+    """
+    base_delay = getattr(retry_policy, "base_delay", 1.0)
+    max_delay = getattr(retry_policy, "max_delay", 30.0)
+    
+    if retry_after is not None:
+        return min(retry_after, max_delay)
+    
+    if getattr(retry_policy, "backoff", "exponential") == "exponential":
+        ceiling = base_delay * (2 ** attempt)
+    else:
+        ceiling = base_delay * (attempt + 1)
+    
+    return random.uniform(0, min(max_delay, ceiling))
+
+
+async def run_with_retry(
+    call: Callable[[], Awaitable[Dict[str, Any]]],
+    retry_policy: Any
+) -> Dict[str, Any]:
+    """
+    Run a tool call until it succeeds, fails permanently or runs out of attempts.
+    The returned result carries an "attempts" list with per-attempt timing.
+    """
+    max_attempts = max(1, getattr(retry_policy, "max_attempts", 3))
+    attempts = []
+    started = time.perf_counter()
+    result: Dict[str, Any] = {"success": False, "error": "Max retries exceeded"}
+    
+    for attempt in range(max_attempts):
+        attempt_started = time.perf_counter()
+        try:
+            # Telemetry counts invocations after the first as retries
+            with attempt_scope(attempt + 1):
+                result = await call()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            result = {"success": False, **error_details(e)}
+        
+        record = {
+            "attempt": attempt + 1,
+            "started_ms": round((attempt_started - started) * 1000, 1),
+            "duration_ms": round((time.perf_counter() - attempt_started) * 1000, 1),
+            "success": bool(result.get("success")),
+        }
+        attempts.append(record)
+        
+        if result.get("success"):
+            break
+        
+        record["error"] = result.get("error", "Unknown error")
+        if result.get("status_code") is not None:
+            record["status_code"] = result["status_code"]
+        
+        retryable = is_retryable(result)
+        record["retryable"] = retryable
+        if not retryable or attempt == max_attempts - 1:
+            break
+        
+        wait_time = compute_backoff(attempt, retry_policy, result.get("retry_after"))
+        record["wait_ms"] = round(wait_time * 1000, 1)
+        await asyncio.sleep(wait_time)
+    
+    result = dict(result)
+    result["attempts"] = attempts
+    return result
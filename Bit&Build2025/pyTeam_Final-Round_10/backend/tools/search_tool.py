@@ -1,6 +1,10 @@
 import os
 from typing import Dict, Any, List
-from tavily import TavilyClient
+from tavily import TavilyClient, AsyncTavilyClient
+
+from tools.retry import error_details
+from tools.single_flight import SingleFlight
+from tools.telemetry import instrument
 
 class SearchTool:
     def __init__(self):
@@ -8,12 +12,34 @@ class SearchTool:
         if not api_key:
             print("WARNING: TAVILY_API_KEY not found in environment variables")
             self.client = None
+            self.async_client = None
         else:
             try:
                 self.client = TavilyClient(api_key=api_key)
+                self.async_client = AsyncTavilyClient(api_key=api_key)
             except Exception as e:
                 print(f"WARNING: Failed to initialize Tavily client: {str(e)}")
                 self.client = None
+                self.async_client = None
+        
+        # Identical concurrent searches share one Tavily request
+        self.single_flight = SingleFlight("web_search")
+    
+    def _format_results(self, response: Dict[str, Any], query: str) -> Dict[str, Any]:
+        results = []
+        for item in response.get("results", []):
+            results.append({
+                "title": item.get("title", ""),
+                "url": item.get("url", ""),
+                "content": item.get("content", ""),
+                "score": item.get("score", 0)
+            })
+        
+        return {
+            "success": True,
+            "results": results,
+            "query": query
+        }
         
     def web_search(self, tool_input: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -28,6 +54,8 @@ class SearchTool:
             return {
                 "success": False,
                 "error": "Tavily API client not initialized",
+                # Configuration problem - another attempt would fail the same way
+                "retryable": False,
                 "results": []
             }
             
@@ -39,6 +67,7 @@ class SearchTool:
                 return {
                     "success": False,
                     "error": "No query provided",
+                    "retryable": False,
                     "results": []
                 }
             
@@ -48,25 +77,58 @@ class SearchTool:
                 search_depth="basic"
             )
             
-            results = []
-            for item in response.get("results", []):
-                results.append({
-                    "title": item.get("title", ""),
-                    "url": item.get("url", ""),
-                    "content": item.get("content", ""),
-                    "score": item.get("score", 0)
-                })
+            return self._format_results(response, query)
             
+        except Exception as e:
+            print(f"Search error: {str(e)}")
+            return {
+                "success": False,
+                **error_details(e),
+                "results": []
+            }
+    
+    @instrument("web_search", provider="tavily")
+    async def aweb_search(self, tool_input: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Async variant of web_search using Tavily's async client
+        Concurrent calls with the same input share one request
+        """
+        return await self.single_flight.do(tool_input, lambda: self._aweb_search(tool_input))
+    
+    async def _aweb_search(self, tool_input: Dict[str, Any]) -> Dict[str, Any]:
+        if not self.async_client:
             return {
-                "success": True,
-                "results": results,
-                "query": query
+                "success": False,
+                "error": "Tavily API client not initialized",
+                # Configuration problem - another attempt would fail the same way
+                "retryable": False,
+                "results": []
             }
+        
+        try:
+            query = tool_input.get("q", "")
+            max_results = tool_input.get("max_results", 5)
+            
+            if not query:
+                return {
+                    "success": False,
+                    "error": "No query provided",
+                    "retryable": False,
+                    "results": []
+                }
+            
+            response = await self.async_client.search(
+                query=query,
+                max_results=max_results,
+                search_depth="basic"
+            )
             
+            return self._format_results(response, query)
+        
         except Exception as e:
             print(f"Search error: {str(e)}")
             return {
                 "success": False,
-                "error": str(e),
+                **error_details(e),
                 "results": []
             }
@@ -0,0 +1,347 @@
+"""
+Semantic Cache - reuse agent outputs for near-duplicate inputs
+Inputs are normalized, embedded with LLMTool.compute_embedding and matched against a
+per-endpoint vector index by cosine similarity. Vectors live in contiguous float32
+NumPy blocks; small namespaces use brute-force search, large ones an IVF index.
+"""
+
+import asyncio
+import heapq
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
+
+import numpy as np
+
+
+class VectorIndex:
+    """
+    Cosine-similarity index over unit vectors stored in contiguous float32 blocks.
+    Below ivf_threshold entries everything lives in one block and search is brute force.
+    Above it, spherical k-means centroids split the entries into inverted lists, each
+    kept as its own contiguous block, and only the nprobe closest lists are scanned.
+    """
+    
+    def __init__(self, dim: int, ivf_threshold: int = 20000, nprobe: int = 8):
+        self.dim = dim
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        
+        self._centroids: Optional[np.ndarray] = None
+        self._trained_size = 0
+        self._reset_lists(1)
+        
+        # entry id -> (list, slot)
+        self._locations: Dict[int, Tuple[int, int]] = {}
+        self._next_id = 0
+        self._dead = 0
+    
+    def __len__(self) -> int:
+        return len(self._locations)
+    
+    def _reset_lists(self, nlist: int, capacity: int = 64) -> None:
+        self._blocks = [np.empty((capacity, self.dim), dtype=np.float32) for _ in range(nlist)]
+        self._block_ids = [np.empty(capacity, dtype=np.int64) for _ in range(nlist)]
+        self._block_alive = [np.zeros(capacity, dtype=bool) for _ in range(nlist)]
+        self._block_sizes = [0] * nlist
+    
+    @staticmethod
+    def _normalize(vector: Any) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(v)
+        return v / norm if norm > 0 else v
+    
+    def _append(self, list_id: int, entry_id: int, vector: np.ndarray) -> None:
+        size = self._block_sizes[list_id]
+        if size == len(self._blocks[list_id]):
+            capacity = max(64, size * 2)
+            block = np.empty((capacity, self.dim), dtype=np.float32)
+            block[:size] = self._blocks[list_id][:size]
+            ids = np.empty(capacity, dtype=np.int64)
+            ids[:size] = self._block_ids[list_id][:size]
+            alive = np.zeros(capacity, dtype=bool)
+            alive[:size] = self._block_alive[list_id][:size]
+            self._blocks[list_id], self._block_ids[list_id], self._block_alive[list_id] = block, ids, alive
+        
+        self._blocks[list_id][size] = vector
+        self._block_ids[list_id][size] = entry_id
+        self._block_alive[list_id][size] = True
+        self._block_sizes[list_id] = size + 1
+        self._locations[entry_id] = (list_id, size)
+    
+    def add(self, vector: Any) -> int:
+        """Insert a vector and return its entry id"""
+        v = self._normalize(vector)
+        list_id = 0 if self._centroids is None else int(np.argmax(self._centroids @ v))
+        entry_id = self._next_id
+        self._next_id += 1
+        self._append(list_id, entry_id, v)
+        
+        if len(self) >= self.ivf_threshold and len(self) >= 2 * self._trained_size:
+            self._train()
+        elif self._dead > max(64, len(self)):
+            self._compact()
+        return entry_id
+    
+    def remove(self, entry_id: int) -> None:
+        location = self._locations.pop(entry_id, None)
+        if location is not None:
+            list_id, slot = location
+            self._block_alive[list_id][slot] = False
+            self._dead += 1
+    
+    def _compact(self) -> None:
+        """Drop removed slots from every list so evicted entries stop taking memory"""
+        for list_id in range(len(self._blocks)):
+            size = self._block_sizes[list_id]
+            alive = np.flatnonzero(self._block_alive[list_id][:size])
+            capacity = max(64, len(alive) * 2)
+            block = np.empty((capacity, self.dim), dtype=np.float32)
+            block[:len(alive)] = self._blocks[list_id][alive]
+            ids = np.empty(capacity, dtype=np.int64)
+            ids[:len(alive)] = self._block_ids[list_id][alive]
+            flags = np.zeros(capacity, dtype=bool)
+            flags[:len(alive)] = True
+            self._blocks[list_id], self._block_ids[list_id], self._block_alive[list_id] = block, ids, flags
+            self._block_sizes[list_id] = len(alive)
+            for slot, entry_id in enumerate(ids[:len(alive)].tolist()):
+                self._locations[entry_id] = (list_id, slot)
+        self._dead = 0
+    
+    def search(self, vector: Any) -> Tuple[int, float]:
+        """Return (entry id, cosine similarity) of the closest live vector, or (-1, -1.0)"""
+        if len(self) == 0:
+            return -1, -1.0
+        query = self._normalize(vector)
+        
+        if self._centroids is None:
+            probes = [0]
+        else:
+            nprobe = min(self.nprobe, len(self._centroids))
+            probes = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe].tolist()
+        
+        best_id, best_score = -1, -np.inf
+        for list_id in probes:
+            size = self._block_sizes[list_id]
+            if size == 0:
+                continue
+            scores = self._blocks[list_id][:size] @ query
+            scores[~self._block_alive[list_id][:size]] = -np.inf
+            slot = int(np.argmax(scores))
+            if scores[slot] > best_score:
+                best_id, best_score = int(self._block_ids[list_id][slot]), float(scores[slot])
+        
+        if not math.isfinite(best_score):
+            return -1, -1.0
+        return best_id, best_score
+    
+    def _train(self, iterations: int = 5) -> None:
+        """Spherical k-means over the live entries, then rebuild the inverted lists"""
+        ids = np.fromiter(self._locations.keys(), dtype=np.int64, count=len(self._locations))
+        vectors = np.empty((len(ids), self.dim), dtype=np.float32)
+        for i, entry_id in enumerate(ids.tolist()):
+            list_id, slot = self._locations[entry_id]
+            vectors[i] = self._blocks[list_id][slot]
+        
+        nlist = max(1, int(math.sqrt(len(ids))))
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), nlist * 16), replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[assignment == c]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    norm = np.linalg.norm(centroid)
+                    if norm > 0:
+                        centroids[c] = centroid / norm
+        
+        # Assign in chunks to bound the temporary score matrix
+        assignment = np.empty(len(ids), dtype=np.int64)
+        for start in range(0, len(ids), 8192):
+            assignment[start:start + 8192] = np.argmax(vectors[start:start + 8192] @ centroids.T, axis=1)
+        
+        self._centroids = centroids
+        counts = np.bincount(assignment, minlength=nlist)
+        self._reset_lists(nlist, capacity=1)
+        for c in range(nlist):
+            members = np.flatnonzero(assignment == c)
+            capacity = max(64, int(counts[c] * 2))
+            block = np.empty((capacity, self.dim), dtype=np.float32)
+            block[:len(members)] = vectors[members]
+            block_ids = np.empty(capacity, dtype=np.int64)
+            block_ids[:len(members)] = ids[members]
+            alive = np.zeros(capacity, dtype=bool)
+            alive[:len(members)] = True
+            self._blocks[c], self._block_ids[c], self._block_alive[c] = block, block_ids, alive
+            self._block_sizes[c] = len(members)
+            for slot, entry_id in enumerate(ids[members].tolist()):
+                self._locations[entry_id] = (c, slot)
+        self._trained_size = len(ids)
+        self._dead = 0
+
+
+class _Namespace:
+    def __init__(self, dim: int, ttl: float, threshold: float):
+        self.index = VectorIndex(dim)
+        self.ttl = ttl
+        self.threshold = threshold
+        # Least recently used first
+        self.outputs: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self.expires: Dict[int, float] = {}
+        # (expiry, row) min-heap; rows dropped some other way are skipped when they surface
+        self.expiry_heap: List[Tuple[float, int]] = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def drop(self, row: int) -> None:
+        self.index.remove(row)
+        self.outputs.pop(row, None)
+        self.expires.pop(row, None)
+    
+    def sweep(self, now: float) -> None:
+        """Drop every entry whose TTL has passed"""
+        while self.expiry_heap and self.expiry_heap[0][0] <= now:
+            expires, row = heapq.heappop(self.expiry_heap)
+            if self.expires.get(row) == expires:
+                self.drop(row)
+        # Evicted rows leave stale heap entries behind - rebuild once they dominate
+        if len(self.expiry_heap) > 2 * len(self.expires) + 64:
+            self.expiry_heap = [(expires, row) for row, expires in self.expires.items()]
+            heapq.heapify(self.expiry_heap)
+
+
+class SemanticCache:
+    """
+    Opt-in cache keyed by meaning rather than exact text.
+    Enable globally with SEMANTIC_CACHE_ENABLED=true or per request with "semantic_cache": true.
+    Each namespace keeps at most SEMANTIC_CACHE_MAX_ENTRIES entries, evicting the least recently used.
+    """
+    
+    def __init__(
+        self,
+        embed: Callable[[str], Awaitable[Optional[List[float]]]],
+        threshold: Optional[float] = None,
+        ttl: Optional[float] = None,
+        namespace_ttls: Optional[Dict[str, float]] = None,
+        max_entries: Optional[int] = None
+    ):
+        self.embed = embed
+        self.enabled = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+        self.threshold = threshold if threshold is not None else float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+        self.ttl = ttl if ttl is not None else float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+        self.namespace_ttls = namespace_ttls or {}
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "100000"))
+        
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._lock = threading.Lock()
+        # Recent embeddings, so store() after a missed lookup needs no second embedding call
+        self._recent_vectors: "OrderedDict[str, List[float]]" = OrderedDict()
+    
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Lowercase, drop punctuation and collapse whitespace"""
+        text = re.sub(r"[^\w\s]", " ", str(text).lower())
+        return " ".join(text.split())
+    
+    def is_enabled(self, requested: Optional[bool] = None) -> bool:
+        return requested if requested is not None else self.enabled
+    
+    async def _vector_for(self, text: str) -> Optional[List[float]]:
+        vector = self._recent_vectors.get(text)
+        if vector is None:
+            vector = await self.embed(text)
+            if vector is None:
+                return None
+            self._recent_vectors[text] = vector
+            while len(self._recent_vectors) > 256:
+                self._recent_vectors.popitem(last=False)
+        return vector
+    
+    def _namespace(self, name: str, dim: int) -> _Namespace:
+        namespace = self._namespaces.get(name)
+        if namespace is None:
+            namespace = _Namespace(dim, self.namespace_ttls.get(name, self.ttl), self.threshold)
+            self._namespaces[name] = namespace
+        return namespace
+    
+    async def lookup(self, namespace: str, text: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Return (cached output, similarity) for a near-duplicate input, or None"""
+        normalized = self.normalize(text)
+        if not normalized:
+            return None
+        vector = await self._vector_for(normalized)
+        if vector is None:
+            return None
+        
+        return await asyncio.to_thread(self._lookup_vector, namespace, vector)
+    
+    def _lookup_vector(self, namespace: str, vector: List[float]) -> Optional[Tuple[Dict[str, Any], float]]:
+        with self._lock:
+            ns = self._namespace(namespace, len(vector))
+            now = time.time()
+            while True:
+                row, score = ns.index.search(vector)
+                if row < 0 or ns.expires.get(row, 0) > now:
+                    break
+                # Expired - drop it and look again
+                ns.drop(row)
+            
+            if row >= 0 and score >= ns.threshold:
+                ns.hits += 1
+                ns.outputs.move_to_end(row)
+                return ns.outputs[row], score
+            ns.misses += 1
+            return None
+    
+    async def store(self, namespace: str, text: str, output: Dict[str, Any]) -> None:
+        normalized = self.normalize(text)
+        if not normalized:
+            return
+        vector = await self._vector_for(normalized)
+        if vector is None:
+            return
+        
+        # Inserts may retrain the IVF lists, so keep them off the event loop
+        await asyncio.to_thread(self._store_vector, namespace, vector, output)
+    
+    def _store_vector(self, namespace: str, vector: List[float], output: Dict[str, Any]) -> None:
+        with self._lock:
+            ns = self._namespace(namespace, len(vector))
+            now = time.time()
+            ns.sweep(now)
+            
+            row = ns.index.add(vector)
+            ns.outputs[row] = output
+            ns.expires[row] = now + ns.ttl
+            heapq.heappush(ns.expiry_heap, (ns.expires[row], row))
+            
+            while len(ns.outputs) > self.max_entries:
+                oldest = next(iter(ns.outputs))
+                ns.drop(oldest)
+                ns.evictions += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "threshold": self.threshold,
+                "max_entries": self.max_entries,
+                "namespaces": {
+                    name: {
+                        "entries": len(ns.index),
+                        "hits": ns.hits,
+                        "misses": ns.misses,
+                        "evictions": ns.evictions,
+                        "ttl": ns.ttl,
+                    }
+                    for name, ns in self._namespaces.items()
+                },
+            }
@@ -0,0 +1,87 @@
+"""
+Single-flight request coalescing for async tool calls
+Concurrent calls with the same normalized input share one upstream request: the
+first caller starts it, later callers wait on the same task and every waiter gets
+its result (or its exception). If every waiter goes away, the request is cancelled.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+from typing import Dict, Any, Callable, Awaitable
+
+
+def normalize_input(value: Any) -> Any:
+    """Canonical form of a tool input - trimmed strings and sorted keys"""
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return {str(k): normalize_input(v) for k, v in sorted(value.items(), key=lambda item: str(item[0]))}
+    if isinstance(value, (list, tuple)):
+        return [normalize_input(v) for v in value]
+    return value
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self.enabled = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() != "false"
+        self._flights: Dict[str, _Flight] = {}
+        
+        self.calls = 0
+        self.shared = 0
+        self.cancelled = 0
+    
+    def make_key(self, tool_input: Dict[str, Any]) -> str:
+        canonical = json.dumps(normalize_input(tool_input), sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(f"{self.name}\0{canonical}".encode("utf-8")).hexdigest()
+    
+    async def do(self, tool_input: Dict[str, Any], call: Callable[[], Awaitable[Any]]) -> Any:
+        """Run call() once for all concurrent callers with the same tool input"""
+        if not self.enabled:
+            return await call()
+        
+        key = self.make_key(tool_input)
+        flight = self._flights.get(key)
+        if flight is None:
+            self.calls += 1
+            flight = _Flight(asyncio.ensure_future(call()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            self.shared += 1
+        
+        flight.waiters += 1
+        try:
+            # Shield so one waiter being cancelled doesn't cancel the shared request
+            result = await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Nobody is waiting any more - stop the upstream request
+                flight.task.cancel()
+                self.cancelled += 1
+                self._forget(key, flight)
+        
+        # Waiters share one result, so hand each its own copy to mutate
+        return dict(result) if isinstance(result, dict) else result
+    
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "upstream_calls": self.calls,
+            "shared_calls": self.shared,
+            "cancelled": self.cancelled,
+            "in_flight": len(self._flights),
+        }
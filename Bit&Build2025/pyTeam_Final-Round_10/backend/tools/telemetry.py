@@ -0,0 +1,250 @@
+"""
+Telemetry - cost and latency accounting for every tool invocation
+@instrument wraps the async tool methods (llm_text, image_generate, web_search,
+moderation, compute_embedding) and records one entry per invocation: provider,
+model, wall time, queue wait, retry attempt, and input/output tokens or bytes.
+
+The in-flight entry lives in a contextvar, so lower layers add to it without being
+passed anything: gemini_client adds the tokens Gemini reports and the time spent
+waiting on the rate governor, the executor adds the time a call waited for a
+concurrency slot, run_with_retry marks the attempt number.
+
+Entries are grouped per run (a campaign generation, or a workflow run sent as the
+X-Workflow-Run-Id header) and per endpoint, with p50/p95/p99 latencies.
+"""
+
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+
+from tools.prompt_budget import current_endpoint
+from tools.metrics import TOOL_CALL_SECONDS
+
+# Invocations kept for the per-endpoint percentiles, and runs kept for per-run summaries
+RECENT_CALLS = int(os.getenv("TELEMETRY_RECENT_CALLS", "5000"))
+MAX_RUNS = int(os.getenv("TELEMETRY_MAX_RUNS", "500"))
+
+PERCENTILES = (50, 95, 99)
+
+_run: contextvars.ContextVar = contextvars.ContextVar("telemetry_run", default=None)
+_call: contextvars.ContextVar = contextvars.ContextVar("telemetry_call", default=None)
+_attempt: contextvars.ContextVar = contextvars.ContextVar("telemetry_attempt", default=1)
+_slot_wait: contextvars.ContextVar = contextvars.ContextVar("telemetry_slot_wait", default=0.0)
+
+
+@contextmanager
+def run_scope(run_id: Optional[str]):
+    """Attribute the enclosed tool invocations to a run (None leaves them unattributed)"""
+    token = _run.set(run_id)
+    try:
+        yield run_id
+    finally:
+        _run.reset(token)
+
+
+@contextmanager
+def attempt_scope(attempt: int):
+    token = _attempt.set(attempt)
+    try:
+        yield
+    finally:
+        _attempt.reset(token)
+
+
+@contextmanager
+def slot_wait_scope(seconds: float):
+    """Time the enclosed invocation already waited for a concurrency slot"""
+    token = _slot_wait.set(seconds)
+    try:
+        yield
+    finally:
+        _slot_wait.reset(token)
+
+
+def add_queue_wait(seconds: float) -> None:
+    """Add rate-limit / queue waiting to the in-flight invocation (no-op outside one)"""
+    entry = _call.get()
+    if entry is not None and seconds > 0:
+        entry["queue_wait_ms"] += seconds * 1000
+
+
+def add_usage(usage: Any) -> None:
+    """Add a Gemini response's usage_metadata to the in-flight invocation"""
+    entry = _call.get()
+    if entry is None or usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    completion_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    if isinstance(prompt_tokens, int) and isinstance(completion_tokens, int):
+        entry["input_tokens"] += prompt_tokens
+        entry["output_tokens"] += completion_tokens
+
+
+def _size(value: Any) -> int:
+    return len(json.dumps(value, default=str).encode("utf-8"))
+
+
+def _result_bytes(result: Dict[str, Any]) -> int:
+    if isinstance(result.get("bytes"), int):
+        # Image tools report the size of what they streamed to disk
+        return result["bytes"]
+    image_data = result.get("image_data")
+    if isinstance(image_data, str):
+        # Decoded size of the base64 payload - what the provider actually sent
+        return len(image_data) * 3 // 4
+    return _size({k: v for k, v in result.items() if k != "attempts"})
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """Nearest-rank p50/p95/p99 (zeros for no values)"""
+    if not values:
+        return {f"p{p}": 0.0 for p in PERCENTILES}
+    ordered = sorted(values)
+    return {
+        f"p{p}": round(ordered[max(0, -(-p * len(ordered) // 100) - 1)], 1)
+        for p in PERCENTILES
+    }
+
+
+def summarize(entries: List[Dict[str, Any]], breakdown: bool = True) -> Dict[str, Any]:
+    """Totals and latency percentiles of a set of invocations, optionally per tool and per model"""
+    summary = {
+        "calls": len(entries),
+        "failed": sum(1 for entry in entries if not entry["success"]),
+        "retries": sum(1 for entry in entries if entry["attempt"] > 1),
+        "cached": sum(1 for entry in entries if entry["cached"]),
+        "wall_ms_total": round(sum(entry["wall_ms"] for entry in entries), 1),
+        "wall_ms": percentiles([entry["wall_ms"] for entry in entries]),
+        "queue_wait_ms": percentiles([entry["queue_wait_ms"] for entry in entries]),
+        "input_tokens": sum(entry["input_tokens"] for entry in entries),
+        "output_tokens": sum(entry["output_tokens"] for entry in entries),
+        "input_bytes": sum(entry["input_bytes"] for entry in entries),
+        "output_bytes": sum(entry["output_bytes"] for entry in entries),
+    }
+    if breakdown:
+        by_tool: Dict[str, List[Dict[str, Any]]] = {}
+        by_model: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in entries:
+            by_tool.setdefault(entry["tool"], []).append(entry)
+            by_model.setdefault(f"{entry['provider']}/{entry['model']}", []).append(entry)
+        summary["by_tool"] = {tool: summarize(group, False) for tool, group in by_tool.items()}
+        summary["by_model"] = {model: summarize(group, False) for model, group in by_model.items()}
+    return summary
+
+
+class Telemetry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._recent: deque = deque(maxlen=RECENT_CALLS)
+        self._runs: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._campaigns: Dict[str, str] = {}
+    
+    def record(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._recent.append(entry)
+            run_id = entry.get("run_id")
+            if run_id:
+                self._runs.setdefault(run_id, []).append(entry)
+                self._runs.move_to_end(run_id)
+                while len(self._runs) > MAX_RUNS:
+                    evicted, _ = self._runs.popitem(last=False)
+                    self._campaigns.pop(evicted, None)
+    
+    def bind_campaign(self, run_id: str, campaign_id: str) -> None:
+        """Count a run's invocations (including ones already recorded) towards a campaign"""
+        with self._lock:
+            self._campaigns[run_id] = campaign_id
+    
+    def _campaign_entries(self, campaign_id: str) -> List[Dict[str, Any]]:
+        return [
+            entry
+            for run_id, entries in self._runs.items()
+            if self._campaigns.get(run_id) == campaign_id
+            for entry in entries
+        ]
+    
+    def campaign_summary(self, campaign_id: str) -> Dict[str, Any]:
+        """Every run of a campaign in this process (generation plus any resumes)"""
+        with self._lock:
+            entries = self._campaign_entries(campaign_id)
+        return summarize(entries)
+    
+    def run_summary(self, run_id: str) -> Dict[str, Any]:
+        with self._lock:
+            entries = list(self._runs.get(run_id, []))
+        return summarize(entries)
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            recent = list(self._recent)
+            campaigns = {campaign_id: self._campaign_entries(campaign_id) for campaign_id in set(self._campaigns.values())}
+            workflow_runs = {run_id: list(entries) for run_id, entries in self._runs.items() if run_id not in self._campaigns}
+        
+        by_endpoint: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in recent:
+            by_endpoint.setdefault(entry["endpoint"], []).append(entry)
+        
+        return {
+            "endpoints": {endpoint: summarize(entries) for endpoint, entries in by_endpoint.items()},
+            "campaigns": {campaign_id: summarize(entries) for campaign_id, entries in campaigns.items()},
+            "workflow_runs": {run_id: summarize(entries) for run_id, entries in workflow_runs.items()},
+            "recent_calls": len(recent),
+        }
+
+
+# Process-wide recorder fed by @instrument
+telemetry = Telemetry()
+
+
+def instrument(tool: str, provider: str) -> Callable:
+    """Record every call of an async tool method (method(self, tool_input) -> result dict)"""
+    def decorator(method: Callable[..., Awaitable[Dict[str, Any]]]) -> Callable[..., Awaitable[Dict[str, Any]]]:
+        @functools.wraps(method)
+        async def wrapper(self, tool_input: Dict[str, Any], *args, **kwargs) -> Dict[str, Any]:
+            entry = {
+                "tool": tool,
+                "provider": provider,
+                "model": tool_input.get("model"),
+                "run_id": _run.get(),
+                "endpoint": current_endpoint(),
+                "attempt": _attempt.get(),
+                "started_at": datetime.now().isoformat(),
+                "wall_ms": 0.0,
+                "queue_wait_ms": _slot_wait.get() * 1000,
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "input_bytes": _size(tool_input),
+                "output_bytes": 0,
+                "cached": False,
+                "success": False,
+            }
+            token = _call.set(entry)
+            started = time.perf_counter()
+            result = None
+            try:
+                result = await method(self, tool_input, *args, **kwargs)
+                return result
+            finally:
+                # Also reached when the tool raises or is cancelled - those count as failed calls
+                _call.reset(token)
+                entry["wall_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                entry["queue_wait_ms"] = round(entry["queue_wait_ms"], 1)
+                entry["model"] = entry["model"] or "default"
+                if isinstance(result, dict):
+                    entry["success"] = bool(result.get("success"))
+                    entry["cached"] = bool(result.get("cached"))
+                    entry["provider"] = result.get("provider") or provider
+                    entry["model"] = result.get("model") or entry["model"]
+                    entry["output_bytes"] = _result_bytes(result)
+                telemetry.record(entry)
+                outcome = "cached" if entry["cached"] else "success" if entry["success"] else "failure"
+                TOOL_CALL_SECONDS.observe(entry["wall_ms"] / 1000, tool, entry["provider"], outcome)
+        return wrapper
+    return decorator
@@ -0,0 +1,133 @@
+"""
+Template Responder - deterministic last-resort outputs for agent endpoints
+Used when every model in the Gemini fallback chain has failed or is tripped, so an
+outage returns a usable (clearly marked) answer in milliseconds instead of a 500.
+Outputs follow the same JSON shape each agent's prompt asks the model for.
+"""
+
+import re
+from typing import Dict, Any, List, Optional
+
+FALLBACK_NOTE = "Generated from templates while AI models are unavailable - regenerate for a tailored result"
+
+
+class TemplateResponder:
+    def __init__(self, media_planner=None):
+        # The media planner's defaults are the single source for fallback channel choices
+        self.media_planner = media_planner
+    
+    @staticmethod
+    def _topic(user_input: Any) -> str:
+        text = " ".join(str(user_input or "your brand").split())
+        first_sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+        return first_sentence[:80].rstrip(" .,!?") or "your brand"
+    
+    @staticmethod
+    def _keywords(topic: str, limit: int = 3) -> List[str]:
+        words = [w for w in re.findall(r"[A-Za-z][A-Za-z0-9]+", topic) if len(w) > 3]
+        return list(dict.fromkeys(w.lower() for w in words))[:limit] or ["brand"]
+    
+    def _channels(self) -> List[str]:
+        if self.media_planner is not None:
+            return list(self.media_planner._get_default_platform_analysis().get("platform_ranking", []))
+        return ["instagram", "facebook", "youtube"]
+    
+    def strategy(self, user_input: Any) -> Dict[str, Any]:
+        topic = self._topic(user_input)
+        return {
+            "core_concept": f"Position {topic} as the most relatable choice for its audience through authentic, benefit-led storytelling",
+            "tagline": f"{topic.split(' ')[0].capitalize()} that fits your life",
+            "target_audience": "Digitally active 18-34 year olds who discover products on social media",
+            "key_messages": [
+                f"What makes {topic} different",
+                "Real benefits, shown by real people",
+                "Easy to try, easy to love",
+            ],
+            "tone": "Friendly, confident and conversational",
+            "channels": self._channels(),
+            "note": FALLBACK_NOTE,
+        }
+    
+    def copywriting(self, user_input: Any) -> Dict[str, Any]:
+        topic = self._topic(user_input)
+        hashtags = " ".join(f"#{w}" for w in self._keywords(topic))
+        return {
+            "captions": [
+                f"Meet {topic} - made for the way you live."[:140],
+                f"Why everyone is talking about {topic}."[:140],
+                f"Your next favourite thing? {topic}."[:140],
+            ],
+            "cta": "Discover more - tap the link in bio",
+            "hashtags": hashtags,
+            "note": FALLBACK_NOTE,
+        }
+    
+    def research(self, user_input: Any, results: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        topic = self._topic(user_input)
+        # Search results (if any) are real data - surface their headlines as trends
+        trends = [r.get("title") for r in (results or []) if r.get("title")][:5] or [
+            "Short-form video drives discovery",
+            "Audiences reward authenticity over polish",
+            "Creator partnerships outperform display ads",
+        ]
+        output = {
+            "trends": trends,
+            "audience_insights": f"People interested in {topic} research on social media and trust peer reviews",
+            "competitive_landscape": "Competitors compete on price and reach; differentiation comes from brand voice and community",
+            "opportunities": [
+                "Build a creator program around early adopters",
+                "Publish educational short-form content",
+                "Use user-generated content as social proof",
+            ],
+            "note": FALLBACK_NOTE,
+        }
+        if results:
+            output["sources"] = results[:3]
+        return output
+    
+    def influencers(self, user_input: Any, results: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        topic = self._topic(user_input)
+        defaults = self.media_planner._get_default_influencers() if self.media_planner is not None else []
+        influencers = [
+            {
+                "name": f"{default.get('name', 'Creator')} {default.get('handle', '')}".strip(),
+                "platform": default.get("platform", "instagram").capitalize(),
+                "followers": default.get("followers", "Unknown"),
+                "niche": default.get("niche", "Lifestyle"),
+                "engagement_rate": "Unknown",
+                "fit_reason": default.get("why_recommended", f"Audience overlaps with {topic}"),
+                "content_style": "Short-form video and lifestyle posts",
+                "profile_url": f"https://{default.get('platform', 'instagram')}.com/{default.get('handle', '').lstrip('@')}",
+            }
+            for default in defaults
+        ]
+        output = {
+            "influencers": influencers,
+            "search_method": "Template",
+            "type": "influencer_list",
+            "note": FALLBACK_NOTE,
+        }
+        if results:
+            output["sources"] = results[:3]
+        return output
+    
+    def location_trends(self, location: str) -> Dict[str, Any]:
+        return {
+            "demographics": {
+                "population": "Data unavailable",
+                "median_age": "Data unavailable",
+                "income_level": "Data unavailable",
+                "urban_rural": "Mixed"
+            },
+            "trending_topics": [
+                {"name": "Local events", "volume": "Medium"},
+                {"name": "Community interests", "volume": "High"}
+            ],
+            "consumer_behavior": "Local consumer patterns vary. Consider conducting targeted research for specific insights.",
+            "opportunities": [
+                f"Target local communities in {location} with personalized campaigns",
+                "Leverage regional cultural events",
+                "Partner with local influencers"
+            ],
+            "note": FALLBACK_NOTE,
+        }
@@ -59,7 +59,7 @@ function CreateWorkflowPage() {
       const data = await response.json();
       if (data.success) {
         if (isThumbnail) {
-          setFormData(prev => ({ ...prev, thumbnail: data.url }));
+          setFormData(prev => ({ ...prev, thumbnail: data.medium_url || data.url }));
         } else {
           setFormData(prev => ({ 
             ...prev, 